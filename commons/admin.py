@@ -1,3 +1,7 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import RequestMetricsSample, SyncAlias, SyncTombstone
+
+admin.site.register(RequestMetricsSample)
+admin.site.register(SyncTombstone)
+admin.site.register(SyncAlias)
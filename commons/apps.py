@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CommonsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'commons'
+
+    def ready(self):
+        # Connect the signal handlers that tune and time new database connections
+        from . import signals  # noqa: F401
+        # Register the system checks for the shared cache
+        from . import checks  # noqa: F401
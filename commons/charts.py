@@ -0,0 +1,82 @@
+"""
+Helpers for rendering plotly charts that are shared among the apps.
+Figures are serialized to JSON and drawn in the browser by plotly.js, which
+is served once as a static file (see finders.py and
+commons/plotly_chart.html). Nothing is written to disk.
+
+Charts are cached by ETag. Each user has a data version for each kind of
+data a chart is built from (sets, daily weights, logged food). The apps'
+signal handlers bump the version whenever that data changes, so a chart's
+ETag only changes when its data does:
+- browsers that send a matching If-None-Match get a 304 without any work
+- otherwise the chart is fetched from the cache backend, and only built if
+  it isn't there
+The versions and charts are in the default cache, which every worker
+process must share (see CACHES in settings.py). Otherwise a write handled
+by one worker wouldn't change the ETags that the others serve.
+"""
+import hashlib
+import uuid
+
+import plotly.io as pio
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+
+# Kinds of user data that charts are built from
+SETS = "sets"
+WEIGHTS = "weights"
+FOOD = "food"
+
+# How long a built chart stays in the cache backend (seconds). Charts are
+#  never served stale, since their key changes with the data version.
+CHART_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Characters that could end a <script> tag early, escaped the same way as
+#  Django's json_script filter.
+_SCRIPT_ESCAPES = {
+    ord(">"): "\\u003E",
+    ord("<"): "\\u003C",
+    ord("&"): "\\u0026",
+}
+
+
+def figure_to_json(fig):
+    """Serialize a plotly figure to JSON that's safe to put inside a <script> tag."""
+    return mark_safe(pio.to_json(fig, validate=False).translate(_SCRIPT_ESCAPES))
+
+
+def get_data_version(user_id, data_name):
+    """
+    Get the version of this user's data (SETS, WEIGHTS, or FOOD).
+    If the cache doesn't have one (ex: it was evicted), start a new one.
+    """
+    key = f"data_version:{user_id}:{data_name}"
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_data_version(user_id, data_name):
+    """Give this user's data a new version, so charts built from it are rebuilt."""
+    cache.set(f"data_version:{user_id}:{data_name}", uuid.uuid4().hex, timeout=None)
+
+
+def chart_etag(user_id, kind, *parts):
+    """
+    Get the ETag of a chart, given the user, the kind of chart, and anything
+    else the chart depends on (ex: the exercise and data versions).
+    """
+    key = ":".join(str(part) for part in (user_id, kind, *parts))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def get_cached_chart(etag, build):
+    """
+    Get the chart cached under this ETag. If it isn't cached, call build()
+    and cache what it returns.
+    """
+    return cache.get_or_set(f"chart:{etag}", build, timeout=CHART_CACHE_TIMEOUT)
@@ -0,0 +1,29 @@
+"""
+System checks for the settings that the apps depend on.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+# Cache backends that each process keeps to itself
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The reference data and chart ETags are versioned in the default cache
+    (see registry.py and charts.py), so it must be shared by every process.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f"The default cache ({backend}) isn't shared between processes.",
+        hint="With more than one worker, changes made through one worker won't be seen by "
+             "the others (stale reference data and charts). Set REDIS_URL or CACHE_DIR.",
+        id="commons.W001",
+    )]
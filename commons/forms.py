@@ -0,0 +1,68 @@
+"""
+Form fields that are shared among the apps.
+"""
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+
+
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    """Iterate over the choices of a ReferenceChoiceField without a query."""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for instance in self.field.reference.get().all:
+            yield self.choice(instance)
+
+    def __len__(self):
+        return len(self.field.reference.get().all) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or len(self.field.reference.get().all) > 0
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """
+    A ModelChoiceField whose choices come from a ReferenceData Table (see
+    commons/registry.py) instead of a query. Rendering and validating the
+    field don't touch the database once the reference data is loaded.
+    """
+    iterator = ReferenceChoiceIterator
+
+    def __init__(self, reference, model, **kwargs):
+        self.reference = reference
+        super().__init__(queryset=model.objects.none(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            value = value.pk
+        try:
+            instance = self.reference.get().by_id.get(int(value))
+        except (TypeError, ValueError):
+            instance = None
+        if instance is None:
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+        return instance
+
+
+class ReferenceModelForm(forms.ModelForm):
+    """
+    A ModelForm with ReferenceChoiceFields (or other ModelChoiceFields).
+    Their values have already been checked against the reference data (or
+    loaded from their querysets), so the model doesn't check that they exist
+    again (a query per field, per form).
+    """
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        exclude.update(
+            name for name, field in self.fields.items() if isinstance(field, forms.ModelChoiceField)
+        )
+        return exclude
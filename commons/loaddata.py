@@ -0,0 +1,128 @@
+"""
+Synthetic data for load testing and benchmarks: users with months or years
+of logged sets, food, and weights, and some routines.
+Sets use the exercises seeded by the Workout Log's migrations (see
+workout_log/constants.py), and food is logged with the food items and units
+seeded by the Nutrition Log's initial data migration.
+Rows are inserted in bulk, so signals aren't sent. Instead, the derived data
+that the signals would maintain (daily nutrition summaries) is rebuilt, and
+the user's data versions are bumped so their charts and recent foods
+aren't cached.
+"""
+import datetime
+import random
+import re
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from nutrition_log.models import DailyWeight, FoodItem, Goals, LoggedFoodItem, Unit
+from nutrition_log.stats import rebuild_daily_summaries
+from workout_designer.views import create_routines
+from workout_log.models import Exercise, Set
+from .charts import FOOD, SETS, WEIGHTS, bump_data_version
+
+
+# Range of quantities to log for each of the initial data's food items
+# (their units are grams)
+QUANTITIES = {
+    "Protein": (20, 60),
+    "Carbohydrates": (30, 120),
+    "Fats": (5, 30),
+}
+
+
+def generate_user(username, days=365, workout_every=2, exercises_per_workout=5,
+                  sets_per_exercise=3, food_per_day=5, routines=0, rng=None):
+    """
+    Create a user with this many days of data, up to today:
+    - a workout every workout_every days: exercises_per_workout exercises,
+      sets_per_exercise sets each
+    - their weight, every day
+    - food_per_day logged food items a day
+    - their target calories
+    - routines planned by the Workout Designer
+    Return the user.
+    """
+    rng = rng or random.Random()
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days=i) for i in range(days)][::-1]
+
+    with transaction.atomic():
+        user = User.objects.create_user(username, password="password")
+
+        exercises = list(Exercise.objects.filter(created_by=None).order_by("id"))
+        sets = []
+        for date in dates[::workout_every]:
+            index = 0
+            for exercise in rng.sample(exercises, min(exercises_per_workout, len(exercises))):
+                weight = rng.randrange(20, 300, 5)
+                for _ in range(sets_per_exercise):
+                    sets.append(Set(date=date, exercise=exercise, reps=rng.randrange(5, 13),
+                                    weight=weight, logged_by=user, index=index))
+                    index += 1
+        Set.objects.bulk_create(sets, batch_size=500)
+
+        weight = rng.uniform(140, 220)
+        daily_weights = []
+        for date in dates:
+            weight += rng.uniform(-0.5, 0.5)
+            daily_weights.append(DailyWeight(date=date, weight=round(weight, 1), user=user))
+        DailyWeight.objects.bulk_create(daily_weights, batch_size=500)
+
+        units = list(get_units())
+        logged_food_items = []
+        for date in dates:
+            for meal in range(food_per_day):
+                unit = rng.choice(units)
+                low, high = QUANTITIES.get(unit.food_item.name, (1, 4))
+                logged_food_items.append(LoggedFoodItem(
+                    date=date, food_item=unit.food_item, quantity=rng.randrange(low, high + 1),
+                    unit=unit, meal=meal, user=user,
+                ))
+        LoggedFoodItem.objects.bulk_create(logged_food_items, batch_size=500)
+
+        Goals.objects.create(user=user, target_calories=rng.randrange(1800, 3200, 100))
+        rebuild_daily_summaries(user)
+        for data_name in (SETS, WEIGHTS, FOOD):
+            bump_data_version(user.id, data_name)
+
+    if routines:
+        create_routines([user], routines, rng.choice(["sync", "async"]), 75, 45, "Anything",
+                        rng.choice(["muscle", "fit"]))
+    return user
+
+
+def get_units():
+    """
+    Get the units of the initial data's food items. If they've been deleted,
+    create a food item and unit to log instead.
+    """
+    units = Unit.objects.filter(user=None, food_item__user=None).select_related("food_item")
+    if units.exists():
+        return units
+    food_item = FoodItem.objects.create(name="Meal", producer="")
+    Unit.objects.create(name="serving", calsPerUnit=500, proPerUnit=30, carbsPerUnit=50,
+                        fatsPerUnit=15, food_item=food_item)
+    return units.all()
+
+
+def generate_load_data(num_users, prefix="load", seed=None, **options):
+    """
+    Create num_users users named <prefix>0, <prefix>1, ... with generated data
+    (see generate_user for the options). The same seed creates the same data.
+    Return the users.
+    """
+    rng = random.Random(seed)
+    return [generate_user(f"{prefix}{i}", rng=rng, **options) for i in range(num_users)]
+
+
+def delete_load_data(prefix="load"):
+    """
+    Delete the users created by generate_load_data with this prefix (named
+    <prefix><number>), and all their data. Return how many users were deleted.
+    """
+    users = User.objects.filter(username__regex=rf"^{re.escape(prefix)}[0-9]+$")
+    count = users.count()
+    users.delete()
+    return count
@@ -0,0 +1,101 @@
+"""
+Dump the request metrics histograms that the web processes have flushed
+(see commons/metrics.py). For each view, prints the number of requests and,
+for each metric, its mean, approximate p50/p95/p99 (the upper bound of the
+bucket they fall in), and the histogram itself.
+Usage:
+    python manage.py dump_request_metrics
+    python manage.py dump_request_metrics --view workout_log:journal --json
+    python manage.py dump_request_metrics --clear
+"""
+import json
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from commons.metrics import HISTOGRAM_BUCKETS
+from commons.models import RequestMetricsSample
+
+
+class Command(BaseCommand):
+    help = "Dump the request metrics histograms of every view"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--view", help="Only dump this view (ex: workout_log:journal)")
+        parser.add_argument("--json", action="store_true", help="Dump as JSON")
+        parser.add_argument("--clear", action="store_true",
+                            help="Delete the saved histograms after dumping them")
+
+    def handle(self, *args, **options):
+        samples = RequestMetricsSample.objects.all()
+        if options["view"]:
+            samples = samples.filter(view_name=options["view"])
+        rows = (samples.values("view_name", "metric", "bucket")
+                .annotate(count=Sum("count"), total=Sum("total"))
+                .order_by("view_name", "metric"))
+
+        # view name -> metric -> {bucket: [count, total]}
+        views = dict()
+        for row in rows:
+            metrics = views.setdefault(row["view_name"], dict())
+            metrics.setdefault(row["metric"], dict())[row["bucket"]] = [row["count"], row["total"]]
+        report = {view_name: summarize_view(metrics) for view_name, metrics in views.items()}
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_report(report)
+
+        if options["clear"]:
+            samples.delete()
+
+    def write_report(self, report):
+        if not report:
+            self.stdout.write("No request metrics have been saved yet.")
+        # Most requested views first
+        for view_name, summary in sorted(report.items(), key=lambda item: -item[1]["requests"]):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{view_name}: {summary['requests']} requests"))
+            for metric, stats in summary["metrics"].items():
+                histogram = "  ".join(f"{label}:{count}" for label, count in stats["histogram"].items())
+                self.stdout.write(f"  {metric:<12} mean {stats['mean']:.1f}  p50 {stats['p50']}  "
+                                  f"p95 {stats['p95']}  p99 {stats['p99']}")
+                self.stdout.write(f"  {'':<12} {histogram}")
+
+
+def summarize_view(metrics):
+    """
+    Summarize a view's histograms.
+    - metrics: metric -> {bucket: [count, total]}
+    """
+    summary = {"requests": 0, "metrics": dict()}
+    for metric, buckets in metrics.items():
+        bounds = [bound for bound in HISTOGRAM_BUCKETS.get(metric, ()) if bound in buckets]
+        if None in buckets:
+            bounds.append(None)
+        counts = [buckets[bound][0] for bound in bounds]
+        requests = sum(counts)
+        summary["requests"] = max(summary["requests"], requests)
+        summary["metrics"][metric] = {
+            "mean": sum(total for _, total in buckets.values()) / requests if requests else 0,
+            "p50": get_percentile(bounds, counts, 0.5),
+            "p95": get_percentile(bounds, counts, 0.95),
+            "p99": get_percentile(bounds, counts, 0.99),
+            "histogram": {get_label(bound): count for bound, count in zip(bounds, counts)},
+        }
+    return summary
+
+
+def get_percentile(bounds, counts, fraction):
+    """Get the label of the bucket that this fraction of the requests are at or below."""
+    target = fraction * sum(counts)
+    seen = 0
+    for bound, count in zip(bounds, counts):
+        seen += count
+        if seen >= target:
+            return get_label(bound)
+    return get_label(bounds[-1]) if bounds else "-"
+
+
+def get_label(bound):
+    """Label a bucket by its upper bound (ex: <=50), or as overflow."""
+    return "overflow" if bound is None else f"<={bound:g}"
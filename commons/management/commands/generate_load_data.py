@@ -0,0 +1,61 @@
+"""
+Generate synthetic users with logged sets, food, weights, and routines, for
+load testing (see commons/loaddata.py). Users are named <prefix>0,
+<prefix>1, ... and all have the password "password".
+Usage:
+    python manage.py generate_load_data --users 10 --days 730
+    python manage.py generate_load_data --users 50 --days 365 --routines 3 --seed 1
+    python manage.py generate_load_data --delete
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from commons.loaddata import delete_load_data, generate_load_data
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users and data for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1, help="Users to generate")
+        parser.add_argument("--days", type=int, default=365, help="Days of data per user")
+        parser.add_argument("--workout-every", type=int, default=2,
+                            help="Days between workouts")
+        parser.add_argument("--exercises", type=int, default=5, help="Exercises per workout")
+        parser.add_argument("--sets", type=int, default=3, help="Sets per exercise")
+        parser.add_argument("--food", type=int, default=5, help="Logged food items per day")
+        parser.add_argument("--routines", type=int, default=0, help="Routines per user")
+        parser.add_argument("--prefix", default="load", help="Start of the users' names")
+        parser.add_argument("--seed", type=int, help="Random seed, to generate the same data again")
+        parser.add_argument("--delete", action="store_true",
+                            help="Delete the users with this prefix (and their data) instead")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if options["delete"]:
+            count = delete_load_data(prefix)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {count} users"))
+            return
+
+        if User.objects.filter(username__in=[f"{prefix}{i}" for i in range(options["users"])]).exists():
+            raise CommandError(f"Users named {prefix}<number> already exist. "
+                               f"Delete them with --delete, or use another --prefix.")
+
+        start = time.perf_counter()
+        users = generate_load_data(
+            options["users"],
+            prefix=prefix,
+            seed=options["seed"],
+            days=options["days"],
+            workout_every=options["workout_every"],
+            exercises_per_workout=options["exercises"],
+            sets_per_exercise=options["sets"],
+            food_per_day=options["food"],
+            routines=options["routines"],
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(users)} users with {options['days']} days of data in {elapsed:.1f} s"
+        ))
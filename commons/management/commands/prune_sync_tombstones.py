@@ -0,0 +1,19 @@
+"""
+Delete the sync tombstones that are older than any device's token can be
+(see commons/sync.py). Each sync already prunes its own user's tombstones;
+this also prunes those of users who stopped syncing. Run it daily (ex: from
+cron).
+Usage:
+    python manage.py prune_sync_tombstones
+"""
+from django.core.management.base import BaseCommand
+
+from commons.sync import SYNC_TOMBSTONE_DAYS, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = f"Delete sync tombstones older than {SYNC_TOMBSTONE_DAYS} days"
+
+    def handle(self, *args, **options):
+        count = prune_tombstones()
+        self.stdout.write(f"Deleted {count} sync tombstones")
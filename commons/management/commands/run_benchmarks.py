@@ -0,0 +1,205 @@
+"""
+Time the views and core functions at several data scales, and write a JSON
+report that can be compared across commits.
+For each scale, a user with that many days of data is generated (see
+commons/loaddata.py). Each benchmark runs once cold, then --repeat more
+times. Everything runs in a transaction that's rolled back at the end, so
+nothing is saved.
+Usage:
+    python manage.py run_benchmarks
+    python manage.py run_benchmarks --scales 30 365 1095 --repeat 10 --output after.json
+    python manage.py run_benchmarks --only view:workout_log:journal calculate_volume --compare before.json
+"""
+import datetime
+import json
+import platform
+import random
+from statistics import mean, median
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from commons.loaddata import generate_user
+from nutrition_log.views import get_logged_food_items_stats
+from workout_designer.models import Routine
+from workout_designer.views import create_routine
+from workout_log.models import Set
+from workout_log.views import calculate_volume, get_journal_page
+
+
+class Command(BaseCommand):
+    help = "Time the views and core functions at several data scales"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", type=int, nargs="+", default=[30, 365, 1095],
+                            help="Days of data to generate for each scale")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Times to run each benchmark (after a cold run)")
+        parser.add_argument("--only", nargs="+", help="Only run benchmarks with these names")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated data")
+        parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+        parser.add_argument("--compare", help="Compare against a report from an earlier run")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        report = {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": get_commit(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "repeat": options["repeat"],
+            "scales": [],
+        }
+        with override_settings(ALLOWED_HOSTS=["localhost"], REQUEST_METRICS_FLUSH_SECONDS=float("inf")):
+            with transaction.atomic():
+                for days in options["scales"]:
+                    self.stderr.write(f"Benchmarking {days} days of data...")
+                    report["scales"].append(run_scale(days, options))
+                transaction.set_rollback(True)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.write_comparison(json.load(f), report)
+
+    def write_comparison(self, old, new):
+        """Write how each benchmark's median time changed since the old report."""
+        old_scales = {scale["days"]: scale["benchmarks"] for scale in old["scales"]}
+        self.stderr.write(f"Compared to {old.get('commit') or old['created']}:")
+        for scale in new["scales"]:
+            old_benchmarks = old_scales.get(scale["days"], {})
+            for name, stats in scale["benchmarks"].items():
+                if name not in old_benchmarks:
+                    continue
+                before = old_benchmarks[name]["median_ms"]
+                after = stats["median_ms"]
+                change = (after - before) / before * 100 if before else 0
+                style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else str
+                self.stderr.write(style(f"  {scale['days']:>5} days  {name:<40} "
+                                        f"{before:8.2f} -> {after:8.2f} ms ({change:+.0f}%)"))
+
+
+def run_scale(days, options):
+    """Generate a user with this many days of data, and run every benchmark on them."""
+    user = generate_user(f"__benchmark{days}", days=days, routines=3,
+                         rng=random.Random(options["seed"]))
+    client = Client(HTTP_HOST="localhost")
+    client.force_login(user)
+    request = RequestFactory().get("/")
+    request.user = user
+
+    sets = Set.objects.filter(logged_by=user)
+    rows = {
+        "sets": sets.count(),
+        "logged_food_items": user.loggedfooditem_set.count(),
+        "daily_weights": user.dailyweight_set.count(),
+        "routines": Routine.objects.filter(user=user).count(),
+    }
+    benchmarks = dict()
+    for name, run in get_benchmarks(client, request, user):
+        if options["only"] and name not in options["only"]:
+            continue
+        benchmarks[name] = time_benchmark(run, options["repeat"])
+    return {"days": days, "rows": rows, "benchmarks": benchmarks}
+
+
+def get_benchmarks(client, request, user):
+    """
+    Get the benchmarks to run for this user, as a list of (name, function)
+    pairs. Views are requested with the test client, so the middleware and
+    templates are timed too.
+    """
+    today = datetime.date.today()
+    first_date = Set.objects.filter(logged_by=user).earliest("date").date
+    last_set = Set.objects.filter(logged_by=user).latest("date", "index")
+    routine = Routine.objects.filter(user=user).latest("id")
+
+    def get(url):
+        return lambda: check(client.get(url))
+
+    def post(url, data):
+        return lambda: check(client.post(url, data))
+
+    return [
+        ("view:commons:index", get(reverse("commons:index"))),
+        ("view:workout_log:index", get(reverse("workout_log:index") + f"?selectedDate={last_set.date}")),
+        ("view:workout_log:journal", get(reverse("workout_log:journal"))),
+        ("view:workout_log:volume", post(reverse("workout_log:volume"),
+                                         {"start_date": first_date, "end_date": today})),
+        ("view:workout_log:charts", get(reverse("workout_log:charts"))),
+        ("view:workout_log:charts_data", get(reverse("workout_log:charts_data",
+                                                     args=[user.id, last_set.exercise_id]))),
+        ("view:nutrition_log:index", get(reverse("nutrition_log:index"))),
+        ("view:nutrition_log:daily", get(reverse("nutrition_log:daily"))),
+        ("view:nutrition_log:weekly", get(reverse("nutrition_log:weekly")
+                                          + f"?startDate={first_date}&endDate={today}")),
+        ("view:nutrition_log:create_calories_chart", get(reverse("nutrition_log:create_calories_chart"))),
+        ("view:nutrition_log:create_weight_chart", get(reverse("nutrition_log:create_weight_chart"))),
+        ("view:workout_designer:index", get(reverse("workout_designer:index"))),
+        ("view:workout_designer:routine", get(reverse("workout_designer:routine", args=[routine.id]))),
+        ("calculate_volume", lambda: calculate_volume(user, first_date, today)),
+        ("get_logged_food_items_stats", lambda: get_logged_food_items_stats(request, today)),
+        ("get_journal_page", lambda: get_journal_page(user)),
+        ("create_routine", lambda: create_routine(request, "sync", 75, 45, "Anything", "muscle")),
+    ]
+
+
+def check(response):
+    """Make sure a benchmarked view worked."""
+    if response.status_code != 200:
+        raise CommandError(f"{response.request['PATH_INFO']} returned {response.status_code}")
+    return response
+
+
+def time_benchmark(run, repeat):
+    """
+    Run a benchmark once cold, then repeat times. Return its stats: times in
+    ms, and how many queries a warm run makes.
+    """
+    start = time.perf_counter()
+    run()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Logging queries slows them down, so they're counted in a separate run
+    with CaptureQueriesContext(connection) as queries:
+        run()
+    return {
+        "cold_ms": round(cold_ms, 3),
+        "median_ms": round(median(timings), 3),
+        "mean_ms": round(mean(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "queries": len(queries),
+    }
+
+
+def get_commit():
+    """Get the git commit that's checked out, or None if it can't be found."""
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
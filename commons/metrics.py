@@ -0,0 +1,191 @@
+"""
+Per-request metrics: how many database queries a request made, how long they
+took, how long its templates took to render, and how long the whole request
+took. RequestMetricsMiddleware (see middleware.py) measures every request.
+
+Measuring is cheap enough to leave on in production:
+- Queries are timed by a database execute wrapper, installed on every new
+  connection (see signals.py). DEBUG's query log isn't needed.
+- Templates are timed by the TimedDjangoTemplates template backend.
+- The metrics of each request go into histograms (one per view and metric),
+  kept in memory and flushed to the database (one insert) every
+  settings.REQUEST_METRICS_FLUSH_SECONDS. Dump them with
+  `python manage.py dump_request_metrics`. Under ASGI, the flush runs in a
+  thread (the ORM can't run on the event loop). A flush that fails is
+  logged, and its counts are kept for the next one, so it never fails the
+  request.
+
+Database time is part of template time when a template runs a query (ex: a
+queryset that's only evaluated in the template), and both are part of the
+total time.
+"""
+from contextvars import ContextVar
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.template.backends.django import DjangoTemplates, Template
+
+
+# Upper bounds of the histogram buckets for each metric. Values above the
+# last bound go in an overflow bucket.
+TIME_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+HISTOGRAM_BUCKETS = {
+    "total_ms": TIME_BUCKETS_MS,
+    "db_ms": TIME_BUCKETS_MS,
+    "template_ms": TIME_BUCKETS_MS,
+    "queries": (1, 2, 5, 10, 20, 50, 100, 200, 500),
+}
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the request that's being handled, or None
+current_metrics = ContextVar("current_metrics", default=None)
+
+
+class RequestMetrics:
+    """The metrics of one request. Times are in ms."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0
+        self.template_ms = 0
+        self.total_ms = 0
+
+    def finish(self):
+        """Stop the clock on the request."""
+        self.total_ms = (time.perf_counter() - self.start) * 1000
+
+    def values(self):
+        """Get a dictionary that maps the name of each metric to its value."""
+        return {
+            "total_ms": self.total_ms,
+            "db_ms": self.db_ms,
+            "template_ms": self.template_ms,
+            "queries": self.queries,
+        }
+
+    def server_timing(self):
+        """Get the metrics as the value of a Server-Timing header."""
+        return (f'total;dur={self.total_ms:.1f}, '
+                f'db;dur={self.db_ms:.1f};desc="{self.queries} queries", '
+                f'template;dur={self.template_ms:.1f}')
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper: time the query, and add it to the current
+    request's metrics (if there's a request).
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_ms += (time.perf_counter() - start) * 1000
+        metrics.queries += 1
+
+
+class TimedTemplate(Template):
+    """A Django template that adds its render time to the current request's metrics."""
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_ms += (time.perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with render times recorded in the request
+    metrics. Only templates that are rendered directly (ex: with render())
+    are timed. Included templates are part of their parent's time.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def get_bucket(metric, value):
+    """Get the upper bound of the histogram bucket for this value, or None if it overflows."""
+    for bound in HISTOGRAM_BUCKETS[metric]:
+        if value <= bound:
+            return bound
+    return None
+
+
+class Histograms:
+    """
+    Histograms of request metrics, kept in this process's memory until
+    they're flushed to the database.
+    - counts: (view name, metric, bucket) -> [number of requests, sum of their values]
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict()
+        self.last_flush = time.monotonic()
+
+    def add(self, view_name, metrics):
+        """
+        Add a request's metrics. If it's time to flush, return the counts to
+        flush (see flush()), otherwise None. Doesn't touch the database.
+        """
+        with self.lock:
+            self.merge(self.counts, {
+                (view_name, metric, get_bucket(metric, value)): (1, value)
+                for metric, value in metrics.values().items()
+            })
+            flush_seconds = getattr(settings, "REQUEST_METRICS_FLUSH_SECONDS", 60)
+            if time.monotonic() - self.last_flush < flush_seconds:
+                return None
+            counts = self.counts
+            self.counts = dict()
+            self.last_flush = time.monotonic()
+        return counts
+
+    def flush(self, counts):
+        """
+        Save the counts returned by add(). If saving fails, log it and put
+        the counts back, so they're saved by the next flush.
+        """
+        try:
+            with transaction.atomic():
+                self.save(counts)
+        except Exception:
+            logger.exception("Couldn't save the request metrics, keeping them for the next flush")
+            with self.lock:
+                self.merge(self.counts, counts)
+
+    @staticmethod
+    def merge(counts, new_counts):
+        """Add new_counts to counts (both map keys to [number of requests, sum of values])."""
+        for key, (number, total) in new_counts.items():
+            count = counts.setdefault(key, [0, 0])
+            count[0] += number
+            count[1] += total
+
+    def save(self, counts):
+        """Save histogram counts to the database (one insert)."""
+        from .models import RequestMetricsSample
+        RequestMetricsSample.objects.bulk_create([
+            RequestMetricsSample(view_name=view_name, metric=metric, bucket=bucket,
+                                 count=count, total=total)
+            for (view_name, metric, bucket), (count, total) in counts.items()
+        ])
+
+
+histograms = Histograms()
@@ -0,0 +1,106 @@
+"""
+Middleware that is shared among the apps.
+"""
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .metrics import RequestMetrics, current_metrics, histograms
+from .registry import versions_checked_once
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure every request (see metrics.py):
+    - add a Server-Timing header with its total, database, and template
+      times, and number of queries
+    - log it if it's slower than settings.REQUEST_METRICS_SLOW_MS, or makes
+      more than settings.REQUEST_METRICS_MAX_QUERIES queries
+    - add it to its view's histograms
+    Put it first in MIDDLEWARE, so the other middleware is measured too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        counts = self.finish(request, response, metrics)
+        if counts is not None:
+            histograms.flush(counts)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        counts = self.finish(request, response, metrics)
+        if counts is not None:
+            # Saving uses the ORM, which can't run on the event loop
+            await sync_to_async(histograms.flush)(counts)
+        return response
+
+    def finish(self, request, response, metrics):
+        """
+        Report the metrics of a finished request. Return the histogram
+        counts to flush, if it's time to (see metrics.Histograms).
+        """
+        metrics.finish()
+        if getattr(settings, "REQUEST_METRICS_SERVER_TIMING", True):
+            response["Server-Timing"] = metrics.server_timing()
+
+        view_name = "<unresolved>"
+        if request.resolver_match is not None:
+            view_name = request.resolver_match.view_name
+
+        slow_ms = getattr(settings, "REQUEST_METRICS_SLOW_MS", 500)
+        max_queries = getattr(settings, "REQUEST_METRICS_MAX_QUERIES", 50)
+        if metrics.total_ms > slow_ms or metrics.queries > max_queries:
+            logger.warning(
+                "Slow request: %s %s (%s) took %.1f ms, %d queries in %.1f ms, templates %.1f ms",
+                request.method, request.path, view_name, metrics.total_ms,
+                metrics.queries, metrics.db_ms, metrics.template_ms,
+            )
+        return histograms.add(view_name, metrics)
+
+
+class ReferenceDataMiddleware:
+    """
+    Read each reference data version at most once per request, instead of
+    on every access (see registry.py).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with versions_checked_once():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with versions_checked_once():
+            return await self.get_response(request)
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestMetricsSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=200)),
+                ('metric', models.CharField(max_length=20)),
+                ('bucket', models.FloatField(null=True)),
+                ('count', models.IntegerField()),
+                ('total', models.FloatField()),
+                ('flushed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
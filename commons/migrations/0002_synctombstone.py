@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+                ('type', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('client_id', models.UUIDField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'deleted_at'], name='synctombstone_user_deleted_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0002_synctombstone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['user_id', 'type', 'client_id'], name='synctombstone_user_client_idx'),
+        ),
+    ]
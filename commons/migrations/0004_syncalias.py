@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-18 21:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commons', '0003_synctombstone_client_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+                ('type', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('client_id', models.UUIDField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='syncalias',
+            constraint=models.UniqueConstraint(fields=('user_id', 'type', 'client_id'), name='syncalias_user_client_unique'),
+        ),
+    ]
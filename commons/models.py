@@ -1,3 +1,71 @@
 from django.db import models
 
-# Create your models here.
+
+class RequestMetricsSample(models.Model):
+    """
+    Part of a request metrics histogram, flushed by one process (see
+    metrics.py): how many requests to a view had a metric (ex: number of
+    queries) fall in one bucket, since the process last flushed.
+    Dump the histograms with `python manage.py dump_request_metrics`.
+    """
+    view_name = models.CharField(max_length=200)
+    metric = models.CharField(max_length=20)
+    # Upper bound of the bucket, or null for values above the last bound
+    bucket = models.FloatField(null=True)
+    count = models.IntegerField()
+    # Sum of the values in this bucket
+    total = models.FloatField()
+    flushed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.view_name} | {self.metric} <= {self.bucket} | {self.count}"
+
+
+class SyncTombstone(models.Model):
+    """
+    A record that a user's set, logged food item, or daily weight was
+    deleted, so devices that sync can delete it too (see sync.py).
+    user_id isn't a foreign key: deleting a user deletes their data, and
+    nothing needs to remember that.
+    Tombstones are pruned once they're older than devices' tokens can be
+    (see prune_tombstones in sync.py).
+    """
+    user_id = models.IntegerField()
+    # Key of the model's sync type, ex: "set"
+    type = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    client_id = models.UUIDField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_id", "deleted_at"], name="synctombstone_user_deleted_idx"),
+            # Creates check that their client_id wasn't deleted (see sync.is_deleted)
+            models.Index(fields=["user_id", "type", "client_id"], name="synctombstone_user_client_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} | {self.type} {self.object_id} | deleted {self.deleted_at}"
+
+
+class SyncAlias(models.Model):
+    """
+    Another client_id for a user's synced object. When a device creates a
+    daily weight for a day that already has one, the existing weight is
+    updated instead, and keeps its own client_id (see sync.py). The device's
+    client_id is recorded here, so its later updates, deletes, and resent
+    creates still find the weight.
+    """
+    user_id = models.IntegerField()
+    # Key of the model's sync type, ex: "daily_weight"
+    type = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    client_id = models.UUIDField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "type", "client_id"], name="syncalias_user_client_unique"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} | {self.type} {self.object_id} | {self.client_id}"
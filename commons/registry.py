@@ -0,0 +1,112 @@
+"""
+Registry for reference data that is shared among the apps: tables like
+exercises and muscles that users read constantly but that rarely
+change.
+
+Each piece of reference data is loaded lazily, the first time it's needed,
+and kept in memory for the life of the process. A version token for it is
+stored in the cache backend. When the data changes, the owning app's signal
+handlers call invalidate(), which replaces the token. Every process sees the
+new token on its next access and reloads. That only works if the processes
+share the cache backend, so settings.CACHES uses a shared one (the file
+cache, or Redis), and a system check warns about a per-process one (see
+checks.py).
+
+Reading the token is a round trip to the cache backend, and a page can use
+the same data many times (ex: a form's choices, or a day type per row). So
+during a request (see middleware.ReferenceDataMiddleware), each token is
+only read once, and the rest of the request uses that version. Outside of
+a request (ex: management commands), every access reads the token.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+import uuid
+
+from django.core.cache import cache
+
+
+# Version tokens read during the current request: cache key -> token, or
+# None outside of a request (see versions_checked_once)
+_request_versions = ContextVar("reference_data_versions", default=None)
+
+# A table of model instances:
+# - by_id: dictionary that maps ids to instances
+# - all: tuple of every instance, in the order they were loaded
+Table = namedtuple("Table", ["by_id", "all"])
+
+
+def load_table(queryset):
+    """Load a queryset into a Table (one query)."""
+    instances = tuple(queryset)
+    return Table({instance.pk: instance for instance in instances}, instances)
+
+
+@contextmanager
+def versions_checked_once():
+    """
+    Read each reference data version token at most once in this block (ex:
+    a request). Changes made through invalidate() in the block are still
+    seen right away.
+    """
+    token = _request_versions.set(dict())
+    try:
+        yield
+    finally:
+        _request_versions.reset(token)
+
+
+class ReferenceData:
+    """
+    Reference data that's loaded once per process and reloaded whenever its
+    version changes.
+    - name: unique name, used for the version's cache key
+    - load: function with no arguments that loads the data from the database
+    Loading is lazy, so defining a ReferenceData never touches the database.
+    """
+
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.version_key = f"reference_data:{name}:version"
+        # (version, data) that this process has loaded, or None
+        self._loaded = None
+
+    def __repr__(self):
+        return f"<ReferenceData: {self.name}>"
+
+    def get(self):
+        """Get the data, loading it if this process's copy is out of date."""
+        version = self.get_version()
+        loaded = self._loaded
+        if loaded is None or loaded[0] != version:
+            loaded = (version, self.load())
+            self._loaded = loaded
+        return loaded[1]
+
+    def get_version(self):
+        """
+        Get the current version token of this data.
+        If the cache doesn't have one (ex: it was evicted), start a new one,
+        which makes every process reload.
+        """
+        versions = _request_versions.get()
+        if versions is not None and self.version_key in versions:
+            return versions[self.version_key]
+        version = cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(self.version_key, version, timeout=None):
+                version = cache.get(self.version_key, version)
+        if versions is not None:
+            versions[self.version_key] = version
+        return version
+
+    def invalidate(self):
+        """Give the data a new version, so every process reloads it."""
+        version = uuid.uuid4().hex
+        cache.set(self.version_key, version, timeout=None)
+        versions = _request_versions.get()
+        if versions is not None:
+            versions[self.version_key] = version
+        self._loaded = None
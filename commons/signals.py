@@ -0,0 +1,56 @@
+"""
+Signal handlers that are shared among the apps.
+- Tune every new SQLite connection with the PRAGMAs in
+  settings.SQLITE_PRAGMAS (ex: WAL mode, so reads don't wait on writes).
+- Time the queries of every new connection for the request metrics (see
+  metrics.py).
+- Record a tombstone when a synced object is deleted, so devices that sync
+  delete it too (see sync.py).
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from nutrition_log.models import DailyWeight, LoggedFoodItem
+from workout_log.models import Set
+from .metrics import record_query
+from .models import SyncTombstone
+from .sync import get_sync_type
+
+
+@receiver(connection_created)
+def set_sqlite_pragmas(sender, connection, **kwargs):
+    """Run the SQLite PRAGMAs from settings on a new SQLite connection."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def add_query_timer(sender, connection, **kwargs):
+    """Time every query this connection runs, for the request metrics."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(post_delete, sender=Set)
+@receiver(post_delete, sender=LoggedFoodItem)
+@receiver(post_delete, sender=DailyWeight)
+def record_sync_tombstone(sender, instance, origin=None, **kwargs):
+    """
+    Record that a synced object was deleted. Not when its user is being
+    deleted: nobody's left to sync it.
+    """
+    if isinstance(origin, User) or (isinstance(origin, QuerySet) and origin.model is User):
+        return
+    sync_type = get_sync_type(sender)
+    user_id = getattr(instance, f"{sync_type.user_field}_id")
+    if user_id is None:
+        return
+    SyncTombstone.objects.create(user_id=user_id, type=sync_type.name, object_id=instance.id,
+                                 client_id=instance.client_id)
@@ -0,0 +1,406 @@
+"""
+Offline sync for the logs. A device that logs sets, food, and weights
+while it's offline (ex: in a gym basement) queues its changes
+("mutations"). When it's back online, it sends the whole queue in one
+request (see views.sync). The response has the results of the mutations
+and everything that changed on the server since the device's last sync.
+
+Request (POST, JSON, with the CSRF token in an X-CSRFToken header):
+    {
+        "token": "<token from the last sync, or null>",
+        "mutations": [
+            {"type": "set", "op": "create", "client_id": "<uuid>", "date": "2023-11-01",
+             "data": {"exercise": 12, "reps": 8, "weight": 135}},
+            {"type": "logged_food_item", "op": "update", "id": 40, "data": {"quantity": 2}},
+            {"type": "daily_weight", "op": "delete", "client_id": "<uuid>"},
+            ...
+        ]
+    }
+Response:
+    {
+        "token": "<token to send next time>",
+        "results": [{"status": "applied", "type": "set", "id": 7, "client_id": "<uuid>"}, ...],
+        "changes": {"set": [{"id": 7, "client_id": "<uuid>", "date": ..., ...}, ...], ...},
+        "deleted": {"set": [{"id": 3, "client_id": null}, ...], ...},
+        "reset": false,
+        "tombstone_days": 30
+    }
+
+Mutations are idempotent, so a device can send its queue again if it never
+got the response:
+- Devices give everything they create a client_id (a UUID). A create whose
+  client_id was already created (or deleted) is a duplicate, and does
+  nothing.
+- Updates and deletes find their object by id, or by client_id (so a
+  device can change what it created before it knows the id). Deleting
+  something that's already gone does nothing.
+- Users have one weight per day, so creating a daily weight for a day
+  that already has one updates that weight instead, and the result has
+  its id. It keeps its own client_id (the one in changes), and the new one
+  is recorded as a SyncAlias, so the device's later mutations by its
+  client_id still find the weight.
+Mutations are applied in order, in one transaction. Each one is validated
+with the same form as its page. An invalid one is skipped (its result has
+the errors), without undoing the others. Objects are saved one at a time,
+so the signal handlers keep the daily nutrition summaries and the data
+versions up to date.
+
+Changes are found by each object's updated_at, and deletions by
+SyncTombstone (recorded by signals.py). A token is the time the sync read
+the changes. The next sync also returns what changed a little before it
+(SYNC_TOKEN_OVERLAP), in case a transaction that started before that time
+committed after it. Devices should apply changes by id, so getting one
+twice doesn't matter. The first sync (no token) gets the last
+SYNC_INITIAL_DAYS days of data.
+
+Tombstones are only kept for SYNC_TOMBSTONE_DAYS days (sent to devices as
+"tombstone_days"), then they're pruned: the user's own at each sync, and
+everyone's with `python manage.py prune_sync_tombstones`. A token older
+than that could miss deletions, so it gets a full resync instead, like the
+first sync, with "reset" set to true. The device should then replace the
+data it synced with the changes. Devices that sync at least every
+SYNC_TOMBSTONE_DAYS days never need one.
+"""
+from collections import namedtuple
+import datetime
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.forms.models import model_to_dict
+from django.utils import timezone
+
+from nutrition_log.forms import DailyWeightForm, LogFoodItemForm
+from nutrition_log.models import DailyWeight, LoggedFoodItem
+from workout_log import ordering
+from workout_log.forms import SetForm
+from workout_log.models import Set
+from .models import SyncAlias, SyncTombstone
+
+
+# Most mutations a device can send in one sync
+MAX_SYNC_MUTATIONS = 500
+# How far before its token a sync looks for changes
+SYNC_TOKEN_OVERLAP = datetime.timedelta(seconds=30)
+# Days of data that the first sync gets
+SYNC_INITIAL_DAYS = 30
+# Days that tombstones are kept, and so how old a token can be
+SYNC_TOMBSTONE_DAYS = 30
+
+
+class SyncError(Exception):
+    """A mutation that can't be applied. Its errors are sent back to the device."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def prepare_set(user, set):
+    """Put a new set after the sets already logged on its day."""
+    set.index = ordering.allocate_set_indexes(user, set.date)
+    return set
+
+
+def prepare_logged_food_item(user, logged_food_item):
+    """Log new food items for breakfast, like the Log Food Item page."""
+    logged_food_item.meal = 1
+    return logged_food_item
+
+
+def prepare_daily_weight(user, daily_weight):
+    """
+    Users have one weight per day, so a weight for a day that has one
+    replaces it. If that weight already has a client_id, the new weight's
+    is recorded as an alias of it.
+    """
+    existing = DailyWeight.objects.filter(user=user, date=daily_weight.date).first()
+    if existing is None:
+        return daily_weight
+    existing.weight = daily_weight.weight
+    if existing.client_id is None:
+        existing.client_id = daily_weight.client_id
+    else:
+        SyncAlias.objects.create(user_id=user.id, type="daily_weight", object_id=existing.id,
+                                 client_id=daily_weight.client_id)
+    return existing
+
+
+def delete_object(obj):
+    """Delete an object that doesn't need anything else done when it's deleted."""
+    obj.delete()
+
+
+# A kind of object that can be synced:
+# - name: its key in mutations and responses
+# - model
+# - user_field: name of the model's user foreign key
+# - form: form that validates the data of creates and updates
+# - fields: fields sent to devices (besides id, client_id, date, and updated_at)
+# - prepare: function(user, obj) that finishes a new object before it's
+#   saved, and returns the object to save
+# - delete: function(obj) that deletes an object
+SyncType = namedtuple("SyncType", ["name", "model", "user_field", "form", "fields", "prepare", "delete"])
+
+SYNC_TYPES = {
+    sync_type.name: sync_type for sync_type in [
+        SyncType("set", Set, "logged_by", SetForm, ["exercise", "reps", "weight", "index"],
+                 prepare_set, ordering.delete_set),
+        SyncType("logged_food_item", LoggedFoodItem, "user", LogFoodItemForm,
+                 ["food_item", "unit", "quantity", "meal"], prepare_logged_food_item, delete_object),
+        SyncType("daily_weight", DailyWeight, "user", DailyWeightForm, ["weight"],
+                 prepare_daily_weight, delete_object),
+    ]
+}
+
+
+def get_sync_type(model):
+    """Get the SyncType of a model, or None if it isn't synced."""
+    for sync_type in SYNC_TYPES.values():
+        if sync_type.model is model:
+            return sync_type
+    return None
+
+
+def apply_mutations(user, mutations):
+    """
+    Apply a device's mutations for this user, in order, in one transaction.
+    Return a list of their results.
+    The user is locked first, since the mutations read before they write
+    (see ordering.lock_user).
+    """
+    results = []
+    with transaction.atomic():
+        if mutations:
+            ordering.lock_user(user.id)
+        for mutation in mutations:
+            try:
+                # A mutation that fails is rolled back by itself
+                with transaction.atomic():
+                    status, obj_id = apply_mutation(user, mutation)
+            except SyncError as e:
+                status, obj_id, errors = "error", None, e.errors
+            except IntegrityError:
+                # Ex: another request created the same client_id at the same time
+                status, obj_id, errors = "error", None, "It conflicts with another change"
+            else:
+                errors = None
+            result = {"status": status}
+            if isinstance(mutation, dict):
+                result.update(type=mutation.get("type"), client_id=mutation.get("client_id"),
+                              id=obj_id if obj_id is not None else mutation.get("id"))
+            if errors is not None:
+                result["errors"] = errors
+            results.append(result)
+    return results
+
+
+def apply_mutation(user, mutation):
+    """
+    Apply one mutation. Return its status ("applied" or "duplicate") and the
+    id of its object. Raise SyncError if it can't be applied.
+    """
+    if not isinstance(mutation, dict):
+        raise SyncError("A mutation must be an object")
+    sync_type = SYNC_TYPES.get(str(mutation.get("type")))
+    if sync_type is None:
+        raise SyncError(f"type must be one of: {', '.join(SYNC_TYPES)}")
+    op = mutation.get("op")
+    if op == "create":
+        return create_object(user, sync_type, mutation)
+    if op == "update":
+        return update_object(user, sync_type, mutation)
+    if op == "delete":
+        return delete_synced_object(user, sync_type, mutation)
+    raise SyncError("op must be one of: create, update, delete")
+
+
+def create_object(user, sync_type, mutation):
+    """Apply a create mutation, unless its client_id was already created."""
+    client_id = get_client_id(mutation)
+    if client_id is None:
+        raise SyncError("A create needs a client_id")
+    existing_id = (get_user_objects(user, sync_type).filter(client_id=client_id)
+                   .values_list("id", flat=True).first())
+    if existing_id is not None:
+        return "duplicate", existing_id
+    aliased_id = get_aliased_id(user, sync_type, client_id)
+    if aliased_id is not None:
+        # Its create updated another object, which may have been deleted since
+        if not get_user_objects(user, sync_type).filter(id=aliased_id).exists():
+            aliased_id = None
+        return "duplicate", aliased_id
+    if is_deleted(user, sync_type, client_id=client_id):
+        return "duplicate", None
+
+    obj = get_valid_form(sync_type, mutation.get("data")).save(commit=False)
+    setattr(obj, sync_type.user_field, user)
+    obj.date = get_date(mutation)
+    obj.client_id = client_id
+    obj = sync_type.prepare(user, obj)
+    obj.save()
+    return "applied", obj.id
+
+
+def update_object(user, sync_type, mutation):
+    """Apply an update mutation. Fields that aren't in its data keep their values."""
+    obj = get_target(user, sync_type, mutation)
+    if obj is None:
+        raise SyncError("It doesn't exist (or it was deleted)")
+    data = mutation.get("data")
+    if not isinstance(data, dict):
+        raise SyncError("data must be an object")
+    data = {**model_to_dict(obj, fields=sync_type.form._meta.fields), **data}
+    get_valid_form(sync_type, data, instance=obj).save()
+    return "applied", obj.id
+
+
+def delete_synced_object(user, sync_type, mutation):
+    """Apply a delete mutation. Deleting something that's already gone does nothing."""
+    obj = get_target(user, sync_type, mutation)
+    if obj is None:
+        return "duplicate", None
+    obj_id = obj.id
+    sync_type.delete(obj)
+    return "applied", obj_id
+
+
+def get_user_objects(user, sync_type):
+    """Get a queryset of this user's objects of this sync type."""
+    return sync_type.model.objects.filter(**{sync_type.user_field: user})
+
+
+def get_target(user, sync_type, mutation):
+    """Get the object that an update or delete is for, or None if it doesn't exist."""
+    objects = get_user_objects(user, sync_type)
+    if mutation.get("id") is not None:
+        try:
+            return objects.filter(id=int(mutation["id"])).first()
+        except (TypeError, ValueError):
+            raise SyncError("id must be a whole number")
+    client_id = get_client_id(mutation)
+    if client_id is None:
+        raise SyncError("An update or delete needs an id or a client_id")
+    obj = objects.filter(client_id=client_id).first()
+    if obj is None:
+        aliased_id = get_aliased_id(user, sync_type, client_id)
+        if aliased_id is not None:
+            obj = objects.filter(id=aliased_id).first()
+    return obj
+
+
+def get_aliased_id(user, sync_type, client_id):
+    """Get the id of the object that client_id is an alias of (see SyncAlias), or None."""
+    aliases = SyncAlias.objects.filter(user_id=user.id, type=sync_type.name, client_id=client_id)
+    return aliases.values_list("object_id", flat=True).first()
+
+
+def get_client_id(mutation):
+    """Get a mutation's client_id as a UUID, or None if it doesn't have one."""
+    if mutation.get("client_id") is None:
+        return None
+    try:
+        return uuid.UUID(str(mutation["client_id"]))
+    except ValueError:
+        raise SyncError("client_id must be a UUID")
+
+
+def get_date(mutation):
+    """Get the date of a create mutation."""
+    try:
+        return datetime.date.fromisoformat(mutation.get("date"))
+    except (TypeError, ValueError):
+        raise SyncError("A create needs a date (YYYY-MM-DD)")
+
+
+def get_valid_form(sync_type, data, instance=None):
+    """Validate a mutation's data with its type's form. Return the form."""
+    if not isinstance(data, dict):
+        raise SyncError("data must be an object")
+    form = sync_type.form(data=data, instance=instance)
+    if not form.is_valid():
+        raise SyncError(form.errors.get_json_data())
+    return form
+
+
+def is_deleted(user, sync_type, client_id):
+    """Check if the user's object with this client_id was deleted."""
+    tombstones = SyncTombstone.objects.filter(user_id=user.id, type=sync_type.name, client_id=client_id)
+    return tombstones.exists()
+
+
+def get_changes(user, token=None):
+    """
+    Get what changed for this user since the token (see parse_token), or
+    their last SYNC_INITIAL_DAYS days of data if there's no token.
+    Costs one query per sync type, plus one for the deletions.
+    Return three things:
+        - changes: maps sync type names to lists of changed objects (dictionaries)
+        - deleted: maps sync type names to lists of deleted objects' ids
+          and client_ids
+        - the token to send next time
+    """
+    new_token = timezone.now()
+    changes = dict()
+    deleted = {name: [] for name in SYNC_TYPES}
+    for name, sync_type in SYNC_TYPES.items():
+        objects = get_user_objects(user, sync_type)
+        if token is None:
+            start_date = timezone.localdate() - datetime.timedelta(days=SYNC_INITIAL_DAYS)
+            objects = objects.filter(date__gte=start_date)
+        else:
+            objects = objects.filter(updated_at__gt=token - SYNC_TOKEN_OVERLAP)
+        fields = ["id", "client_id", "date", *sync_type.fields, "updated_at"]
+        changes[name] = list(objects.order_by("date", "id").values(*fields))
+
+    if token is not None:
+        tombstones = (SyncTombstone.objects
+                      .filter(user_id=user.id, deleted_at__gt=token - SYNC_TOKEN_OVERLAP)
+                      .order_by("id")
+                      .values_list("type", "object_id", "client_id"))
+        for name, object_id, client_id in tombstones:
+            deleted.setdefault(name, []).append({"id": object_id, "client_id": client_id})
+    return changes, deleted, format_token(new_token)
+
+
+def format_token(time):
+    """Make a sync token from the time a sync read the changes."""
+    return time.isoformat()
+
+
+def parse_token(token):
+    """
+    Get the time of a sync token, or None if there isn't one. Raise
+    ValueError if it isn't a token.
+    """
+    if token is None:
+        return None
+    time = datetime.datetime.fromisoformat(str(token))
+    if timezone.is_naive(time):
+        raise ValueError("Sync tokens have a time zone")
+    return time
+
+
+def get_tombstone_cutoff():
+    """Get the time before which tombstones may have been pruned."""
+    return timezone.now() - datetime.timedelta(days=SYNC_TOMBSTONE_DAYS)
+
+
+def is_expired(token):
+    """
+    Check if a token (see parse_token) is too old to sync from, because
+    tombstones it needs may have been pruned.
+    """
+    return token is not None and token - SYNC_TOKEN_OVERLAP < get_tombstone_cutoff()
+
+
+def prune_tombstones(user=None):
+    """
+    Delete the tombstones that no token can need anymore, for this user or
+    for every user. They're kept SYNC_TOKEN_OVERLAP longer than tokens are
+    accepted, so a sync that checked its token just before can still read
+    them. Return the number of tombstones deleted.
+    """
+    tombstones = SyncTombstone.objects.filter(deleted_at__lt=get_tombstone_cutoff() - SYNC_TOKEN_OVERLAP)
+    if user is not None:
+        tombstones = tombstones.filter(user_id=user.id)
+    return tombstones.delete()[0]
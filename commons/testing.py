@@ -0,0 +1,143 @@
+"""
+Helpers for the apps' tests.
+"""
+from contextlib import contextmanager
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.utils import load_backend
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .loaddata import generate_user
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Test runner (settings.TEST_RUNNER) that gives the tests their own cache:
+    a file cache in a temporary directory, removed afterwards. Tests clear
+    the cache, and the test database's data versions mean nothing to the
+    dev database, so they must never use the configured cache (the dev or
+    production one). It's still a file cache, so it's shared like the
+    configured one (see checks.py).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix="balance-test-cache-")
+        self.test_cache = override_settings(CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": self.cache_dir,
+            }
+        })
+        self.test_cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_cache.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryPlanMixin:
+    """Assertions about how the database runs a query (for TestCases)."""
+
+    def get_query_plan(self, queryset):
+        """
+        Get the database's plan for running this queryset, as text.
+        Test tables are tiny, so PostgreSQL would rather scan a whole table
+        than use an index. Sequential scans are turned off for the test's
+        transaction, so the plan shows the index a real table would use.
+        """
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name):
+        """Assert that the database uses this index to run the queryset."""
+        plan = self.get_query_plan(queryset)
+        self.assertIn(index_name, plan, f"{index_name} isn't used by this plan:\n{plan}")
+
+    def get_index_name(self, model, columns):
+        """Get the name of the index on exactly these columns of the model's table."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        for name, constraint in constraints.items():
+            if constraint["index"] or constraint["unique"]:
+                if constraint["columns"] == list(columns):
+                    return name
+        self.fail(f"{model._meta.db_table} has no index on {columns}")
+
+
+class QueryBudgetMixin:
+    """Assertions about how many queries a view makes (for TestCases)."""
+
+    def assertQueryBudget(self, budget, url, method="get", data=None, status=200, **extra):
+        """
+        Assert that requesting this URL makes no more than budget queries.
+        Extra keyword arguments go to the test client (ex: content_type).
+        The tests' cache (see TestRunner) is cleared first, so the count
+        includes loading the cached reference data and charts (the worst case).
+        Return the response.
+        """
+        cache.clear()
+        # Don't let the request metrics flush in the middle of a request
+        with self.settings(REQUEST_METRICS_FLUSH_SECONDS=float("inf")):
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(url, data, **extra)
+        self.assertEqual(response.status_code, status)
+        sql = "\n".join(query["sql"] for query in queries.captured_queries)
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{method.upper()} {url} made {len(queries)} queries (budget: {budget}):\n{sql}",
+        )
+        return response
+
+
+@contextmanager
+def file_database():
+    """
+    Copy the (in-memory) SQLite test database to a temporary file, for tests
+    of what only shows up between connections to a file (ex: WAL, write
+    locks). Data created by the test case isn't copied, only the migrated
+    tables. Yield a function(func, *args) that calls func in this thread with
+    a new default connection to the file, like another worker process would
+    have, and returns what it returns. Call it from threads to run things
+    at the same time.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="balance-test-db-"), "db.sqlite3")
+    with sqlite3.connect(path) as copy:
+        connection.ensure_connection()
+        connection.connection.backup(copy)
+    copy.close()
+    db_settings = {**connections.settings["default"], "NAME": path}
+
+    def run(func, *args):
+        test_connection = connections["default"]
+        connections["default"] = load_backend(db_settings["ENGINE"]).DatabaseWrapper(db_settings, "default")
+        try:
+            return func(*args)
+        finally:
+            connections["default"].close()
+            connections["default"] = test_connection
+
+    try:
+        yield run
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def seed_user(username="athlete", years=2, seed=0):
+    """
+    Create a user with years of realistic data, up to today (see
+    commons/loaddata.py): a workout every other day (5 exercises, 3 sets
+    each), their weight every day, and 5 logged food items a day.
+    Return the user.
+    """
+    return generate_user(username, days=365 * years, rng=random.Random(seed))
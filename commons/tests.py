@@ -1,3 +1,374 @@
+import datetime
+import io
+import json
+import tempfile
+from pathlib import Path
+import unittest
+from unittest import mock
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.core.management import call_command
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+import plotly
+
+from commons.testing import QueryBudgetMixin, QueryPlanMixin, file_database, seed_user
+from nutrition_log.models import DailyNutritionSummary, DailyWeight, Unit
+from workout_log.forms import SetForm
+from workout_log.models import Exercise, Set
+from workout_designer.models import Routine
+from workout_designer.views import create_routines
+from workout_log.reference import EXERCISES
+from .finders import PLOTLY_JS_PATH
+from .metrics import histograms
+from .models import RequestMetricsSample, SyncTombstone
+from .registry import versions_checked_once
+from .sync import MAX_SYNC_MUTATIONS, SYNC_TOMBSTONE_DAYS, SYNC_TYPES, format_token, is_deleted
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """The home page makes a fixed number of queries for a user with years of data."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_user()
+
+    def test_index(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(2, "/")
+
+    def test_index_logged_out(self):
+        self.assertQueryBudget(0, "/")
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "Tests the SQLite PRAGMAs")
+class SQLitePragmaTests(TestCase):
+    """New SQLite connections get the PRAGMAs from settings.SQLITE_PRAGMAS."""
+
+    def get_pragmas(self, names):
+        with connection.cursor() as cursor:
+            pragmas = dict()
+            for name in names:
+                cursor.execute(f"PRAGMA {name}")
+                pragmas[name] = cursor.fetchone()[0]
+            return pragmas
+
+    def test_new_connections_get_the_pragmas(self):
+        # The test database is in memory, which has no WAL: use a file
+        with file_database() as run:
+            pragmas = run(self.get_pragmas, ["journal_mode", "synchronous", "busy_timeout", "foreign_keys",
+                                             "temp_store", "cache_size", "mmap_size"])
+        self.assertEqual(pragmas, {
+            "journal_mode": "wal",
+            "synchronous": 1,  # NORMAL
+            "busy_timeout": 20000,
+            "foreign_keys": 1,  # Turned on by Django
+            "temp_store": 2,  # MEMORY
+            "cache_size": -20000,
+            "mmap_size": 134217728,
+        })
+
+
+class PlotlyFinderTests(TestCase):
+    """Only plotly.min.js is served from the plotly package."""
+
+    def test_plotly_js_is_the_installed_packages(self):
+        path = Path(finders.find(PLOTLY_JS_PATH))
+        self.assertEqual(path.name, "plotly.min.js")
+        self.assertTrue(path.is_relative_to(Path(plotly.__file__).parent))
+
+    def test_rest_of_package_data_isnt_served(self):
+        self.assertIsNone(finders.find("plotly/datasets/carshare.csv.gz"))
+        self.assertIsNone(finders.find("datasets/carshare.csv.gz"))
+        self.assertIsNone(finders.find("plotly/templates/plotly.json"))
+        collected = [storage.prefix + "/" + path
+                     for finder in finders.get_finders() for path, storage in finder.list([])
+                     if getattr(storage, "prefix", None) == "plotly"]
+        self.assertEqual(collected, [PLOTLY_JS_PATH])
+
+
+class ReferenceDataTests(TestCase):
+    """Reference data that changes in one process is reloaded by the others."""
+
+    def test_other_process_reloads_after_invalidate(self):
+        # Another process loaded the exercises before one was created
+        EXERCISES.get()
+        other_process_loaded = EXERCISES._loaded
+        exercise = Exercise.objects.create(name="Zercher squat", is_compound=True, equipment=Exercise.BARBELL)
+        # This process invalidated them, which the other process sees through the cache
+        EXERCISES._loaded = other_process_loaded
+        form = SetForm(data={"exercise": exercise.id, "reps": 5, "weight": 135})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIn(exercise.id, EXERCISES.get().by_id)
+
+    def test_tests_have_their_own_cache(self):
+        location = settings.CACHES["default"]["LOCATION"]
+        self.assertTrue(location.startswith(tempfile.gettempdir()), location)
+        self.assertEqual(cache._dir, location)
+
+    def test_versions_are_read_once_per_request(self):
+        user = User.objects.create_user("planner")
+        create_routines([user], 1, "sync", 75, 45, "PPL", "muscle")
+        routine = Routine.objects.get(user=user)
+        self.client.force_login(user)
+        urls = [
+            reverse("workout_designer:routine", args=[routine.id]),
+            reverse("workout_log:new_set", args=[0, 2023, 11, 1]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.client.get(url)  # load the reference data
+                with mock.patch("commons.registry.cache", wraps=cache) as registry_cache:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                keys = [call.args[0] for call in registry_cache.get.call_args_list]
+                self.assertTrue(keys)
+                self.assertEqual(len(keys), len(set(keys)), keys)
+
+    def test_invalidate_is_seen_in_the_same_request(self):
+        with versions_checked_once():
+            EXERCISES.get()
+            exercise = Exercise.objects.create(name="Zercher squat", is_compound=True,
+                                               equipment=Exercise.BARBELL)
+            self.assertIn(exercise.id, EXERCISES.get().by_id)
+        # Outside of a request, every access reads the version
+        with mock.patch("commons.registry.cache", wraps=cache) as registry_cache:
+            EXERCISES.get()
+            EXERCISES.get()
+        self.assertEqual(registry_cache.get.call_count, 2)
+
+    def test_cache_is_shared(self):
+        self.assertNotIn("commons.W001", [message.id for message in run_checks()])
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertIn("commons.W001", [message.id for message in run_checks()])
+
+
+class RequestMetricsTests(TestCase):
+    """Flushing the request metrics never fails a request, sync or async."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("lifter")
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        histograms.counts = dict()
+
+    async def test_async_view_flushes_in_a_thread(self):
+        with self.settings(REQUEST_METRICS_FLUSH_SECONDS=0):
+            response = await self.async_client.get(reverse("nutrition_log:index"))
+        self.assertEqual(response.status_code, 200)
+        samples = RequestMetricsSample.objects.filter(view_name="nutrition_log:index", metric="queries")
+        self.assertEqual(await samples.acount(), 1)
+
+    async def test_failed_flush_keeps_the_counts(self):
+        with self.settings(REQUEST_METRICS_FLUSH_SECONDS=0), self.assertLogs("commons.metrics", "ERROR"):
+            with mock.patch.object(histograms, "save", side_effect=DatabaseError):
+                response = await self.async_client.get(reverse("nutrition_log:index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("nutrition_log:index", [view_name for view_name, _, _ in histograms.counts])
+        # The next flush saves them
+        with self.settings(REQUEST_METRICS_FLUSH_SECONDS=0):
+            await self.async_client.get(reverse("nutrition_log:index"))
+        samples = RequestMetricsSample.objects.filter(view_name="nutrition_log:index", metric="total_ms")
+        self.assertEqual(sum([sample.count async for sample in samples]), 2)
+
+    def test_sync_view_flush(self):
+        with self.settings(REQUEST_METRICS_FLUSH_SECONDS=0), self.assertLogs("commons.metrics", "ERROR"):
+            with mock.patch.object(histograms, "save", side_effect=DatabaseError):
+                response = self.client.get(reverse("nutrition_log:set_target_calories"))
+        self.assertEqual(response.status_code, 200)
+        with self.settings(REQUEST_METRICS_FLUSH_SECONDS=0):
+            self.client.get(reverse("nutrition_log:set_target_calories"))
+        samples = RequestMetricsSample.objects.filter(view_name="nutrition_log:set_target_calories",
+                                                      metric="total_ms")
+        self.assertEqual(sum(sample.count for sample in samples), 2)
+
+
+class SyncTests(QueryPlanMixin, TestCase):
+    """Devices' queued mutations are applied once, and they get back what changed."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("lifter")
+        self.client.force_login(self.user)
+        self.exercise = Exercise.objects.order_by("id").first()
+        self.unit = Unit.objects.order_by("id").first()
+        self.today = datetime.date.today().isoformat()
+
+    def sync(self, mutations, token=None, status=200):
+        body = json.dumps({"token": token, "mutations": mutations})
+        response = self.client.post(reverse("commons:sync"), body, content_type="application/json")
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def create_set(self, client_id, reps=5):
+        return {"type": "set", "op": "create", "client_id": client_id, "date": self.today,
+                "data": {"exercise": self.exercise.id, "reps": reps, "weight": 100}}
+
+    def test_creates_are_applied_once(self):
+        client_id = str(uuid.uuid4())
+        mutations = [
+            self.create_set(client_id),
+            {"type": "daily_weight", "op": "create", "client_id": str(uuid.uuid4()),
+             "date": self.today, "data": {"weight": 180}},
+            {"type": "logged_food_item", "op": "create", "client_id": str(uuid.uuid4()),
+             "date": self.today, "data": {"food_item": self.unit.food_item_id, "unit": self.unit.id,
+                                          "quantity": 2}},
+        ]
+        first = self.sync(mutations)
+        self.assertEqual([result["status"] for result in first["results"]], ["applied"] * 3)
+        again = self.sync(mutations, first["token"])
+        self.assertEqual([result["status"] for result in again["results"]], ["duplicate"] * 3)
+
+        self.assertEqual(Set.objects.filter(logged_by=self.user, client_id=client_id).count(), 1)
+        self.assertEqual(DailyWeight.objects.filter(user=self.user).count(), 1)
+        # The signal handlers kept the daily summary up to date
+        summary = DailyNutritionSummary.objects.get(user=self.user)
+        self.assertEqual(summary.calories, 2 * self.unit.calsPerUnit)
+
+    def test_update_and_delete_by_client_id(self):
+        first_id, second_id = str(uuid.uuid4()), str(uuid.uuid4())
+        result = self.sync([
+            self.create_set(first_id, reps=5),
+            self.create_set(second_id, reps=6),
+            {"type": "set", "op": "update", "client_id": second_id, "data": {"reps": 8}},
+            {"type": "set", "op": "delete", "client_id": first_id},
+        ])
+        self.assertEqual([r["status"] for r in result["results"]], ["applied"] * 4)
+        sets = list(Set.objects.filter(logged_by=self.user).values_list("client_id", "reps", "index"))
+        self.assertEqual(sets, [(uuid.UUID(second_id), 8, 0)])
+
+        # Deleting again, or creating what was deleted, does nothing
+        result = self.sync([
+            {"type": "set", "op": "delete", "client_id": first_id},
+            self.create_set(first_id),
+        ])
+        self.assertEqual([r["status"] for r in result["results"]], ["duplicate"] * 2)
+        self.assertEqual(Set.objects.filter(logged_by=self.user).count(), 1)
+
+    def test_two_devices_log_a_weight_for_the_same_day(self):
+        def weight_mutation(op, client_id, weight=None):
+            mutation = {"type": "daily_weight", "op": op, "client_id": client_id}
+            if op == "create":
+                mutation["date"] = self.today
+            if weight is not None:
+                mutation["data"] = {"weight": weight}
+            return mutation
+
+        phone_id, watch_id = str(uuid.uuid4()), str(uuid.uuid4())
+        phone = self.sync([weight_mutation("create", phone_id, 180)])
+        watch = self.sync([weight_mutation("create", watch_id, 181)])
+        # The watch's weight replaced the phone's, which keeps its client_id
+        weight_id = phone["results"][0]["id"]
+        self.assertEqual(watch["results"][0]["id"], weight_id)
+        self.assertEqual(list(DailyWeight.objects.filter(user=self.user).values_list("id", "client_id", "weight")),
+                         [(weight_id, uuid.UUID(phone_id), 181)])
+
+        # Each device can still resend, update, and delete it by its own client_id
+        result = self.sync([weight_mutation("create", watch_id, 181), weight_mutation("update", watch_id, 179)])
+        self.assertEqual([(r["status"], r["id"]) for r in result["results"]],
+                         [("duplicate", weight_id), ("applied", weight_id)])
+        self.assertEqual(DailyWeight.objects.get(id=weight_id).weight, 179)
+        result = self.sync([weight_mutation("update", phone_id, 178)])
+        self.assertEqual(result["results"][0]["status"], "applied")
+        result = self.sync([weight_mutation("delete", watch_id), weight_mutation("delete", phone_id),
+                            weight_mutation("create", watch_id, 181)])
+        self.assertEqual([r["status"] for r in result["results"]], ["applied", "duplicate", "duplicate"])
+        self.assertFalse(DailyWeight.objects.filter(user=self.user).exists())
+
+    def test_invalid_mutation_is_skipped(self):
+        result = self.sync([
+            {"type": "set", "op": "create", "client_id": str(uuid.uuid4()), "date": self.today,
+             "data": {"exercise": 0, "reps": 5, "weight": 100}},
+            self.create_set(str(uuid.uuid4())),
+            {"type": "set", "op": "update", "id": 0, "data": {"reps": 1}},
+        ])
+        self.assertEqual([r["status"] for r in result["results"]], ["error", "applied", "error"])
+        self.assertIn("exercise", result["results"][0]["errors"])
+        self.assertEqual(Set.objects.filter(logged_by=self.user).count(), 1)
+
+    def test_changes_since_token(self):
+        first = self.sync([self.create_set(str(uuid.uuid4()))])
+        self.assertEqual(len(first["changes"]["set"]), 1)
+
+        # Changes made somewhere else since the last sync come back
+        other = Set.objects.create(date=datetime.date.today(), exercise=self.exercise, reps=3,
+                                   weight=50, logged_by=self.user, index=1)
+        weight = DailyWeight.objects.create(date=datetime.date.today(), weight=170, user=self.user)
+        weight_id = weight.id
+        weight.delete()
+        result = self.sync([], first["token"])
+        self.assertIn(other.id, [s["id"] for s in result["changes"]["set"]])
+        self.assertEqual(result["deleted"]["daily_weight"], [{"id": weight_id, "client_id": None}])
+
+    def test_others_sets_are_not_changed(self):
+        other_user = User.objects.create_user("other")
+        other_set = Set.objects.create(date=datetime.date.today(), exercise=self.exercise, reps=3,
+                                       weight=50, logged_by=other_user, index=0)
+        result = self.sync([{"type": "set", "op": "delete", "id": other_set.id}])
+        self.assertEqual(result["results"][0]["status"], "duplicate")
+        self.assertTrue(Set.objects.filter(id=other_set.id).exists())
+        self.assertNotIn(other_set.id, [s["id"] for s in result["changes"]["set"]])
+
+    def test_deleting_user_leaves_no_tombstones(self):
+        Set.objects.create(date=datetime.date.today(), exercise=self.exercise, reps=3, weight=50,
+                           logged_by=self.user, index=0)
+        self.user.delete()
+        self.assertFalse(SyncTombstone.objects.exists())
+
+    def test_bad_requests(self):
+        self.sync([], token="yesterday", status=400)
+        self.sync([self.create_set(str(uuid.uuid4()))] * (MAX_SYNC_MUTATIONS + 1), status=400)
+
+    def make_tombstone(self, user, days_ago):
+        tombstone = SyncTombstone.objects.create(user_id=user.id, type="set", object_id=1,
+                                                 client_id=uuid.uuid4())
+        deleted_at = timezone.now() - datetime.timedelta(days=days_ago)
+        SyncTombstone.objects.filter(id=tombstone.id).update(deleted_at=deleted_at)
+        return tombstone.id
+
+    def test_old_token_gets_full_resync(self):
+        Set.objects.create(date=datetime.date.today(), exercise=self.exercise, reps=3, weight=50,
+                           logged_by=self.user, index=0)
+        recent_token = format_token(timezone.now() - datetime.timedelta(days=SYNC_TOMBSTONE_DAYS - 1))
+        result = self.sync([], recent_token)
+        self.assertFalse(result["reset"])
+        self.assertEqual(result["tombstone_days"], SYNC_TOMBSTONE_DAYS)
+
+        # Tombstones it needs may be gone, so it gets everything, like a first sync
+        self.make_tombstone(self.user, days_ago=SYNC_TOMBSTONE_DAYS + 2)
+        old_token = format_token(timezone.now() - datetime.timedelta(days=SYNC_TOMBSTONE_DAYS + 1))
+        result = self.sync([self.create_set(str(uuid.uuid4()))], old_token)
+        self.assertTrue(result["reset"])
+        self.assertEqual(result["results"][0]["status"], "applied")
+        self.assertEqual(len(result["changes"]["set"]), 2)
+        self.assertEqual(result["deleted"], {name: [] for name in SYNC_TYPES})
+        self.assertFalse(self.sync([], result["token"])["reset"])
+
+    def test_old_tombstones_are_pruned(self):
+        other_user = User.objects.create_user("other")
+        recent_ids = [self.make_tombstone(user, days_ago=1) for user in [self.user, other_user]]
+        old_ids = [self.make_tombstone(user, days_ago=SYNC_TOMBSTONE_DAYS + 1)
+                   for user in [self.user, other_user]]
+
+        # A sync prunes its user's tombstones
+        self.sync([])
+        self.assertFalse(SyncTombstone.objects.filter(id=old_ids[0]).exists())
+        self.assertTrue(SyncTombstone.objects.filter(id=old_ids[1]).exists())
+
+        # The command prunes everyone's
+        out = io.StringIO()
+        call_command("prune_sync_tombstones", stdout=out)
+        self.assertIn("Deleted 1 sync tombstones", out.getvalue())
+        self.assertEqual(sorted(SyncTombstone.objects.values_list("id", flat=True)), recent_ids)
 
-# Create your tests here.
+    def test_deleted_check_uses_client_index(self):
+        client_id = uuid.uuid4()
+        tombstones = SyncTombstone.objects.filter(user_id=self.user.id, type="set", client_id=client_id)
+        self.assertUsesIndex(tombstones, "synctombstone_user_client_idx")
+        self.assertFalse(is_deleted(self.user, SYNC_TYPES["set"], client_id))
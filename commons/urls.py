@@ -10,4 +10,5 @@ app_name = 'commons'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('sync/', views.sync, name='sync'),
 ]
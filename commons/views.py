@@ -3,9 +3,22 @@ Views are accessed by multiple apps or not central to a particular app.
 """
 
 import datetime
-from django.http import Http404
+from functools import wraps
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.views.decorators.http import require_POST
+
+from .sync import (
+    MAX_SYNC_MUTATIONS, SYNC_TOMBSTONE_DAYS, apply_mutations, get_changes, is_expired, parse_token,
+    prune_tombstones
+)
 
 
 def get_date_url(destination_url, date):
@@ -37,6 +50,37 @@ def index(request):
     return render(request, 'commons/index.html', context)
 
 
+@login_required
+@require_POST
+def sync(request):
+    """
+    Sync a device's offline changes to the user's logs (see sync.py): apply
+    its queued mutations, and send back everything that changed since its
+    last sync. Both happen in one transaction.
+    """
+    try:
+        body = json.loads(request.body)
+        token = parse_token(body.get("token"))
+        mutations = body.get("mutations", [])
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": 'Expected a JSON object with a "token" and "mutations"'}, status=400)
+    if not isinstance(mutations, list):
+        return JsonResponse({"error": '"mutations" must be a list'}, status=400)
+    if len(mutations) > MAX_SYNC_MUTATIONS:
+        return JsonResponse({"error": f"Send at most {MAX_SYNC_MUTATIONS} mutations per sync"},
+                            status=400)
+
+    # A token older than the tombstones gets a full resync
+    reset = is_expired(token)
+    with transaction.atomic():
+        results = apply_mutations(request.user, mutations)
+        changes, deleted, new_token = get_changes(request.user, None if reset else token)
+        prune_tombstones(request.user)
+    data = {"token": new_token, "results": results, "changes": changes, "deleted": deleted,
+            "reset": reset, "tombstone_days": SYNC_TOMBSTONE_DAYS}
+    return JsonResponse(data)
+
+
 def verify_user_is_owner(owner, user):
     """
     Users should only be able to access pages they own (i.e., pages with their
@@ -44,4 +88,19 @@ def verify_user_is_owner(owner, user):
     the user tries to access the page.
     """
     if owner != user:
-        raise Http404
\ No newline at end of file
+        raise Http404
+
+
+def async_login_required(view):
+    """
+    login_required for async views (Django's login_required only wraps sync
+    views). Loading request.user queries the database, so it's done in a
+    thread. Afterwards request.user is loaded, so the view can use it.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 
-from .models import DailyWeight, FoodItem, Recipe, Unit, Contains, LoggedFoodItem, Goals
+from .models import DailyWeight, FoodItem, Recipe, Unit, Contains, LoggedFoodItem, Goals, DailyNutritionSummary
 
 
 admin.site.register(DailyWeight)
@@ -11,6 +11,7 @@ admin.site.register(Recipe)
 admin.site.register(Unit)
 admin.site.register(Contains)
 admin.site.register(LoggedFoodItem)
+admin.site.register(DailyNutritionSummary)
 
 # Define an inline admin descriptor for Goals model
 class GoalsInline(admin.StackedInline):
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class NutritionLogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'nutrition_log'
+
+    def ready(self):
+        # Connect the signal handlers that maintain daily nutrition summaries
+        #  and reset the food search index
+        from . import signals  # noqa: F401
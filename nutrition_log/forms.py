@@ -8,7 +8,8 @@ from datetime import date
 
 from django import forms
 
-from .models import DailyWeight, LoggedFoodItem, Goals
+from commons.forms import ReferenceModelForm
+from .models import DailyWeight, FoodItem, LoggedFoodItem, Goals, Unit
 
 
 class DailyWeightForm(forms.ModelForm):
@@ -18,11 +19,78 @@ class DailyWeightForm(forms.ModelForm):
         fields = ['weight']
 
 
-class LogFoodItemForm(forms.ModelForm):
+class FoodItemSelect(forms.Select):
+    """
+    Food item picker that only renders the selected food item. There can be
+    too many food items to list, so the others are found by searching (see
+    views.food_item_search).
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        choices = [] if field.empty_label is None else [("", field.empty_label)]
+        ids = [v for v in value if v.isdigit()]
+        if ids:
+            choices += [self.choices.choice(food_item) for food_item in field.queryset.filter(id__in=ids)]
+        groups = []
+        for index, (option_value, option_label) in enumerate(choices):
+            selected = str(option_value) in value
+            option = self.create_option(name, option_value, option_label, selected, index, attrs=attrs)
+            groups.append((None, [option], index))
+        return groups
+
+
+def get_food_item_units(food_item_id):
+    """Get a queryset of the units a food item can be measured in (uses the food item index)."""
+    return Unit.objects.filter(food_item_id=food_item_id).select_related('food_item__user').order_by('id')
+
+
+class UnitChoiceField(forms.ModelChoiceField):
+    """
+    Unit picker whose options are the units of one food item (see
+    set_food_item). Rendering or validating it is one query, and a unit of
+    another food item isn't a valid choice.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Unit.objects.none(), **kwargs)
+
+    def set_food_item(self, food_item_id):
+        """Only offer this food item's units (none if it's None)."""
+        self.queryset = Unit.objects.none() if food_item_id is None else get_food_item_units(food_item_id)
+
+
+class LogFoodItemForm(ReferenceModelForm):
     """Form where users can log a food item"""
+    # Unit options are the chosen food item's units
+    unit = UnitChoiceField()
+
     class Meta:
         model = LoggedFoodItem
         fields = ['food_item', 'unit', 'quantity']
+        widgets = {'food_item': FoodItemSelect}
+
+    def __init__(self, *args, **kwargs):
+        super(LogFoodItemForm, self).__init__(*args, **kwargs)
+
+        # Food item options display their user, so load them in the same query
+        food_item_field = self.fields['food_item']
+        food_item_field.queryset = FoodItem.objects.select_related('user')
+        # Only offer the chosen food item's units
+        self.fields['unit'].set_food_item(self.get_food_item_id())
+
+    def get_food_item_id(self):
+        """Get the id of the food item that's chosen (submitted or initial), or None."""
+        if self.is_bound:
+            value = self.data.get(self.add_prefix('food_item'))
+        else:
+            value = self.get_initial_for_field(self.fields['food_item'], 'food_item')
+        if isinstance(value, FoodItem):
+            return value.id
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
 
 
 class TargetCaloriesForm(forms.ModelForm):
@@ -0,0 +1,28 @@
+"""
+Rebuild the daily nutrition summaries from the logged food items.
+Usage:
+    python manage.py rebuild_nutrition_summaries
+    python manage.py rebuild_nutrition_summaries --user <username>
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from nutrition_log.stats import rebuild_daily_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild daily nutrition summaries from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild summaries for this username")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        count = rebuild_daily_summaries(user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily nutrition summaries"))
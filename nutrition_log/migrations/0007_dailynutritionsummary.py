@@ -0,0 +1,58 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:03
+#  Creates the daily nutrition summary table and fills it in from the food
+#  items that have already been logged.
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+import django.db.models.deletion
+
+
+def create_summaries(apps, schema_editor):
+    logged_food_items = apps.get_model('nutrition_log', 'LoggedFoodItem').objects
+    summaries = apps.get_model('nutrition_log', 'DailyNutritionSummary').objects
+    rows = (logged_food_items.exclude(user=None)
+            .values('user', 'date')
+            .annotate(
+                calories=Sum(F('quantity') * F('unit__calsPerUnit')),
+                protein=Sum(F('quantity') * F('unit__proPerUnit')),
+                carbs=Sum(F('quantity') * F('unit__carbsPerUnit')),
+                fats=Sum(F('quantity') * F('unit__fatsPerUnit')),
+                item_count=Count('id'),
+            )
+            .order_by('user', 'date'))
+    summaries.bulk_create([
+        summaries.model(user_id=row['user'], date=row['date'], calories=row['calories'],
+                        protein=row['protein'], carbs=row['carbs'], fats=row['fats'],
+                        item_count=row['item_count'])
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('nutrition_log', '0006_auto_20231121_1929'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyNutritionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('calories', models.FloatField(default=0)),
+                ('protein', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('fats', models.FloatField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'daily nutrition summaries',
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(create_summaries, migrations.RunPython.noop),
+    ]
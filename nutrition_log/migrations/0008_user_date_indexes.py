@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition_log', '0007_dailynutritionsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loggedfooditem',
+            index=models.Index(fields=['user', 'date'], name='loggedfooditem_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition_log', '0008_user_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyweight',
+            name='client_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyweight',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='loggedfooditem',
+            name='client_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='loggedfooditem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='dailyweight',
+            index=models.Index(fields=['user', 'updated_at'], name='dailyweight_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggedfooditem',
+            index=models.Index(fields=['user', 'updated_at'], name='lfi_user_updated_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyweight',
+            constraint=models.UniqueConstraint(fields=('user', 'client_id'), name='dailyweight_user_client_id_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='loggedfooditem',
+            constraint=models.UniqueConstraint(fields=('user', 'client_id'), name='lfi_user_client_id_unique'),
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.5 on 2026-10-18 23:05
+#  Creates the index that the food item search uses (see
+#  nutrition_log/search.py):
+#  - SQLite: an FTS5 table over food item names and producers, with prefix
+#    indexes, kept in sync by triggers. Skipped if SQLite wasn't built with
+#    FTS5 (the search falls back to an in-memory index).
+#  - PostgreSQL: the pg_trgm extension and trigram GIN indexes on name and
+#    producer.
+#  Note: SQLite drops a table's triggers when Django remakes it, which it
+#  does for most later AlterField/RemoveField operations on FoodItem. The
+#  post_migrate handler in nutrition_log/signals.py recreates any missing
+#  trigger and reindexes (see restore_sqlite_search_triggers in search.py),
+#  so keep its copy of the triggers in step with the ones here.
+from django.db import migrations
+
+
+SQLITE_FTS_TABLE = 'nutrition_log_fooditem_fts'
+
+SQLITE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5(
+        name, producer,
+        content='nutrition_log_fooditem', content_rowid='id',
+        prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_FTS_TABLE}_insert AFTER INSERT ON nutrition_log_fooditem BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, name, producer) VALUES (new.id, new.name, new.producer);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_FTS_TABLE}_delete AFTER DELETE ON nutrition_log_fooditem BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, name, producer)
+            VALUES ('delete', old.id, old.name, old.producer);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_FTS_TABLE}_update AFTER UPDATE ON nutrition_log_fooditem BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, name, producer)
+            VALUES ('delete', old.id, old.name, old.producer);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, name, producer) VALUES (new.id, new.name, new.producer);
+    END
+    """,
+    # Index the food items that already exist
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}",
+]
+
+POSTGRESQL_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS fooditem_name_trgm_idx ON nutrition_log_fooditem USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS fooditem_producer_trgm_idx ON nutrition_log_fooditem USING gin (producer gin_trgm_ops)",
+]
+
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS fooditem_name_trgm_idx",
+    "DROP INDEX IF EXISTS fooditem_producer_trgm_idx",
+]
+
+
+def has_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite' and has_fts5(schema_editor):
+        statements = SQLITE_CREATE
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_CREATE
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_DROP
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_DROP
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition_log', '0009_sync_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -8,11 +8,21 @@ class DailyWeight(models.Model):
     date = models.DateField()
     weight = models.FloatField()
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # For offline sync (see commons/sync.py): the id the user's device gave
+    # the weight, if it was logged through sync, and when it last changed
+    client_id = models.UUIDField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # User + date combo needs to be unique, so the user can't log 
     #  multiple weights for one day.
     class Meta:
         unique_together = ["user", "date"]
+        indexes = [
+            models.Index(fields=["user", "updated_at"], name="dailyweight_user_updated_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "client_id"], name="dailyweight_user_client_id_unique"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} | {self.date} | {self.weight}"
@@ -78,11 +88,53 @@ class LoggedFoodItem(models.Model):
     unit = models.ForeignKey(Unit, on_delete=models.RESTRICT)
     meal = models.IntegerField()  # 0 for snack, 1 for breakfast, 2 for lunch, etc.
     user = models.ForeignKey(User, null=True, on_delete=models.CASCADE)
+    # For offline sync (see commons/sync.py): the id the user's device gave
+    # the logged food item, if it was logged through sync, and when it last
+    # changed
+    client_id = models.UUIDField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Logged food items are almost always looked up by user, then date.
+    # (DailyWeight doesn't need one: its unique user + date combo is indexed.)
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "date"], name="loggedfooditem_user_date_idx"),
+            models.Index(fields=["user", "updated_at"], name="lfi_user_updated_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "client_id"], name="lfi_user_client_id_unique"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.food_item.name} | {self.quantity}x{self.unit.name}"
 
 
+class DailyNutritionSummary(models.Model):
+    """
+    The totals of a user's logged food items for one day. This is derived
+    data: it is kept up to date by signals whenever a logged food item is
+    saved or deleted (see signals.py), and can be rebuilt from scratch with
+    `python manage.py rebuild_nutrition_summaries`.
+    Pages that only need daily totals read these rows instead of adding up
+    every logged food item.
+    """
+    date = models.DateField()
+    calories = models.FloatField(default=0)
+    protein = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    fats = models.FloatField(default=0)
+    item_count = models.IntegerField(default=0)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    # One summary per user per day
+    class Meta:
+        unique_together = ["user", "date"]
+        verbose_name_plural = 'daily nutrition summaries'
+
+    def __str__(self) -> str:
+        return f"{self.user.username} | {self.date} | {self.calories} Calories"
+
+
 class Goals(models.Model):
     """
     The fitness goals of a user. This class is not a standalone model. It is a 
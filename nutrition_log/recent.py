@@ -0,0 +1,126 @@
+"""
+Each user's recent and frequent foods: the food items, units, and
+quantities they log the most, listed at the top of the Log Food Item page so
+they can be logged again with one tap.
+
+The list isn't updated when food is logged. It's rebuilt: the user's
+last RECENT_FOODS_HISTORY logged food items are replayed, oldest first,
+through add_logged_food (one query that reads the user + date index).
+The replay is what keeps the list frequent and recent: it holds at most
+RECENT_FOODS_SIZE foods, the food logged the fewest times (then the longest
+ago) is dropped to make room, and counts are halved when one reaches
+RECENT_FOODS_MAX_COUNT, so foods the user stopped eating age out.
+
+The built list is cached in the shared cache backend, keyed by the user's
+FOOD data version (see commons/charts.py). Logging, editing, or deleting
+food bumps the version, so the next page rebuilds the list. Updating the
+cached list in place would need an atomic compare-and-set, which the cache
+backends don't have: two requests that log food at the same time (ex: a
+sync and a page) could each write back a list without the other's food.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from commons.charts import FOOD, get_data_version
+from .models import LoggedFoodItem, Unit
+
+
+# Most foods kept in a user's list
+RECENT_FOODS_SIZE = 30
+# Most foods shown on the Log Food Item page
+RECENT_FOODS_SHOWN = 10
+# Logged food items the list is rebuilt from when it isn't cached
+RECENT_FOODS_HISTORY = 300
+# Count at which every count in a list is halved
+RECENT_FOODS_MAX_COUNT = 50
+# How long a list stays in the cache backend (seconds)
+RECENT_FOODS_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# A food in a user's list:
+# - food_item_id, unit_id: what they logged
+# - quantity: how much they logged the last time
+# - count: how many times they logged it (halved as it ages)
+# - last_logged: (date, id) of the last logged food item, for recency
+RecentFood = namedtuple("RecentFood", ["food_item_id", "unit_id", "quantity", "count", "last_logged"])
+
+# A food to offer for one-tap logging, with its unit loaded
+RecentFoodChoice = namedtuple("RecentFoodChoice", ["unit", "quantity", "count"])
+
+
+def get_cache_key(user_id):
+    """Get the cache key of the user's list for their current food data."""
+    return f"recent_foods:{user_id}:{get_data_version(user_id, FOOD)}"
+
+
+def add_logged_food(recent_foods, logged_food_item):
+    """
+    Add a logged food item to a list of RecentFoods, while building a list
+    (see build_recent_foods). Return the new list, most logged (then most
+    recent) first.
+    """
+    key = (logged_food_item.food_item_id, logged_food_item.unit_id)
+    last_logged = (logged_food_item.date, logged_food_item.id)
+    count = 1
+    foods = []
+    for food in recent_foods:
+        if (food.food_item_id, food.unit_id) == key:
+            count += food.count
+            last_logged = max(last_logged, food.last_logged)
+        else:
+            foods.append(food)
+    foods.append(RecentFood(*key, logged_food_item.quantity, count, last_logged))
+
+    if count >= RECENT_FOODS_MAX_COUNT:
+        foods = [food._replace(count=max(1, food.count // 2)) for food in foods]
+    foods.sort(key=lambda food: (food.count, food.last_logged), reverse=True)
+    if len(foods) > RECENT_FOODS_SIZE:
+        # Drop the least logged food, but not the one that was just logged
+        # (it's last if it was logged for an earlier date)
+        evict = -1 if (foods[-1].food_item_id, foods[-1].unit_id) != key else -2
+        del foods[evict]
+    return foods
+
+
+def get_food_history(user_id):
+    """Get a queryset of the user's last RECENT_FOODS_HISTORY logged food items, newest first."""
+    return (LoggedFoodItem.objects
+            .filter(user_id=user_id)
+            .order_by("-date", "-id")
+            .only("id", "date", "food_item_id", "unit_id", "quantity")
+            [:RECENT_FOODS_HISTORY])
+
+
+def build_recent_foods(user_id):
+    """Build a user's list by replaying their last logged food items, oldest first (one query)."""
+    recent_foods = []
+    for logged_food_item in reversed(get_food_history(user_id)):
+        recent_foods = add_logged_food(recent_foods, logged_food_item)
+    return recent_foods
+
+
+def get_recent_foods(user_id):
+    """Get a user's list of RecentFoods, rebuilding it if it isn't cached."""
+    return cache.get_or_set(get_cache_key(user_id), lambda: build_recent_foods(user_id),
+                            timeout=RECENT_FOODS_CACHE_TIMEOUT)
+
+
+def get_recent_food_choices(user_id, limit=RECENT_FOODS_SHOWN):
+    """
+    Get the foods to offer a user for one-tap logging, as RecentFoodChoices.
+    Their units are loaded in one query (none if the user hasn't logged
+    anything), and foods whose unit was deleted are skipped.
+    """
+    recent_foods = get_recent_foods(user_id)
+    if not recent_foods:
+        return []
+    units = (Unit.objects.select_related("food_item__user")
+             .in_bulk([food.unit_id for food in recent_foods]))
+    choices = []
+    for food in recent_foods:
+        unit = units.get(food.unit_id)
+        if unit is not None and unit.food_item_id == food.food_item_id:
+            choices.append(RecentFoodChoice(unit, food.quantity, food.count))
+            if len(choices) == limit:
+                break
+    return choices
@@ -0,0 +1,176 @@
+"""
+Search for food items by name and producer, for the food item picker's
+autocomplete (see views.food_item_search). Each word of the query matches
+the start of a word in the name or producer (ex: "chi bre" finds "Chicken
+breast, Tyson").
+
+The search uses whatever index the database has (see migration
+0010_food_item_search):
+- SQLite: an FTS5 table with prefix indexes, kept in sync with the food
+  items by triggers (recreated after migrations, see
+  restore_sqlite_search_triggers)
+- PostgreSQL: pg_trgm GIN indexes on name and producer, searched by word
+  similarity, so small typos still match
+- Anything else (or SQLite without FTS5): FOOD_SEARCH_INDEX, a sorted list
+  of every word, loaded once per process like the other reference data
+"""
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+from commons.registry import ReferenceData
+from .models import FoodItem
+
+
+# Most food items a search returns
+FOOD_SEARCH_LIMIT = 20
+# Name of SQLite's FTS5 table of food items
+FTS_TABLE = "nutrition_log_fooditem_fts"
+# Triggers that keep the FTS5 table in sync with nutrition_log_fooditem, by
+# name (the same ones that migration 0010_food_item_search creates)
+FTS_TRIGGERS = {
+    f"{FTS_TABLE}_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON nutrition_log_fooditem BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, producer) VALUES (new.id, new.name, new.producer);
+        END
+    """,
+    f"{FTS_TABLE}_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON nutrition_log_fooditem BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, producer)
+                VALUES ('delete', old.id, old.name, old.producer);
+        END
+    """,
+    f"{FTS_TABLE}_update": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON nutrition_log_fooditem BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, producer)
+                VALUES ('delete', old.id, old.name, old.producer);
+            INSERT INTO {FTS_TABLE}(rowid, name, producer) VALUES (new.id, new.name, new.producer);
+        END
+    """,
+}
+
+# - words: sorted list of (word, food item id), for every word of every
+#   food item's name and producer
+# - names: dictionary that maps food item ids to their names
+FoodSearchIndex = namedtuple("FoodSearchIndex", ["words", "names"])
+
+
+def get_words(text):
+    """Split text into lowercase words, the way the search indexes do."""
+    return re.findall(r"\w+", text.lower())
+
+
+def build_food_search_index():
+    """Build a FoodSearchIndex from the database (one query)."""
+    words = []
+    names = dict()
+    for food_item_id, name, producer in FoodItem.objects.values_list("id", "name", "producer"):
+        names[food_item_id] = name
+        words.extend((word, food_item_id) for word in set(get_words(f"{name} {producer}")))
+    words.sort()
+    return FoodSearchIndex(words, names)
+
+
+FOOD_SEARCH_INDEX = ReferenceData("nutrition_log.food_search_index", build_food_search_index)
+
+
+def search_food_items(query, limit=FOOD_SEARCH_LIMIT):
+    """
+    Get up to limit food items that match the query, best matches first,
+    with their users loaded. Costs two queries (one with the in-memory
+    index, once it's loaded).
+    """
+    words = get_words(query)
+    if len(words) == 0:
+        return []
+    if connection.vendor == "postgresql":
+        ids = search_postgresql(" ".join(words), limit)
+    elif connection.vendor == "sqlite" and has_sqlite_search_index():
+        ids = search_sqlite(words, limit)
+    else:
+        ids = search_in_memory(words, limit)
+    food_items = FoodItem.objects.select_related("user").in_bulk(ids)
+    return [food_items[food_item_id] for food_item_id in ids if food_item_id in food_items]
+
+
+@lru_cache(maxsize=None)
+def has_sqlite_search_index():
+    """Check if the SQLite database has the FTS5 table (it needs SQLite with FTS5)."""
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def restore_sqlite_search_triggers(using="default"):
+    """
+    Recreate the FTS5 table's triggers if they're missing, and reindex the
+    food items if any were. SQLite drops a table's triggers when Django
+    remakes the table (ex: to alter one of its fields), so a migration on
+    FoodItem would otherwise leave the search silently stale. Does nothing
+    if the database isn't SQLite or has no FTS5 table. Returns the names of
+    the recreated triggers.
+    """
+    if connections[using].vendor != "sqlite":
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = %s)",
+                       [FTS_TABLE, FoodItem._meta.db_table])
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            return []
+        missing = [name for name in FTS_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(FTS_TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        return missing
+
+
+def search_sqlite(words, limit):
+    """Get the ids of the best matches from the FTS5 table. Each word is a prefix query."""
+    match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_postgresql(query, limit):
+    """Get the ids of the best matches by trigram word similarity, using the GIN indexes."""
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    similarity = Greatest(TrigramWordSimilarity(query, "name"), TrigramWordSimilarity(query, "producer"))
+    matches = (FoodItem.objects
+               .filter(Q(name__trigram_word_similar=query) | Q(producer__trigram_word_similar=query))
+               .annotate(similarity=similarity)
+               .order_by("-similarity", "name", "id"))
+    return list(matches.values_list("id", flat=True)[:limit])
+
+
+def search_in_memory(words, limit):
+    """
+    Get the ids of the best matches from FOOD_SEARCH_INDEX. Names that start
+    with the first word come first, then shorter names.
+    """
+    index = FOOD_SEARCH_INDEX.get()
+    ids = None
+    for word in words:
+        matches = set()
+        i = bisect_left(index.words, (word,))
+        while i < len(index.words) and index.words[i][0].startswith(word):
+            matches.add(index.words[i][1])
+            i += 1
+        ids = matches if ids is None else ids & matches
+        if not ids:
+            return []
+
+    def rank(food_item_id):
+        name = index.names[food_item_id]
+        return (not name.lower().startswith(words[0]), len(name), name, food_item_id)
+
+    return sorted(ids, key=rank)[:limit]
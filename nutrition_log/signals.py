@@ -0,0 +1,97 @@
+"""
+Signal handlers for the Nutrition Log app.
+- Keep each user's daily nutrition summaries in sync with their logged food
+  items. Only the affected day is recalculated, so a save costs a couple of
+  queries no matter how much the user has logged.
+- Invalidate the in-memory food search index when food items change.
+- Bump the user's data versions, so their charts (and recent foods, see
+  recent.py) are rebuilt when their daily weights or logged food change.
+- Recreate the SQLite food search triggers after migrations, in case one of
+  them remade the food item table.
+"""
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from commons.charts import FOOD, WEIGHTS, bump_data_version
+from .models import DailyWeight, FoodItem, LoggedFoodItem, Unit
+from .search import FOOD_SEARCH_INDEX, restore_sqlite_search_triggers
+from .stats import refresh_daily_summary
+
+
+@receiver(pre_save, sender=LoggedFoodItem)
+def remember_previous_day(sender, instance, **kwargs):
+    """
+    If an existing logged food item is being moved to another day or user,
+    remember the day it's leaving so that day's summary can be refreshed too.
+    """
+    instance._previous_summary_key = None
+    if instance.pk is None:
+        return
+    previous = (LoggedFoodItem.objects.filter(pk=instance.pk)
+                .values_list("user_id", "date")
+                .first())
+    if previous is not None and previous != (instance.user_id, instance.date):
+        instance._previous_summary_key = previous
+
+
+@receiver(post_save, sender=LoggedFoodItem)
+def update_summary_on_save(sender, instance, raw=False, **kwargs):
+    """Refresh the summary for the day this logged food item is on."""
+    if raw or instance.user_id is None:
+        return
+    previous = getattr(instance, "_previous_summary_key", None)
+    if previous is not None and previous[0] is not None:
+        refresh_daily_summary(*previous)
+        bump_data_version(previous[0], FOOD)
+    refresh_daily_summary(instance.user_id, instance.date)
+    bump_data_version(instance.user_id, FOOD)
+
+
+@receiver(post_delete, sender=LoggedFoodItem)
+def update_summary_on_delete(sender, instance, **kwargs):
+    """Refresh the summary for the day this logged food item was on."""
+    if instance.user_id is None:
+        return
+    refresh_daily_summary(instance.user_id, instance.date)
+    bump_data_version(instance.user_id, FOOD)
+
+
+@receiver(post_save, sender=Unit)
+def update_summaries_for_unit(sender, instance, created=False, raw=False, **kwargs):
+    """
+    If a unit's calories or macros change, every day that logged food with
+    this unit is out of date. New units can't have been logged yet.
+    """
+    if raw or created:
+        return
+    days = (LoggedFoodItem.objects.filter(unit=instance)
+            .exclude(user=None)
+            .values_list("user_id", "date")
+            .distinct())
+    user_ids = set()
+    for user_id, date in days:
+        refresh_daily_summary(user_id, date)
+        user_ids.add(user_id)
+    for user_id in user_ids:
+        bump_data_version(user_id, FOOD)
+
+
+@receiver(post_save, sender=DailyWeight)
+@receiver(post_delete, sender=DailyWeight)
+def update_weights_version(sender, instance, **kwargs):
+    """Bump the user's weights version when a daily weight changes."""
+    bump_data_version(instance.user_id, WEIGHTS)
+
+
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+def reset_food_search_index(sender, **kwargs):
+    """Reset the in-memory food search index (see search.py)."""
+    FOOD_SEARCH_INDEX.invalidate()
+
+
+@receiver(post_migrate)
+def restore_food_search_triggers(sender, using, **kwargs):
+    """Recreate the FTS5 table's triggers if a migration dropped them (see search.py)."""
+    if sender.name == "nutrition_log":
+        restore_sqlite_search_triggers(using)
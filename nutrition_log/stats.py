@@ -0,0 +1,242 @@
+"""
+Nutrition stats for the Nutrition Log app.
+Calories and macros are calculated by the database (quantity x the unit's
+per-unit value) instead of looping through logged food items in Python, so
+the stats for a day, or for a whole range of days, cost a single query.
+
+Daily totals are also stored in DailyNutritionSummary rows, which are
+maintained here whenever logged food items change (see signals.py). Pages
+that only need daily totals read one summary row per day.
+
+Functions that async views use have async versions with an "a" prefix (like
+Django's async ORM methods), ex: aget_daily_nutrition.
+"""
+import asyncio
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import DailyNutritionSummary, DailyWeight, LoggedFoodItem
+
+
+# Total calories and macros for a group of logged food items (ex: one day)
+NutritionTotals = namedtuple("NutritionTotals", ["calories", "protein", "carbs", "fats"])
+
+# Stats for one day:
+# - items: logged food items, annotated with calories, protein, carbs, fats
+# - strings: logged food item strings that can be rendered in HTML later
+# - totals: NutritionTotals for the day
+DailyNutrition = namedtuple("DailyNutrition", ["items", "strings", "totals"])
+
+# Report for a range of dates. Lists are parallel to dates:
+# - dates: every date in the range (inclusive)
+# - weights: daily weight for each date, or '---' if there is none
+# - calories: total calories for each date (0 if nothing was logged)
+# - avg_weight: average of the weights that were logged
+# - avg_calories: average calories of the dates that had food logged
+RangeReport = namedtuple(
+    "RangeReport", ["dates", "weights", "calories", "avg_weight", "avg_calories"]
+)
+
+EMPTY_TOTALS = NutritionTotals(0, 0, 0, 0)
+
+
+def annotate_nutrition(logged_food_items):
+    """
+    Annotate a queryset of logged food items with their calories, protein,
+    carbs, and fats. The food item and unit are fetched in the same query.
+    """
+    return logged_food_items.select_related("food_item", "unit").annotate(
+        calories=F("quantity") * F("unit__calsPerUnit"),
+        protein=F("quantity") * F("unit__proPerUnit"),
+        carbs=F("quantity") * F("unit__carbsPerUnit"),
+        fats=F("quantity") * F("unit__fatsPerUnit"),
+    )
+
+
+def get_daily_nutrition(user, date):
+    """Get the DailyNutrition for this user's logged food items on this date."""
+    return make_daily_nutrition(list(get_daily_items(user, date)))
+
+
+async def aget_daily_nutrition(user, date):
+    """Async version of get_daily_nutrition."""
+    return make_daily_nutrition([lfi async for lfi in get_daily_items(user, date)])
+
+
+def get_daily_items(user, date):
+    """Get a queryset of this user's logged food items on this date, annotated with their nutrition."""
+    return annotate_nutrition(LoggedFoodItem.objects.filter(user=user, date=date)).order_by("id")
+
+
+def make_daily_nutrition(items):
+    """Make a DailyNutrition from a day's annotated logged food items."""
+    strings = [
+        f"{lfi} | {lfi.calories} Calories | {lfi.protein}g Protein" for lfi in items
+    ]
+    totals = NutritionTotals(
+        sum(lfi.calories for lfi in items),
+        sum(lfi.protein for lfi in items),
+        sum(lfi.carbs for lfi in items),
+        sum(lfi.fats for lfi in items),
+    )
+    return DailyNutrition(items, strings, totals)
+
+
+def get_daily_totals(user, start_date=None, end_date=None):
+    """
+    Get this user's NutritionTotals for each date they logged food on,
+    between the start date and end date (inclusive). If no dates are given,
+    get totals for every date.
+    Return as a dictionary that maps dates to NutritionTotals, ordered by date.
+    Dates without any logged food items are not included.
+    Totals are read from the user's daily summaries, one row per date.
+    """
+    rows = get_daily_totals_rows(user, start_date, end_date)
+    return {date: NutritionTotals(*totals) for date, *totals in rows}
+
+
+async def aget_daily_totals(user, start_date=None, end_date=None):
+    """Async version of get_daily_totals."""
+    rows = get_daily_totals_rows(user, start_date, end_date)
+    return {date: NutritionTotals(*totals) async for date, *totals in rows}
+
+
+def get_daily_totals_rows(user, start_date, end_date):
+    """Get a queryset of (date, calories, protein, carbs, fats) rows for get_daily_totals."""
+    summaries = DailyNutritionSummary.objects.filter(user=user)
+    if start_date is not None:
+        summaries = summaries.filter(date__gte=start_date)
+    if end_date is not None:
+        summaries = summaries.filter(date__lte=end_date)
+    return summaries.order_by("date").values_list("date", "calories", "protein", "carbs", "fats")
+
+
+def summarize_logged_food_items(logged_food_items):
+    """
+    Group a queryset of logged food items by user and date.
+    Return a values queryset with the user, date, calories, protein, carbs,
+    fats, and item count of each group.
+    """
+    return (logged_food_items.values("user", "date")
+            .annotate(
+                calories=Sum(F("quantity") * F("unit__calsPerUnit")),
+                protein=Sum(F("quantity") * F("unit__proPerUnit")),
+                carbs=Sum(F("quantity") * F("unit__carbsPerUnit")),
+                fats=Sum(F("quantity") * F("unit__fatsPerUnit")),
+                item_count=Count("id"),
+            )
+            .order_by("user", "date"))
+
+
+def refresh_daily_summary(user_id, date):
+    """
+    Recalculate the user's summary for this date from their logged food
+    items. The summary is removed if there's nothing logged on this date.
+    """
+    rows = summarize_logged_food_items(
+        LoggedFoodItem.objects.filter(user_id=user_id, date=date)
+    )
+    row = rows.first()
+    if row is None:
+        DailyNutritionSummary.objects.filter(user_id=user_id, date=date).delete()
+        return
+
+    DailyNutritionSummary.objects.update_or_create(
+        user_id=user_id,
+        date=date,
+        defaults={
+            "calories": row["calories"],
+            "protein": row["protein"],
+            "carbs": row["carbs"],
+            "fats": row["fats"],
+            "item_count": row["item_count"],
+        },
+    )
+
+
+def rebuild_daily_summaries(user=None):
+    """
+    Rebuild daily summaries from scratch for this user, or for every user if
+    no user is given. Return the number of summaries created.
+    """
+    logged_food_items = LoggedFoodItem.objects.exclude(user=None)
+    summaries = DailyNutritionSummary.objects.all()
+    if user is not None:
+        logged_food_items = logged_food_items.filter(user=user)
+        summaries = summaries.filter(user=user)
+
+    new_summaries = [
+        DailyNutritionSummary(
+            user_id=row["user"],
+            date=row["date"],
+            calories=row["calories"],
+            protein=row["protein"],
+            carbs=row["carbs"],
+            fats=row["fats"],
+            item_count=row["item_count"],
+        )
+        for row in summarize_logged_food_items(logged_food_items)
+    ]
+    with transaction.atomic():
+        summaries.delete()
+        DailyNutritionSummary.objects.bulk_create(new_summaries, batch_size=500)
+    return len(new_summaries)
+
+
+def get_weights_by_date(user, start_date, end_date):
+    """
+    Get this user's daily weights between the start date and end date
+    (inclusive). Return as a dictionary that maps dates to weights.
+    """
+    daily_weights = DailyWeight.objects.filter(user=user, date__range=[start_date, end_date])
+    return dict(daily_weights.values_list("date", "weight"))
+
+
+async def aget_weights_by_date(user, start_date, end_date):
+    """Async version of get_weights_by_date."""
+    daily_weights = DailyWeight.objects.filter(user=user, date__range=[start_date, end_date])
+    return {date: weight async for date, weight in daily_weights.values_list("date", "weight")}
+
+
+def get_range_report(user, dates):
+    """
+    Get a RangeReport for this user over these dates (a sorted list of
+    consecutive dates). Costs two queries no matter how many dates there are:
+    one for the daily weights and one for the daily summaries.
+    """
+    weights_by_date = get_weights_by_date(user, dates[0], dates[-1])
+    daily_totals = get_daily_totals(user, dates[0], dates[-1])
+    return make_range_report(dates, weights_by_date, daily_totals)
+
+
+async def aget_range_report(user, dates):
+    """Async version of get_range_report. Its two queries are independent, so they're awaited together."""
+    weights_by_date, daily_totals = await asyncio.gather(
+        aget_weights_by_date(user, dates[0], dates[-1]),
+        aget_daily_totals(user, dates[0], dates[-1]),
+    )
+    return make_range_report(dates, weights_by_date, daily_totals)
+
+
+def make_range_report(dates, weights_by_date, daily_totals):
+    """
+    Make a RangeReport from a user's weights and daily totals over these dates.
+    - weights_by_date: dictionary that maps dates to weights
+    - daily_totals: dictionary that maps dates to NutritionTotals
+    """
+    weights = [weights_by_date.get(date, "---") for date in dates]
+    calories = [daily_totals.get(date, EMPTY_TOTALS).calories for date in dates]
+
+    avg_weight = 0
+    if weights_by_date:
+        avg_weight = sum(weights_by_date.values()) / len(weights_by_date)
+
+    # Days the user hasn't logged don't count towards the average
+    logged_calories = [cals for cals in calories if cals != 0]
+    avg_calories = 0
+    if logged_calories:
+        avg_calories = sum(logged_calories) / len(logged_calories)
+
+    return RangeReport(dates, weights, calories, avg_weight, avg_calories)
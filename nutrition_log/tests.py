@@ -1,3 +1,606 @@
-from django.test import TestCase
+import datetime
+import io
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+
+from commons.testing import QueryBudgetMixin, QueryPlanMixin, seed_user
+from .forms import LogFoodItemForm
+from .models import DailyNutritionSummary, DailyWeight, FoodItem, Goals, LoggedFoodItem, Unit
+from .recent import (
+    RECENT_FOODS_SIZE, RecentFood, add_logged_food, get_food_history, get_recent_food_choices,
+    get_cache_key, get_recent_foods
+)
+from .search import (
+    FTS_TABLE, FTS_TRIGGERS, get_words, has_sqlite_search_index, restore_sqlite_search_triggers,
+    search_food_items, search_in_memory
+)
+from .stats import (
+    NutritionTotals, aget_range_report, get_daily_nutrition, get_daily_totals, get_range_report,
+    rebuild_daily_summaries
+)
+
+
+class UserDateIndexTests(QueryPlanMixin, TestCase):
+    """The hot queries on logged food items and daily weights use user + date indexes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("eater")
+        self.date = datetime.date(2023, 11, 1)
+
+    def test_days_food_uses_user_date_index(self):
+        items = LoggedFoodItem.objects.filter(user=self.user, date=self.date).order_by("id")
+        self.assertUsesIndex(items, "loggedfooditem_user_date_idx")
+
+    def test_food_history_uses_user_date_index(self):
+        self.assertUsesIndex(get_food_history(self.user.id), "loggedfooditem_user_date_idx")
+
+    def test_weights_use_unique_user_date_index(self):
+        weights = DailyWeight.objects.filter(
+            user=self.user, date__range=[self.date - datetime.timedelta(days=6), self.date]
+        )
+        self.assertUsesIndex(weights, self.get_index_name(DailyWeight, ["user_id", "date"]))
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Each Nutrition Log view makes a fixed number of queries for a user with
+    years of logged food and weights. A view that starts querying per
+    logged food item or per date goes over its budget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_user()
+        cls.lfi = LoggedFoodItem.objects.filter(user=cls.user).latest("date", "id")
+        cls.date = cls.lfi.date
+        cls.date_args = [cls.date.year, cls.date.month, cls.date.day]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_index(self):
+        self.assertQueryBudget(5, reverse("nutrition_log:index"))
+
+    def test_daily(self):
+        self.assertQueryBudget(4, reverse("nutrition_log:daily") + f"?selectedDate={self.date}")
+
+    def test_set_weight(self):
+        self.assertQueryBudget(2, reverse("nutrition_log:set_weight", args=self.date_args))
+
+    def test_save_weight(self):
+        self.assertQueryBudget(4, reverse("nutrition_log:set_weight", args=self.date_args),
+                               method="post", data={"weight": 181}, status=302)
+
+    def test_log_food_item(self):
+        self.assertQueryBudget(4, reverse("nutrition_log:log_food_item", args=self.date_args))
+
+    def test_log_food_item_with_cached_recent_foods(self):
+        url = reverse("nutrition_log:log_food_item", args=self.date_args)
+        self.client.get(url)
+        # The session, user, and the recent foods' units: the list is cached
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertTrue(response.context["recent_foods"])
+
+    def test_save_logged_food_item(self):
+        data = {"food_item": self.lfi.food_item_id, "unit": self.lfi.unit_id, "quantity": 2, "submit": ""}
+        self.assertQueryBudget(10, reverse("nutrition_log:log_food_item", args=self.date_args),
+                               method="post", data=data, status=302)
+
+    def test_food_item_search(self):
+        # Includes checking for the search index, once per process
+        self.assertQueryBudget(5, reverse("nutrition_log:food_item_search") + "?q=pro")
+
+    def test_food_item_units(self):
+        self.assertQueryBudget(3, reverse("nutrition_log:food_item_units", args=[self.lfi.food_item_id]))
+
+    def test_edit_logged_food_item(self):
+        self.assertQueryBudget(6, reverse("nutrition_log:edit_logged_food_item", args=[self.lfi.id]))
+
+    def test_delete_logged_food_item(self):
+        self.assertQueryBudget(11, reverse("nutrition_log:delete_logged_food_item", args=[self.lfi.id]),
+                               status=302)
+
+    def test_weekly_over_a_year(self):
+        start_date = self.date - datetime.timedelta(days=365)
+        url = reverse("nutrition_log:weekly") + f"?startDate={start_date}&endDate={self.date}"
+        self.assertQueryBudget(4, url)
+
+    def test_charts(self):
+        self.assertQueryBudget(2, reverse("nutrition_log:charts"))
+
+    def test_weight_chart(self):
+        self.assertQueryBudget(3, reverse("nutrition_log:create_weight_chart"))
+
+    def test_calories_chart(self):
+        self.assertQueryBudget(3, reverse("nutrition_log:create_calories_chart"))
+
+    def test_set_target_calories(self):
+        self.assertQueryBudget(2, reverse("nutrition_log:set_target_calories"))
+
+
+class FoodItemSearchTests(TestCase):
+    """The food item search, and the food item and unit pickers that use it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("eater", password="password")
+        cls.chicken = FoodItem.objects.create(name="Chicken breast", producer="Tyson")
+        cls.chickpeas = FoodItem.objects.create(name="Chickpeas", producer="Goya")
+        cls.rice = FoodItem.objects.create(name="Brown rice", producer="")
+        cls.chicken_unit = Unit.objects.create(name="100 g", calsPerUnit=165, proPerUnit=31, carbsPerUnit=0,
+                                               fatsPerUnit=4, food_item=cls.chicken)
+        cls.rice_unit = Unit.objects.create(name="1 cup", calsPerUnit=216, proPerUnit=5, carbsPerUnit=45,
+                                            fatsPerUnit=2, food_item=cls.rice)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, query):
+        response = self.client.get(reverse("nutrition_log:food_item_search"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [result["id"] for result in response.json()["results"]]
+
+    def test_words_match_prefixes_of_name_and_producer(self):
+        self.assertCountEqual(self.search("chi"), [self.chicken.id, self.chickpeas.id])
+        self.assertEqual(self.search("chi BRE"), [self.chicken.id])
+        self.assertEqual(self.search("tys"), [self.chicken.id])
+        self.assertEqual(self.search("rice"), [self.rice.id])
+        self.assertEqual(self.search("pasta"), [])
+        self.assertEqual(self.search("  "), [])
+
+    def test_search_sees_changed_food_items(self):
+        self.chickpeas.name = "Garbanzo beans"
+        self.chickpeas.save()
+        self.assertEqual(self.search("garb"), [self.chickpeas.id])
+        self.assertEqual(self.search("chickp"), [])
+        self.rice.delete()
+        self.assertEqual(self.search("rice"), [])
+
+    def test_in_memory_index_matches(self):
+        def search(query):
+            return search_in_memory(get_words(query), 20)
+        # Names that start with the first word come first, then shorter names
+        self.assertEqual(search("chi"), [self.chickpeas.id, self.chicken.id])
+        self.assertEqual(search("b"), [self.rice.id, self.chicken.id])
+        self.assertEqual(search("goya chick"), [self.chickpeas.id])
+        self.chicken.producer = "Perdue"
+        self.chicken.save()
+        self.assertEqual(search("tyson"), [])
+        self.assertEqual(search("perd"), [self.chicken.id])
+
+    def get_search_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                           [FoodItem._meta.db_table])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_migrations_leave_the_search_triggers(self):
+        if connection.vendor != "sqlite" or not has_sqlite_search_index():
+            self.skipTest("Needs SQLite with FTS5")
+        self.assertEqual(self.get_search_triggers(), set(FTS_TRIGGERS))
+        self.assertEqual(restore_sqlite_search_triggers(), [])
+
+    def test_missing_search_triggers_are_restored(self):
+        if connection.vendor != "sqlite" or not has_sqlite_search_index():
+            self.skipTest("Needs SQLite with FTS5")
+        # As if a migration had remade the food item table
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {FTS_TABLE}_update")
+        self.chickpeas.name = "Garbanzo beans"
+        self.chickpeas.save()
+        self.assertEqual(self.search("garb"), [])
+        self.assertEqual(restore_sqlite_search_triggers(), [f"{FTS_TABLE}_update"])
+        self.assertEqual(self.get_search_triggers(), set(FTS_TRIGGERS))
+        # The food items are reindexed
+        self.assertEqual(self.search("garb"), [self.chickpeas.id])
+        self.assertEqual(self.search("chickp"), [])
+
+    def test_search_results_have_users_loaded(self):
+        food_items = search_food_items("chicken")
+        with self.assertNumQueries(0):
+            self.assertEqual([f"{food_item}" for food_item in food_items], ["Chicken breast, Tyson"])
+
+    def test_food_item_units(self):
+        response = self.client.get(reverse("nutrition_log:food_item_units", args=[self.chicken.id]))
+        self.assertEqual(response.json(), {"units": [{"id": self.chicken_unit.id, "name": "100 g of Chicken breast, Tyson"}]})
+        response = self.client.get(reverse("nutrition_log:food_item_units", args=[self.chickpeas.id]))
+        self.assertEqual(response.json(), {"units": []})
+        # New units are offered right away, by every process
+        unit = Unit.objects.create(name="1 can", calsPerUnit=210, proPerUnit=12, carbsPerUnit=35,
+                                   fatsPerUnit=3, food_item=self.chickpeas)
+        response = self.client.get(reverse("nutrition_log:food_item_units", args=[self.chickpeas.id]))
+        self.assertEqual([u["id"] for u in response.json()["units"]], [unit.id])
+        form = LogFoodItemForm(data={"food_item": self.chickpeas.id, "unit": unit.id, "quantity": 1})
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_form_only_offers_the_food_items_units(self):
+        form = LogFoodItemForm(initial={"food_item": self.rice.id})
+        self.assertEqual([value for value, _ in form.fields["unit"].choices if value], [self.rice_unit.id])
+        html = form.as_p()
+        self.assertIn("Brown rice", html)
+        self.assertNotIn("Chickpeas", html)
+        self.assertNotIn("Chicken breast", html)
+
+    def test_form_rejects_another_food_items_unit(self):
+        form = LogFoodItemForm(data={"food_item": self.rice.id, "unit": self.chicken_unit.id, "quantity": 1})
+        self.assertFalse(form.is_valid())
+        self.assertIn("unit", form.errors)
+        form = LogFoodItemForm(data={"food_item": self.rice.id, "unit": self.rice_unit.id, "quantity": 1})
+        self.assertTrue(form.is_valid())
+
+
+class RecentFoodsTests(TestCase):
+    """Each user's recent and frequent foods, and logging them with one tap"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("eater", password="password")
+        cls.units = []
+        for i in range(3):
+            food_item = FoodItem.objects.create(name=f"Food {i}")
+            cls.units.append(Unit.objects.create(name="serving", calsPerUnit=100, proPerUnit=10,
+                                                 carbsPerUnit=10, fatsPerUnit=2, food_item=food_item))
+        cls.date = datetime.date(2023, 11, 1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def log(self, unit, quantity=1, date=None):
+        return LoggedFoodItem.objects.create(user=self.user, date=date or self.date, food_item=unit.food_item,
+                                             unit=unit, quantity=quantity, meal=1)
+
+    def get_unit_ids(self):
+        return [food.unit_id for food in get_recent_foods(self.user.id)]
+
+    def test_most_logged_then_most_recent_first(self):
+        self.log(self.units[0])
+        self.log(self.units[1])
+        self.log(self.units[1])
+        self.log(self.units[2])
+        self.assertEqual(self.get_unit_ids(), [self.units[1].id, self.units[2].id, self.units[0].id])
+
+    def test_list_is_cached_until_food_changes(self):
+        self.log(self.units[0])
+        self.assertEqual(self.get_unit_ids(), [self.units[0].id])
+        # Two logs with no read in between (ex: a sync and a page) are both counted
+        logged_food_item = self.log(self.units[1], quantity=3)
+        self.log(self.units[1], quantity=2)
+        recent_foods = get_recent_foods(self.user.id)
+        self.assertEqual([(food.unit_id, food.quantity, food.count) for food in recent_foods],
+                         [(self.units[1].id, 2, 2), (self.units[0].id, 1, 1)])
+        # Cached: only the data version is read
+        with self.assertNumQueries(0):
+            self.assertEqual(get_recent_foods(self.user.id), recent_foods)
+        # Edits and deletes change the list too
+        logged_food_item.food_item = self.units[2].food_item
+        logged_food_item.unit = self.units[2]
+        logged_food_item.save()
+        self.assertCountEqual(self.get_unit_ids(), [unit.id for unit in self.units])
+        logged_food_item.delete()
+        self.assertEqual([food.count for food in get_recent_foods(self.user.id)], [1, 1])
+
+    def test_list_is_bounded(self):
+        foods = []
+        for i in range(RECENT_FOODS_SIZE + 5):
+            foods = add_logged_food(foods, LoggedFoodItem(id=i, date=self.date, food_item_id=i, unit_id=i,
+                                                          quantity=1))
+            self.assertEqual(foods[0].unit_id, i)
+        self.assertEqual(len(foods), RECENT_FOODS_SIZE)
+
+    def test_choices_skip_deleted_units(self):
+        self.log(self.units[0])
+        recent_foods = get_recent_foods(self.user.id)
+        deleted = RecentFood(food_item_id=0, unit_id=0, quantity=1, count=5, last_logged=(self.date, 0))
+        cache.set(get_cache_key(self.user.id), [deleted, *recent_foods])
+        self.assertEqual([choice.unit.id for choice in get_recent_food_choices(self.user.id)], [self.units[0].id])
+
+    def test_one_tap_logging(self):
+        self.log(self.units[1], quantity=2.5)
+        url = reverse("nutrition_log:log_food_item", args=[self.date.year, self.date.month, self.date.day])
+        response = self.client.get(url)
+        self.assertContains(response, f'name="unit" value="{self.units[1].id}"')
+        data = {"food_item": self.units[1].food_item_id, "unit": self.units[1].id, "quantity": 2.5, "submit": ""}
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(get_recent_foods(self.user.id)[0].count, 2)
+
+
+class ChartCacheTests(TestCase):
+    """Charts are revalidated by ETag, and a change to their data changes the ETag."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("eater")
+        self.client.force_login(self.user)
+        self.unit = Unit.objects.order_by("id").first()
+        self.date = datetime.date(2023, 11, 1)
+        DailyWeight.objects.create(user=self.user, date=self.date, weight=180)
+
+    def get_chart(self, name, etag=None, status=200):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        response = self.client.get(reverse(f"nutrition_log:{name}"), **headers)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_unchanged_chart_is_not_modified(self):
+        etag = self.get_chart("create_weight_chart")["ETag"]
+        # Only the session and user are loaded
+        with self.assertNumQueries(2):
+            self.get_chart("create_weight_chart", etag, status=304)
+        # Without the ETag, the chart comes from the cache
+        with self.assertNumQueries(2):
+            response = self.get_chart("create_weight_chart")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_logging_weight_changes_weight_chart(self):
+        etag = self.get_chart("create_weight_chart")["ETag"]
+        calories_etag = self.get_chart("create_calories_chart")["ETag"]
+        DailyWeight.objects.create(user=self.user, date=self.date + datetime.timedelta(days=1), weight=181)
+        response = self.get_chart("create_weight_chart", etag)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "181")
+        # The calories chart doesn't depend on weights
+        self.get_chart("create_calories_chart", calories_etag, status=304)
+
+    def test_logging_food_changes_calories_chart(self):
+        etag = self.get_chart("create_calories_chart")["ETag"]
+        lfi = LoggedFoodItem.objects.create(user=self.user, date=self.date, food_item=self.unit.food_item,
+                                            unit=self.unit, quantity=1, meal=1)
+        etag = self.get_chart("create_calories_chart", etag)["ETag"]
+        lfi.delete()
+        self.assertNotEqual(self.get_chart("create_calories_chart", etag)["ETag"], etag)
+
+    def test_etag_is_per_user(self):
+        etag = self.get_chart("create_weight_chart")["ETag"]
+        other_user = User.objects.create_user("other")
+        self.client.force_login(other_user)
+        self.assertNotEqual(self.get_chart("create_weight_chart", etag)["ETag"], etag)
+
+
+class AsyncViewTests(TestCase):
+    """The async views work under the async client, logged in or not."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("eater")
+        cls.today = datetime.date.today()
+        unit = Unit.objects.filter(food_item__name="Protein").get()
+        Goals.objects.create(user=cls.user, target_calories=2500)
+        DailyWeight.objects.create(user=cls.user, date=cls.today, weight=180)
+        LoggedFoodItem.objects.create(user=cls.user, date=cls.today, food_item=unit.food_item, unit=unit,
+                                      quantity=30, meal=1)
+
+    def setUp(self):
+        self.async_client.force_login(self.user)
+
+    async def test_index(self):
+        response = await self.async_client.get(reverse("nutrition_log:index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["targetCals"], 2500)
+        self.assertEqual(response.context["weeklyAvg"], 180)
+        self.assertEqual(response.context["todaysCals"], 120)
+        self.assertEqual(response.context["todaysPro"], 30)
+
+    async def test_daily(self):
+        response = await self.async_client.get(reverse("nutrition_log:daily"), {"selectedDate": self.today})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["daily_weight"], 180)
+        self.assertEqual(response.context["total_calories"], 120)
+        self.assertContains(response, "Protein")
+
+    async def test_weekly(self):
+        start_date = self.today - datetime.timedelta(days=2)
+        response = await self.async_client.get(reverse("nutrition_log:weekly"),
+                                               {"startDate": start_date, "endDate": self.today})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["avgWt"], 180)
+        self.assertContains(response, str(self.today.day))
+        response = await self.async_client.get(reverse("nutrition_log:weekly"))
+        self.assertIn("alert", response.context)
+
+    async def test_logged_out(self):
+        client = AsyncClient()
+        for name in ["index", "daily", "weekly"]:
+            with self.subTest(name):
+                url = reverse(f"nutrition_log:{name}")
+                response = await client.get(url)
+                self.assertRedirects(response, f"{reverse('users:login')}?next={url}", fetch_redirect_response=False)
+
+
+class DailyNutritionSummaryTests(TestCase):
+    """The signal-maintained daily summaries always match a rebuild from scratch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("eater")
+        cls.other_user = User.objects.create_user("other")
+        food_item = FoodItem.objects.create(name="Oats")
+        cls.unit = Unit.objects.create(name="1 cup", calsPerUnit=300, proPerUnit=10, carbsPerUnit=54,
+                                       fatsPerUnit=5, food_item=food_item)
+        cls.date = datetime.date(2023, 11, 1)
+        cls.next_date = cls.date + datetime.timedelta(days=1)
+
+    def log(self, quantity, date=None, user=None):
+        return LoggedFoodItem.objects.create(user=user or self.user, date=date or self.date,
+                                             food_item=self.unit.food_item, unit=self.unit,
+                                             quantity=quantity, meal=1)
+
+    def get_summaries(self):
+        """Get every summary as a (username, date, calories, protein, carbs, fats, item count) tuple."""
+        return list(DailyNutritionSummary.objects.order_by("user__username", "date").values_list(
+            "user__username", "date", "calories", "protein", "carbs", "fats", "item_count"))
+
+    def assertSummaries(self, expected):
+        """Assert the summaries are as expected, and the same as rebuilt ones."""
+        self.assertEqual(self.get_summaries(), expected)
+        rebuild_daily_summaries()
+        self.assertEqual(self.get_summaries(), expected)
+
+    def test_create(self):
+        self.log(1)
+        self.log(0.5)
+        self.log(2, user=self.other_user)
+        self.assertSummaries([
+            ("eater", self.date, 450, 15, 81, 7.5, 2),
+            ("other", self.date, 600, 20, 108, 10, 1),
+        ])
+
+    def test_date_change_updates_both_days(self):
+        self.log(1)
+        moved = self.log(2)
+        self.log(1, date=self.next_date)
+        moved.date = self.next_date
+        moved.save()
+        self.assertSummaries([
+            ("eater", self.date, 300, 10, 54, 5, 1),
+            ("eater", self.next_date, 900, 30, 162, 15, 2),
+        ])
+        # Deleting the day's last item removes its summary
+        LoggedFoodItem.objects.get(user=self.user, date=self.date).delete()
+        self.assertSummaries([("eater", self.next_date, 900, 30, 162, 15, 2)])
+
+    def test_quantity_edit(self):
+        logged_food_item = self.log(1)
+        logged_food_item.quantity = 3
+        logged_food_item.save()
+        self.assertSummaries([("eater", self.date, 900, 30, 162, 15, 1)])
+
+    def test_delete(self):
+        self.log(1)
+        self.log(2).delete()
+        self.assertSummaries([("eater", self.date, 300, 10, 54, 5, 1)])
+        LoggedFoodItem.objects.get(user=self.user).delete()
+        self.assertSummaries([])
+
+    def test_unit_change_updates_every_day_that_used_it(self):
+        self.log(1)
+        self.log(2, date=self.next_date)
+        self.log(1, user=self.other_user)
+        self.unit.calsPerUnit = 150
+        self.unit.proPerUnit = 6
+        self.unit.save()
+        self.assertSummaries([
+            ("eater", self.date, 150, 6, 54, 5, 1),
+            ("eater", self.next_date, 300, 12, 108, 10, 1),
+            ("other", self.date, 150, 6, 54, 5, 1),
+        ])
+
+    def test_rebuild_command(self):
+        self.log(1)
+        self.log(1, user=self.other_user)
+        expected = self.get_summaries()
+        # Summaries that drifted (ex: food was bulk loaded, which skips signals)
+        DailyNutritionSummary.objects.update(calories=0)
+        DailyNutritionSummary.objects.create(user=self.user, date=self.next_date, calories=1)
+
+        call_command("rebuild_nutrition_summaries", "--user", "eater", stdout=io.StringIO())
+        self.assertEqual(self.get_summaries(), [expected[0], ("other", self.date, 0, 10, 54, 5, 1)])
+        out = io.StringIO()
+        call_command("rebuild_nutrition_summaries", stdout=out)
+        self.assertEqual(self.get_summaries(), expected)
+        self.assertIn("Rebuilt 2 daily nutrition summaries", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("rebuild_nutrition_summaries", "--user", "nobody")
+
+
+def sum_nutrition(logged_food_items):
+    """Add up logged food items' NutritionTotals in Python, one item at a time."""
+    calories = protein = carbs = fats = 0
+    for lfi in logged_food_items:
+        calories += lfi.quantity * lfi.unit.calsPerUnit
+        protein += lfi.quantity * lfi.unit.proPerUnit
+        carbs += lfi.quantity * lfi.unit.carbsPerUnit
+        fats += lfi.quantity * lfi.unit.fatsPerUnit
+    return NutritionTotals(calories, protein, carbs, fats)
+
+
+class NutritionStatsTests(TestCase):
+    """The database's nutrition stats match totals added up in Python."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("eater")
+        other_user = User.objects.create_user("other")
+        eggs = FoodItem.objects.create(name="Eggs")
+        rice = FoodItem.objects.create(name="Rice")
+        egg = Unit.objects.create(name="1 egg", calsPerUnit=70, proPerUnit=6, carbsPerUnit=0.5,
+                                  fatsPerUnit=5, food_item=eggs)
+        cup = Unit.objects.create(name="1 cup", calsPerUnit=205, proPerUnit=4.25, carbsPerUnit=44.5,
+                                  fatsPerUnit=0.5, food_item=rice)
+        gram = Unit.objects.create(name="1 g", calsPerUnit=1.25, proPerUnit=0.125, carbsPerUnit=0.25,
+                                   fatsPerUnit=0, food_item=rice)
+        cls.start = datetime.date(2023, 11, 1)
+        # (day, unit, quantity, meal): several meals on the first days, none on the third
+        logs = [
+            (0, egg, 3, 1), (0, cup, 1.5, 2), (0, gram, 150, 3), (0, egg, 1, 0),
+            (1, cup, 2, 2), (1, gram, 75, 3),
+            (3, egg, 2, 1),
+        ]
+        for day, unit, quantity, meal in logs:
+            for user in [cls.user, other_user]:
+                LoggedFoodItem.objects.create(user=user, date=cls.start + datetime.timedelta(days=day),
+                                              food_item=unit.food_item, unit=unit,
+                                              quantity=quantity, meal=meal)
+        cls.dates = [cls.start + datetime.timedelta(days=day) for day in range(5)]
+
+    def get_python_totals(self, date):
+        return sum_nutrition(LoggedFoodItem.objects.filter(user=self.user, date=date)
+                             .select_related("unit"))
+
+    def test_daily_nutrition(self):
+        for date in self.dates:
+            with self.subTest(date=date):
+                daily_nutrition = get_daily_nutrition(self.user, date)
+                self.assertEqual(daily_nutrition.totals, self.get_python_totals(date))
+                for lfi in daily_nutrition.items:
+                    self.assertEqual((lfi.calories, lfi.protein, lfi.carbs, lfi.fats),
+                                     tuple(sum_nutrition([lfi])))
+                self.assertEqual(len(daily_nutrition.strings), len(daily_nutrition.items))
+        self.assertEqual(len(get_daily_nutrition(self.user, self.start).items), 4)
+        self.assertEqual(get_daily_nutrition(self.user, self.dates[2]).totals, NutritionTotals(0, 0, 0, 0))
+
+    def test_daily_totals(self):
+        expected = {
+            date: self.get_python_totals(date) for date in self.dates
+            if LoggedFoodItem.objects.filter(user=self.user, date=date).exists()
+        }
+        self.assertEqual(list(expected), [self.dates[0], self.dates[1], self.dates[3]])
+        self.assertEqual(get_daily_totals(self.user), expected)
+        self.assertEqual(get_daily_totals(self.user, self.dates[1], self.dates[3]),
+                         {date: expected[date] for date in [self.dates[1], self.dates[3]]})
+
+    def test_range_report(self):
+        # Weights on the first and third days only (the third day has no food)
+        DailyWeight.objects.create(user=self.user, date=self.dates[0], weight=180.5)
+        DailyWeight.objects.create(user=self.user, date=self.dates[2], weight=179)
+        DailyWeight.objects.create(user=self.user, date=self.dates[4] + datetime.timedelta(days=1), weight=150)
+        calories = [self.get_python_totals(date).calories for date in self.dates]
+        self.assertEqual(calories.count(0), 2)
+
+        with self.assertNumQueries(2):
+            report = get_range_report(self.user, self.dates)
+        self.assertEqual(report.dates, self.dates)
+        self.assertEqual(report.weights, [180.5, "---", 179, "---", "---"])
+        self.assertEqual(report.calories, calories)
+        self.assertEqual(report.avg_weight, (180.5 + 179) / 2)
+        # Days with nothing logged don't count towards the average
+        self.assertEqual(report.avg_calories, sum(calories) / 3)
+
+    async def test_async_range_report_matches(self):
+        await DailyWeight.objects.acreate(user=self.user, date=self.dates[1], weight=181)
+        report = await aget_range_report(self.user, self.dates)
+        self.assertEqual(report, await sync_to_async(get_range_report)(self.user, self.dates))
+
+    def test_range_report_without_data(self):
+        dates = [self.start - datetime.timedelta(days=day) for day in range(3, 0, -1)]
+        report = get_range_report(self.user, dates)
+        self.assertEqual(report.weights, ["---"] * 3)
+        self.assertEqual(report.calories, [0] * 3)
+        self.assertEqual((report.avg_weight, report.avg_calories), (0, 0))
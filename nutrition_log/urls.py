@@ -13,6 +13,8 @@ urlpatterns = [
     path('set_weight/<int:year>/<int:month>/<int:day>/', views.set_weight, name='set_weight'),
     path('log_food_item/<int:year>/<int:month>/<int:day>/', views.log_food_item, name='log_food_item'),
     path('edit_logged_food_item/<int:lfi_id>/', views.edit_logged_food_item, name='edit_logged_food_item'),
+    path('food_items/search/', views.food_item_search, name='food_item_search'),
+    path('food_items/<int:food_item_id>/units/', views.food_item_units, name='food_item_units'),
     path('delete_logged_food_item/<int:lfi_id>/', views.delete_logged_food_item, name='delete_logged_food_item'),
     path('weekly/', views.weekly, name='weekly'),
     path('charts/', views.charts, name='charts'),
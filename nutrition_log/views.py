@@ -1,42 +1,68 @@
+import asyncio
 import datetime
 
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Avg
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
 import plotly.express as px
 
-from commons.views import get_date_url, get_selected_date, verify_user_is_owner
-from .forms import DailyWeightForm, LogFoodItemForm, TargetCaloriesForm
-from .models import DailyWeight, LoggedFoodItem, Unit
-
-
-UNITS = Unit.objects.all()
-
-
-@login_required
-def index(request):
+from commons.charts import (
+    FOOD, WEIGHTS, chart_etag, figure_to_json, get_cached_chart, get_data_version
+)
+from commons.views import async_login_required, get_date_url, get_selected_date, verify_user_is_owner
+from .forms import DailyWeightForm, LogFoodItemForm, TargetCaloriesForm, get_food_item_units
+from .models import DailyWeight, Goals, LoggedFoodItem
+from .recent import get_recent_food_choices
+from .search import search_food_items
+from .stats import (
+    EMPTY_TOTALS, aget_daily_nutrition, aget_daily_totals, aget_range_report, get_daily_nutrition,
+    get_daily_totals
+)
+
+
+@async_login_required
+async def index(request):
     """Load the summary/home page for the Nutrition Log"""
     # Info to get for the home page: target calories, weekly average body weight,
     #  target protein based on current weight.
-    targetCals = get_target_calories(request)
-    weeklyAvg = get_curr_weekly_weight(request)
+    # These don't depend on each other, so they're awaited together.
+    targetCals, weeklyAvg, todays = await asyncio.gather(
+        aget_target_calories(request.user),
+        aget_curr_weekly_weight(request.user),
+        aget_todays_totals(request.user),
+    )
     targetPro = get_target_protein(weeklyAvg)
-    
-    context = {'targetCals': targetCals, 'weeklyAvg': weeklyAvg, 'targetPro': targetPro}
+
+    context = {
+        'targetCals': targetCals,
+        'weeklyAvg': weeklyAvg,
+        'targetPro': targetPro,
+        'todaysCals': round(todays.calories, 2),
+        'todaysPro': round(todays.protein, 2),
+    }
     return render(request, "nutrition_log/index.html", context)
 
 
-def get_target_calories(request):
+async def aget_target_calories(user):
     """Get the user's target calories or return 0 if it's unspecified"""
-    try:
-        targetCals = request.user.goals.target_calories
-    except ObjectDoesNotExist:
-        targetCals = 0
-    return targetCals
+    goals = Goals.objects.filter(user=user).values_list("target_calories", flat=True)
+    targetCals = await goals.afirst()
+    return targetCals if targetCals is not None else 0
+
 
+async def aget_todays_totals(user):
+    """Get the user's total calories and macros for today (read from their daily summary)"""
+    today = datetime.date.today()
+    daily_totals = await aget_daily_totals(user, today, today)
+    return daily_totals.get(today, EMPTY_TOTALS)
 
-def get_curr_weekly_weight(request):
+
+async def aget_curr_weekly_weight(user):
     """
     Get the user's average body weight for the current week.
     Return 0 if the user hasn't logged anything.
@@ -45,10 +71,9 @@ def get_curr_weekly_weight(request):
     curr_weekday = curr_date.isoweekday()
     sunday = curr_date - datetime.timedelta(days=curr_weekday)
 
-    weekly_weights = DailyWeight.objects.filter(user=request.user).filter(
-        date__range=[f"{sunday}", f"{curr_date}"]
-    )
-    return round(get_avg_weight(weekly_weights), 2)
+    weekly_weights = DailyWeight.objects.filter(user=user, date__range=[sunday, curr_date])
+    avg_weight = (await weekly_weights.aaggregate(avg=Avg("weight")))["avg"]
+    return round(avg_weight or 0, 2)
 
 
 def get_target_protein(curr_weight):
@@ -81,22 +106,24 @@ def set_target_calories(request):
     return render(request, "nutrition_log/set_target_calories.html", context)
 
 
-@login_required
-def daily(request):
+@async_login_required
+async def daily(request):
     """Load the daily page for the Nutrition Log"""
     date = get_selected_date(request)
-    daily_wt = get_daily_weight(request, date)
-    lfis, lfi_strings, calories, protein = get_logged_food_items_stats(request, date)
+    daily_wt, stats = await asyncio.gather(
+        aget_daily_weight(request.user, date),
+        aget_daily_nutrition(request.user, date),
+    )
 
     # ZIP so both items can be access in the same loop in the template
-    lfi_info = zip(lfis, lfi_strings)
+    lfi_info = zip(stats.items, stats.strings)
 
     context = {
         "date": date,
         "daily_weight": daily_wt,
         "logged_food_items": lfi_info,
-        "total_calories": calories,
-        "total_protein": protein,
+        "total_calories": stats.totals.calories,
+        "total_protein": stats.totals.protein,
     }
     return render(request, "nutrition_log/daily.html", context)
 
@@ -107,21 +134,24 @@ def log_food_item(request, year, month, day):
     dt = datetime.date(year, month, day)
     if request.method == "POST":
         form = LogFoodItemForm(data=request.POST)
-        logged_food_item = form.save(commit=False)
-         # for now, we'll set meal=1 (breakfast) and won't worry about lunch, dinner, and snacks.
-        logged_food_item.meal = 1
-        logged_food_item.date = dt
-        logged_food_item.user = request.user
-        logged_food_item.save()
-
-        # if the user hits submit, redirect to nutrition log.
-        # if user hits submit + log again, this block is skipped
-        if "submit" in request.POST:
-            url = get_date_url('nutrition_log:daily', dt)
-            return redirect(url)
+        if form.is_valid():
+            logged_food_item = form.save(commit=False)
+             # for now, we'll set meal=1 (breakfast) and won't worry about lunch, dinner, and snacks.
+            logged_food_item.meal = 1
+            logged_food_item.date = dt
+            logged_food_item.user = request.user
+            logged_food_item.save()
+
+            # if the user hits submit, redirect to nutrition log.
+            # if user hits submit + log again, this block is skipped
+            if "submit" in request.POST:
+                url = get_date_url('nutrition_log:daily', dt)
+                return redirect(url)
     else:
         form = LogFoodItemForm()
-    context = {"form": form, "date": dt}
+    # The user's usual foods, which they can log again with one tap
+    recent_foods = get_recent_food_choices(request.user.id)
+    context = {"form": form, "date": dt, "recent_foods": recent_foods}
     return render(request, "nutrition_log/log_food_item.html", context)
 
 
@@ -144,6 +174,26 @@ def edit_logged_food_item(request, lfi_id):
     return render(request, 'nutrition_log/edit_logged_food_item.html', context)
 
 
+@login_required
+@require_GET
+def food_item_search(request):
+    """
+    Return the food items that match the search (?q=) as JSON, best matches
+    first, for the food item picker's autocomplete.
+    """
+    food_items = search_food_items(request.GET.get("q", "")[:100])
+    results = [{"id": food_item.id, "name": f"{food_item}"} for food_item in food_items]
+    return JsonResponse({"results": results})
+
+
+@login_required
+@require_GET
+def food_item_units(request, food_item_id):
+    """Return the units of a food item as JSON, for the unit picker"""
+    units = [{"id": unit.id, "name": f"{unit}"} for unit in get_food_item_units(food_item_id)]
+    return JsonResponse({"units": units})
+
+
 @login_required
 def delete_logged_food_item(request, lfi_id):
     """Delete this logged food item"""
@@ -191,50 +241,28 @@ def set_weight(request, year, month, day):
     return render(request, "nutrition_log/set_weight.html", context)
 
 
-def get_daily_weight(request, date):
+async def aget_daily_weight(user, date):
     """Get daily weight for the given date. Or return '---' if there is none."""
-    daily_weights = DailyWeight.objects.filter(user=request.user)
-    try:
-        daily_weight = daily_weights.get(date=date).weight
-    except ObjectDoesNotExist:
-        daily_weight = "---"
-    return daily_weight
+    daily_weights = DailyWeight.objects.filter(user=user, date=date).values_list("weight", flat=True)
+    daily_weight = await daily_weights.afirst()
+    return daily_weight if daily_weight is not None else "---"
 
 
 def get_logged_food_items_stats(request, date):
     """
-    Search through the user's logged food items for this date.
-    Return four things:
-        - list of logged food item objects
-        - list of logged food item strings that can be rendered in HTML later.
-        - total calories
-        - total protein
+    Get stats for the user's logged food items on this date.
+    Return a DailyNutrition with three things:
+        - items: logged food item objects, annotated with their calories,
+          protein, carbs, and fats
+        - strings: logged food item strings that can be rendered in HTML later.
+        - totals: total calories, protein, carbs, and fats
+    Everything is calculated in a single query (see stats.py).
     """
-    strings = []
-    calories_list = []
-    protein_list = []
-
-    logged_food_items = LoggedFoodItem.objects.filter(user=request.user).filter(date=date)
-    for logged_food_item in logged_food_items:
-        unit = UNITS.get(id=logged_food_item.unit.id)
-        quantity = logged_food_item.quantity
-
-        calories = quantity * unit.calsPerUnit
-        calories_list.append(calories)
-
-        protein = quantity * unit.proPerUnit
-        protein_list.append(protein)
-
-        lfi_str = f"{logged_food_item} | {calories} Calories | {protein}g Protein"
-        strings.append(lfi_str)
-    total_calories = sum(calories_list)
-    total_protein = sum(protein_list)
-
-    return logged_food_items, strings, total_calories, total_protein
+    return get_daily_nutrition(request.user, date)
 
 
-@login_required
-def weekly(request):
+@async_login_required
+async def weekly(request):
     """Load the weekly page"""
     start_date_str = request.GET.get("startDate")
     end_date_str = request.GET.get("endDate")
@@ -250,58 +278,19 @@ def weekly(request):
         return render(request, "nutrition_log/weekly.html", context)
 
     dates = get_list_of_dates(start_date_str, end_date_str)
-    actual_daily_weights = DailyWeight.objects.filter(user=request.user).filter(
-        date__range=[f"{start_date_str}", f"{end_date_str}"]
-    )
-    padded_daily_weights = get_padded_daily_weights(dates, actual_daily_weights)
-    avgWt = get_avg_weight(actual_daily_weights)
-    daily_calories = get_list_of_calories(request, dates)
-    avgCal = get_avg_calories(request, dates)  # Django doesn't like variable that start w avg_
+    report = await aget_range_report(request.user, dates)
 
     # zip these lists so they can be used more efficiently in the template
-    lists = zip(dates, padded_daily_weights, daily_calories)
+    lists = zip(report.dates, report.weights, report.calories)
     context = {
         "lists": lists,
-        "avgWt": round(avgWt, 2),
-        "avgCal": round(avgCal, 2),
+        # Django doesn't like variable that start w avg_
+        "avgWt": round(report.avg_weight, 2),
+        "avgCal": round(report.avg_calories, 2),
     }
     return render(request, "nutrition_log/weekly.html", context)
 
 
-def get_avg_weight(daily_weights):
-    """Get avg daily weight from a queryset of daily weights"""
-    if len(daily_weights) == 0:
-        return 0
-    sumWt = 0
-    for dw in daily_weights:
-        sumWt += dw.weight
-    return sumWt / len(daily_weights)
-
-
-def get_padded_daily_weights(dates, actual_daily_weights):
-    """
-    Get list of daily weights for these dates.
-    However, if there is a date without a weight, insert '---' as filler
-    """
-    return_weights = []
-    for date in dates:
-        try:
-            dw = actual_daily_weights.get(date=date)
-            return_weights.append(dw.weight)
-        except ObjectDoesNotExist:
-            return_weights.append("---")
-    return return_weights
-
-
-def get_list_of_calories(request, dates):
-    """Get a list of the user's calories for these dates"""
-    calories_list = []
-    for date in dates:
-        _,_, daily_calories, _ = get_logged_food_items_stats(request, date)
-        calories_list.append(daily_calories)
-    return calories_list
-
-
 def get_list_of_dates(start_date_str, end_date_str):
     """
     Get list of dates between the start date and end date (inclusive).
@@ -317,84 +306,93 @@ def get_list_of_dates(start_date_str, end_date_str):
     return dates
 
 
-def get_avg_calories(request, dates):
-    """Get average calories for these dates"""
-    total_cals = 0
-    count = 0  # needs to be tracked cause there are days the user hasn't logged
-    for date in dates:
-        _,_, daily_calories, _ = get_logged_food_items_stats(request, date)
-        if daily_calories != 0:
-            total_cals += daily_calories
-            count += 1
-    if count == 0:
-        return 0
-    return total_cals / count
-
-
 @login_required
 def charts(request):
     """Load the charts page"""
     return render(request, 'nutrition_log/charts.html')
 
 
-def create_chart(x_pts, y_pts, x_label, y_label, title, filepath):
+def create_chart(x_pts, y_pts, x_label, y_label, title):
     """
-    Create a line chart with the given data and filepath.
-    Note:
-    filepath arg is relative to 'balance/' 
-    while the arg for render() is relative to 'balance/nutrition_log/templates/'
+    Create a line chart with the given data.
+    Return the figure serialized as JSON, ready to be rendered by
+    nutrition_log/chart.html
     """
     fig = px.scatter(x=x_pts, y=y_pts, labels={"x": x_label, "y": y_label}, title=title)
     fig.update_layout(title=dict(font=dict(size=28)))
-    fig.write_html(file=f"nutrition_log/templates/{filepath}")
+    return figure_to_json(fig)
+
+
+def calories_chart_etag(request):
+    """ETag of the user's calories chart. Changes when they log food."""
+    user_id = request.user.id
+    return chart_etag(user_id, "calories", get_data_version(user_id, FOOD))
+
+
+def weight_chart_etag(request):
+    """ETag of the user's weight chart. Changes when they log a weight."""
+    user_id = request.user.id
+    return chart_etag(user_id, "weight", get_data_version(user_id, WEIGHTS))
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=calories_chart_etag)
 def create_calories_chart(request):
     """Create a daily calories vs time chart for the user, and load a page to display it"""
-    logged_food_items = LoggedFoodItem.objects.filter(user=request.user).order_by("date")
-    if len(logged_food_items) == 0:
+    figure_json = get_cached_chart(
+        calories_chart_etag(request), lambda: build_calories_chart(request.user)
+    )
+    if figure_json is None:
         alert = "You haven't logged any food items yet."
         context = {'alert': alert}
         return render(request, "nutrition_log/charts.html", context)
-    
-    # Get dates
-    dates = []
-    for lfi in logged_food_items:
-        if lfi.date not in dates:
-            dates.append(lfi.date)
-    # Get calories for each date
-    calories_list = []
-    for date in dates:
-        _,_, calories, _ = get_logged_food_items_stats(request, date=date)
-        calories_list.append(calories)
-
-    # Create and render chart
+    context = {'figure_json': figure_json}
+    return render(request, "nutrition_log/chart.html", context)
+
+
+def build_calories_chart(user):
+    """
+    Build the figure JSON of this user's daily calories vs time chart.
+    Return None if they haven't logged any food items.
+    """
+    # Get calories for each date the user logged food on (ordered by date)
+    daily_totals = get_daily_totals(user)
+    if len(daily_totals) == 0:
+        return None
+
+    dates = list(daily_totals.keys())
+    calories_list = [totals.calories for totals in daily_totals.values()]
     title = "Calorie Intake Over Time"
-    filename = f"charts/{request.user}-calories.html"
-    create_chart(dates, calories_list, 'Date', 'Daily Calories', title, filename)
-    return render(request, filename)
+    return create_chart(dates, calories_list, 'Date', 'Daily Calories', title)
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=weight_chart_etag)
 def create_weight_chart(request):
     """Create a weight vs time chart for the user, and load a page to display it"""
-    daily_weights = DailyWeight.objects.filter(user=request.user).order_by("date")
-    if len(daily_weights) == 0:
+    figure_json = get_cached_chart(
+        weight_chart_etag(request), lambda: build_weight_chart(request.user)
+    )
+    if figure_json is None:
         alert = "You haven't logged any daily weights yet."
         context = {'alert': alert}
         return render(request, "nutrition_log/charts.html", context)
+    context = {'figure_json': figure_json}
+    return render(request, "nutrition_log/chart.html", context)
+
+
+def build_weight_chart(user):
+    """
+    Build the figure JSON of this user's weight vs time chart.
+    Return None if they haven't logged any daily weights.
+    """
+    daily_weights = DailyWeight.objects.filter(user=user).order_by("date")
+    if len(daily_weights) == 0:
+        return None
 
     dates = [dw.date for dw in daily_weights]
     weights = [dw.weight for dw in daily_weights]
-    # harder approach that would be more ideal:
-    # create the line charts
-    # save as HTML
-    # get the div and put it inside charts?? IDK how to do this yet
-
-    # easier approach that is actually implemented:
-    # just do what the workout log does, and open the HTML directly.
     title = "Body Weight Over Time"
-    filename = f"charts/{request.user}-weight.html"
-    create_chart(dates, weights, 'Date', 'Weight', title, filename)
-    return render(request, filename)
+    return create_chart(dates, weights, 'Date', 'Weight', title)
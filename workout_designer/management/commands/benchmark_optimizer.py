@@ -0,0 +1,79 @@
+"""
+Benchmark the routine optimizers (see workout_designer/optimizer.py).
+Plans routines in memory (nothing is saved) for every split, schedule, and
+goal, and reports how long planning takes, how often days land inside the
+time window, and how even the weekly volume per muscle is.
+Usage:
+    python manage.py benchmark_optimizer
+    python manage.py benchmark_optimizer --optimizer random --runs 50
+"""
+from statistics import mean
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workout_designer.models import DayType, Routine
+from workout_designer.optimizer import OPTIMIZERS, get_volume_spread
+from workout_designer.views import create_days_for_routine, get_limits
+
+
+class Command(BaseCommand):
+    help = "Time the routine optimizers and check the routines they plan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--optimizer", choices=sorted(OPTIMIZERS), default="balanced")
+        parser.add_argument("--runs", type=int, default=20,
+                            help="Routines to plan for each split/schedule/goal")
+        parser.add_argument("--lower", type=int, default=45, help="Lower time limit (min)")
+        parser.add_argument("--upper", type=int, default=75, help="Upper time limit (min)")
+        parser.add_argument("--budget-ms", type=float, default=50,
+                            help="Fail if the slowest routine takes longer than this")
+
+    def handle(self, *args, **options):
+        optimizer = OPTIMIZERS[options["optimizer"]]
+        lower, upper = get_limits("0", str(options["lower"]), "0", str(options["upper"]))
+
+        timings = []
+        days_in_window = 0
+        training_days = 0
+        spreads = []
+        for split, _ in Routine.SPLIT_CHOICES:
+            for is_synchronous in (True, False):
+                for is_muscle_focused in (True, False):
+                    for _ in range(options["runs"]):
+                        routine = Routine(
+                            split=split,
+                            is_synchronous=is_synchronous,
+                            lower_limit_min=lower,
+                            upper_limit_min=upper,
+                            is_muscle_focused=is_muscle_focused,
+                        )
+                        start = time.perf_counter()
+                        days = create_days_for_routine(routine)
+                        planned = optimizer(routine, days)
+                        timings.append((time.perf_counter() - start) * 1000)
+
+                        for day, _ in planned:
+                            if day.day_type.name != DayType.REST:
+                                training_days += 1
+                                days_in_window += lower <= day.time_est_min <= upper
+                        spreads.append(get_volume_spread(routine, planned))
+
+        # The first routine also loads the reference data, so leave it out
+        timings = sorted(timings[1:])
+        slowest = timings[-1]
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f"Optimizer: {options['optimizer']}")
+        self.stdout.write(f"Routines planned: {len(timings) + 1}")
+        self.stdout.write(f"Time per routine: mean {mean(timings):.2f} ms, "
+                          f"p95 {p95:.2f} ms, max {slowest:.2f} ms")
+        self.stdout.write(f"Days inside the {lower}-{upper} min window: "
+                          f"{days_in_window}/{training_days}")
+        self.stdout.write(f"Weekly volume spread (std dev of sets per focus muscle): "
+                          f"mean {mean(spreads):.2f}")
+
+        if slowest > options["budget_ms"]:
+            raise CommandError(f"Slowest routine took {slowest:.2f} ms "
+                               f"(budget: {options['budget_ms']} ms)")
+        self.stdout.write(self.style.SUCCESS("Within budget"))
+
@@ -0,0 +1,88 @@
+"""
+Create a batch of routines for one or more users, with the same parameters.
+Planning is spread over a pool of processes, and everything is saved in one
+transaction (see create_routines in workout_designer/views.py).
+Usage:
+    python manage.py generate_routines alice bob --count 10
+    python manage.py generate_routines alice --count 500 --split PPL --goal fit --workers 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import multiprocessing
+import os
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from workout_designer.models import Routine
+from workout_designer.views import create_routines, get_limits, plan_routines
+
+
+# Fewest routines worth handing to a planning process. Starting a process
+# and setting up Django in it takes about as long as planning a few hundred
+# routines (a few ms each).
+ROUTINES_PER_WORKER = 500
+
+
+class Command(BaseCommand):
+    help = "Create a batch of routines for one or more users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="+", help="Users to create routines for")
+        parser.add_argument("--count", type=int, default=1, help="Routines per user")
+        parser.add_argument("--schedule", choices=["sync", "async"], default="sync")
+        parser.add_argument("--split", default="Anything",
+                            choices=["Anything"] + [split for split, _ in Routine.SPLIT_CHOICES])
+        parser.add_argument("--goal", choices=["muscle", "fit"], default="muscle")
+        parser.add_argument("--lower", type=int, default=0, help="Lower time limit (min)")
+        parser.add_argument("--upper", type=int, default=0, help="Upper time limit (min)")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Processes to plan the routines with")
+
+    def handle(self, *args, **options):
+        usernames = options["usernames"]
+        users = list(User.objects.filter(username__in=usernames).order_by("username"))
+        missing = set(usernames) - {user.username for user in users}
+        if missing:
+            raise CommandError(f"No such users: {', '.join(sorted(missing))}")
+        if options["count"] < 1:
+            raise CommandError("--count must be at least 1")
+
+        lower, upper = get_limits("0", str(options["lower"]), "0", str(options["upper"]))
+        start = time.perf_counter()
+        summaries = create_routines(
+            users, options["count"], options["schedule"], upper, lower, options["split"], options["goal"],
+            plan=partial(plan_routines_in_pool, workers=options["workers"]),
+        )
+        elapsed = time.perf_counter() - start
+
+        for summary in summaries:
+            self.stdout.write(f"{summary.id}\t{summary.username}\t{summary.name}\t"
+                              f"{summary.days} days\t{summary.planned_sets} exercises\t"
+                              f"avg {summary.avg_time_est_min:.1f} min")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(summaries)} routines for {len(users)} users in {elapsed:.2f} s"
+        ))
+
+
+def plan_routines_in_pool(routines, workers):
+    """
+    Plan routines like plan_routines, split over a pool of processes (no
+    more than there are CPUs, and only if each one gets enough routines).
+    Each process is started fresh and sets up Django on its own, so it never
+    shares this process's database connections (it opens its own to load
+    the reference data).
+    """
+    workers = min(workers, os.cpu_count() or 1, len(routines) // ROUTINES_PER_WORKER)
+    if workers <= 1:
+        return plan_routines(routines)
+
+    chunk_size = -(-len(routines) // workers)
+    chunks = [routines[i:i + chunk_size] for i in range(0, len(routines), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=django.setup) as executor:
+        # map() keeps the chunks in order
+        return [pair for chunk in executor.map(plan_routines, chunks) for pair in chunk]
@@ -105,7 +105,10 @@ class Day(models.Model):
     routine = models.ForeignKey(Routine, on_delete=models.CASCADE)
 
     def __str__(self) -> str:
-        if self.day_type == DayType.objects.get(name=DayType.REST):
+        # Day types are cached reference data, so this doesn't need a query
+        from .reference import DAY_TYPES
+        rest = DAY_TYPES.get().get(DayType.REST)
+        if rest is not None and self.day_type_id == rest.id:
             return self.name
         return f"{self.name} ({self.time_est_min} min.)"
 
@@ -0,0 +1,262 @@
+"""
+Optimizers that plan the sets for every day of a routine.
+An optimizer is a function that takes a routine and its (unsaved) days, and
+returns a list of (day, planned sets) pairs in the same order. It also sets
+each day's time estimate. Nothing is saved.
+
+Optimizers:
+- "random": keep adding random exercises for the day's muscles until the
+  lower time limit is crossed (the original Workout Designer behavior).
+- "balanced": greedy + local search. Each day is filled with exercises for
+  its least trained muscles (by weekly volume across the whole routine)
+  while staying inside the routine's time window. Then exercises are
+  swapped between muscles as long as it makes the weekly volume more even.
+
+settings.ROUTINE_OPTIMIZER picks the optimizer ("balanced" by default).
+Everything runs against cached reference data, so planning a routine
+doesn't query the database once the reference data is loaded.
+"""
+from random import choice, random, randrange, shuffle
+from statistics import pstdev
+
+from django.conf import settings
+
+from workout_log.reference import EXERCISES, MUSCLE_MAP, get_direct_exercise_ids
+from .models import DayType, PlannedSets
+from .reference import FOCII
+
+
+# Sets per planned exercise
+NUM_SETS = 3
+
+# Number of swaps the local search tries per routine
+LOCAL_SEARCH_STEPS = 300
+
+
+def estimate_time(exercise, num_sets):
+    """
+    Get very rough time estimate (min) using these rules:
+     Compound lifts require a 2 minute warmup, and take 3.5 minutes per set.
+     Isolation lifts require no warmup and take 2.5 minutes per set.
+     Might want to change this calculation later to reflect reps
+    """
+    if exercise.is_compound:
+        return 2 + num_sets * 3.5
+    return num_sets * 2.5
+
+
+def get_reps(routine):
+    """
+    Get random, even-numbered reps for a planned exercise.
+    Muscle focused routines use 6-12 reps. Fitness routines stay in the
+    8-12 range.
+    """
+    if routine.is_muscle_focused:
+        return randrange(6, 13, 2)
+    return randrange(8, 13, 2)
+
+
+def new_planned_sets(routine, day, exercise):
+    """Make an (unsaved) PlannedSets for this exercise on this day."""
+    ps = PlannedSets()
+    ps.day = day
+    ps.exercise = exercise
+    ps.num_sets = NUM_SETS
+    ps.reps = get_reps(routine)
+    ps.time_est_min = estimate_time(exercise, ps.num_sets)
+    return ps
+
+
+def plan_random(routine, days):
+    """Plan each day with random exercises until its lower time limit is crossed."""
+    return [(day, create_sets_for_day(routine, day)) for day in days]
+
+
+def create_sets_for_day(routine, day):
+    """
+    Plan random sets for this day, and set the day's time estimate.
+    Return a list of the planned sets.
+    """
+    planned_sets = []
+    if day.day_type.name == DayType.REST:
+        return planned_sets
+
+    # Get muscles that this day works.
+    # Shuffle so it's not hitting the same muscles in the same order every time.
+    muscles = list(FOCII.get().get(day.day_type.id, []))
+    shuffle(muscles)
+
+    exercises_by_id = EXERCISES.get().by_id
+
+    # Keep addings sets as long as we're in the time limits
+    curr_time_est = day.time_est_min
+    while muscles and curr_time_est < routine.lower_limit_min:
+        for muscle in muscles:
+            # get random exercise that targets this muscle
+            exercises = get_direct_exercise_ids(muscle)
+            ps = new_planned_sets(routine, day, exercises_by_id[choice(exercises)])
+            curr_time_est += ps.time_est_min
+            planned_sets.append(ps)
+
+            # need to break out of for loop so the while loop can break
+            if curr_time_est > routine.lower_limit_min:
+                break
+    day.time_est_min = curr_time_est
+    return planned_sets
+
+
+class BalancedPlan:
+    """
+    State of the "balanced" optimizer for one routine.
+    - volume: muscle id -> weekly composite volume (direct sets + 0.5 x
+      indirect sets, like the Volume Manager)
+    - plans: list of (day, planned sets, focus muscle of each planned set)
+    """
+
+    def __init__(self, routine, days):
+        self.routine = routine
+        self.exercises_by_id = EXERCISES.get().by_id
+        self.muscles_by_exercise = MUSCLE_MAP.get().muscles_by_exercise
+        self.focii = FOCII.get()
+        self.volume = dict()
+        self.plans = [(day, [], []) for day in days]
+
+        # Candidate exercises for each muscle, cheapest first
+        self.candidates = dict()
+        for day in days:
+            for muscle in self.focii.get(day.day_type.id, []):
+                if muscle not in self.candidates:
+                    exercises = [self.exercises_by_id[exercise_id]
+                                 for exercise_id in get_direct_exercise_ids(muscle)
+                                 if exercise_id in self.exercises_by_id]
+                    exercises.sort(key=lambda exercise: estimate_time(exercise, NUM_SETS))
+                    self.candidates[muscle] = exercises
+                    self.volume[muscle] = 0
+
+    def add_volume(self, exercise, sign):
+        """Add (sign=1) or remove (sign=-1) an exercise's sets from the weekly volume."""
+        for muscle, directly_targets in self.muscles_by_exercise.get(exercise.id, []):
+            amount = NUM_SETS if directly_targets else 0.5 * NUM_SETS
+            self.volume[muscle] = self.volume.get(muscle, 0) + sign * amount
+
+    def imbalance(self):
+        """Sum of squared differences from the mean weekly volume of the focus muscles."""
+        volumes = [self.volume[muscle] for muscle in self.candidates]
+        if not volumes:
+            return 0
+        mean = sum(volumes) / len(volumes)
+        return sum((v - mean) ** 2 for v in volumes)
+
+    def pick_exercise(self, muscle, max_time, exclude=()):
+        """
+        Pick a random exercise for this muscle that takes at most max_time.
+        Fitness routines prefer compound exercises, since they work more
+        muscles per minute. Return None if nothing fits.
+        """
+        fits = [exercise for exercise in self.candidates.get(muscle, [])
+                if estimate_time(exercise, NUM_SETS) <= max_time and exercise not in exclude]
+        if not fits:
+            return None
+        if not self.routine.is_muscle_focused:
+            compounds = [exercise for exercise in fits if exercise.is_compound]
+            if compounds:
+                fits = compounds
+        return choice(fits)
+
+    def fill_days(self):
+        """Greedy: fill each day with exercises for its least trained muscles."""
+        lower = self.routine.lower_limit_min
+        upper = self.routine.upper_limit_min
+        for day, planned_sets, targets in self.plans:
+            if day.day_type.name == DayType.REST:
+                continue
+            muscles = self.focii.get(day.day_type.id, [])
+            while day.time_est_min < lower:
+                # Least trained muscles first, random order for ties
+                order = sorted(muscles, key=lambda muscle: (self.volume[muscle], random()))
+                exercise = None
+                for muscle in order:
+                    exclude = [ps.exercise for ps in planned_sets]
+                    exercise = (self.pick_exercise(muscle, upper - day.time_est_min, exclude)
+                                or self.pick_exercise(muscle, upper - day.time_est_min))
+                    if exercise is not None:
+                        break
+                if exercise is None:
+                    # nothing fits in the time that's left
+                    break
+                ps = new_planned_sets(self.routine, day, exercise)
+                planned_sets.append(ps)
+                targets.append(muscle)
+                day.time_est_min += ps.time_est_min
+                self.add_volume(exercise, 1)
+
+    def improve(self, steps=LOCAL_SEARCH_STEPS):
+        """
+        Local search: try replacing a planned exercise with one for a less
+        trained muscle of the same day. Keep the swap if the weekly volume
+        gets more even and the day stays inside the time window.
+        """
+        lower = self.routine.lower_limit_min
+        upper = self.routine.upper_limit_min
+        training_days = [plan for plan in self.plans if plan[1]]
+        if not training_days:
+            return
+        score = self.imbalance()
+        for _ in range(steps):
+            day, planned_sets, targets = choice(training_days)
+            i = randrange(len(planned_sets))
+            old = planned_sets[i]
+            muscle = choice(self.focii.get(day.day_type.id, []))
+            if self.volume[muscle] >= self.volume[targets[i]]:
+                continue
+            time_without = day.time_est_min - old.time_est_min
+            exercise = self.pick_exercise(muscle, upper - time_without)
+            if exercise is None or time_without + estimate_time(exercise, NUM_SETS) < min(lower, day.time_est_min):
+                continue
+
+            self.add_volume(old.exercise, -1)
+            self.add_volume(exercise, 1)
+            new_score = self.imbalance()
+            if new_score < score:
+                score = new_score
+                ps = new_planned_sets(self.routine, day, exercise)
+                planned_sets[i] = ps
+                targets[i] = muscle
+                day.time_est_min = time_without + ps.time_est_min
+            else:
+                self.add_volume(exercise, -1)
+                self.add_volume(old.exercise, 1)
+
+
+def plan_balanced(routine, days):
+    """Plan every day of the routine with the greedy + local search optimizer."""
+    plan = BalancedPlan(routine, days)
+    plan.fill_days()
+    plan.improve()
+    return [(day, planned_sets) for day, planned_sets, _ in plan.plans]
+
+
+def get_volume_spread(routine, planned):
+    """
+    Get the standard deviation of the weekly composite volume of a planned
+    routine's focus muscles (lower is more even).
+    - planned: list of (day, planned sets) pairs, from an optimizer
+    """
+    plan = BalancedPlan(routine, [day for day, _ in planned])
+    for _, planned_sets in planned:
+        for ps in planned_sets:
+            plan.add_volume(ps.exercise, 1)
+    volumes = [plan.volume[muscle] for muscle in plan.candidates]
+    return pstdev(volumes) if volumes else 0
+
+
+OPTIMIZERS = {
+    "random": plan_random,
+    "balanced": plan_balanced,
+}
+
+
+def plan_routine(routine, days):
+    """Plan the sets for these days with the optimizer chosen in settings."""
+    optimizer = OPTIMIZERS[getattr(settings, "ROUTINE_OPTIMIZER", "balanced")]
+    return optimizer(routine, days)
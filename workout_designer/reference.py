@@ -0,0 +1,28 @@
+"""
+Reference data for the Workout Designer app (see commons/registry.py).
+Day types and focii are seeded by migrations and almost never change, so
+they're loaded once per process:
+- DAY_TYPES: dictionary that maps day type names (ex: DayType.PUSH) to
+  day types
+- FOCII: dictionary that maps day type ids to the ids of the muscles that
+  day type focuses on
+Signal handlers invalidate them when the underlying rows change (see
+signals.py).
+"""
+from commons.registry import ReferenceData
+from .models import DayType, Focus
+
+
+def load_focii():
+    """Load the muscle ids each day type focuses on (one query)."""
+    focii = dict()
+    for day_type_id, muscle_id in Focus.objects.order_by("id").values_list("day_type", "muscle"):
+        focii.setdefault(day_type_id, []).append(muscle_id)
+    return focii
+
+
+DAY_TYPES = ReferenceData(
+    "workout_designer.day_types",
+    lambda: {day_type.name: day_type for day_type in DayType.objects.order_by("id")},
+)
+FOCII = ReferenceData("workout_designer.focii", load_focii)
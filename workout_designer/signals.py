@@ -0,0 +1,24 @@
+"""
+Signal handlers for the Workout Designer app.
+Invalidate the cached reference data whenever the rows it is built from
+change (see reference.py).
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DayType, Focus
+from .reference import DAY_TYPES, FOCII
+
+
+@receiver(post_save, sender=DayType)
+@receiver(post_delete, sender=DayType)
+def reset_day_types(sender, **kwargs):
+    """Reset the day types when a day type changes."""
+    DAY_TYPES.invalidate()
+
+
+@receiver(post_save, sender=Focus)
+@receiver(post_delete, sender=Focus)
+def reset_focii(sender, **kwargs):
+    """Reset the focii when a focus changes."""
+    FOCII.invalidate()
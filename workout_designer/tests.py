@@ -1,3 +1,272 @@
+import io
+import random
+from statistics import mean
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+
+from commons.testing import QueryBudgetMixin
+from workout_log.models import Exercise
+from .models import Day, DayType, PlannedSets, Routine
+from .optimizer import BalancedPlan, estimate_time, get_volume_spread, plan_balanced, plan_random
+from .views import (
+    MAX_BATCH_ROUTINES, create_days_for_routine, create_routines, new_routine, plan_routines, save_routines
+)
+
+
+# A filled in routine form (see routine_fields.html)
+ROUTINE_FORM = {
+    "schedule": "sync",
+    "upperLimitHrs": "",
+    "upperLimitMin": "75",
+    "lowerLimitHrs": "",
+    "lowerLimitMin": "45",
+    "goal": "muscle",
+    "split": "Anything",
+}
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Each Workout Designer view makes a fixed number of queries, no matter
+    how many routines the user has or how big they are. A view that starts
+    querying per routine, day, or planned set goes over its budget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("planner", password="password")
+        create_routines([cls.user], 20, "sync", 75, 45, "Anything", "muscle")
+        cls.routine = Routine.objects.filter(user=cls.user).latest("id")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_index(self):
+        self.assertQueryBudget(5, reverse("workout_designer:index"))
+
+    def test_routine(self):
+        self.assertQueryBudget(6, reverse("workout_designer:routine", args=[self.routine.id]))
+
+    def test_create_workout_form(self):
+        self.assertQueryBudget(2, reverse("workout_designer:create_workout"))
+
+    def test_create_workout(self):
+        self.assertQueryBudget(11, reverse("workout_designer:create_workout"),
+                               method="post", data=ROUTINE_FORM, status=302)
+
+    def test_batch_create_workout(self):
+        data = dict(ROUTINE_FORM, count="25")
+        self.assertQueryBudget(15, reverse("workout_designer:batch_create_workout"),
+                               method="post", data=data)
+
+    def test_delete_routine(self):
+        self.assertQueryBudget(8, reverse("workout_designer:delete_routine", args=[self.routine.id]),
+                               status=302)
+
+
+class OptimizerTests(TestCase):
+    """The balanced optimizer keeps days inside the time window, and the volume even."""
+
+    def setUp(self):
+        random.seed(0)
+
+    def make_routine(self, lower, upper, split=Routine.PPL, is_synchronous=True, is_muscle_focused=True):
+        return Routine(split=split, is_synchronous=is_synchronous, lower_limit_min=lower,
+                       upper_limit_min=upper, is_muscle_focused=is_muscle_focused)
+
+    def plan_every_kind(self, optimizer, lower, upper, runs=3):
+        """
+        Plan routines of every split, schedule, and goal with this optimizer.
+        Return a list of (routine, planned) pairs.
+        """
+        random.seed(0)
+        routines = []
+        for split, _ in Routine.SPLIT_CHOICES:
+            for is_synchronous in (True, False):
+                for is_muscle_focused in (True, False):
+                    for _ in range(runs):
+                        routine = self.make_routine(lower, upper, split, is_synchronous, is_muscle_focused)
+                        routines.append((routine, optimizer(routine, create_days_for_routine(routine))))
+        return routines
+
+    def get_training_days(self, routines):
+        return [(day, planned_sets) for _, planned in routines for day, planned_sets in planned
+                if day.day_type.name != DayType.REST]
+
+    def test_days_stay_inside_the_window(self):
+        for lower, upper in [(45, 75), (30, 33), (20, 25), (60, 90)]:
+            with self.subTest(lower=lower, upper=upper):
+                days = self.get_training_days(self.plan_every_kind(plan_balanced, lower, upper))
+                for day, planned_sets in days:
+                    self.assertLessEqual(day.time_est_min, upper)
+                    self.assertEqual(day.time_est_min, sum(ps.time_est_min for ps in planned_sets))
+                # The window is wider than the longest exercise, so the lower limit is always reached
+                if upper - lower >= estimate_time(Exercise(is_compound=True), 3):
+                    self.assertTrue(all(day.time_est_min >= lower for day, _ in days))
+
+    def test_narrow_window_is_reached_more_often_than_random(self):
+        def days_in_window(optimizer):
+            days = self.get_training_days(self.plan_every_kind(optimizer, 30, 33, runs=5))
+            return sum(30 <= day.time_est_min <= 33 for day, _ in days) / len(days)
+
+        balanced = days_in_window(plan_balanced)
+        # About 70% of days, against about 40% for random
+        self.assertGreaterEqual(balanced, 0.65)
+        self.assertGreater(balanced, days_in_window(plan_random) + 0.2)
+
+    def test_volume_is_more_even_than_random(self):
+        for lower, upper in [(45, 75), (30, 33)]:
+            with self.subTest(lower=lower, upper=upper):
+                spreads = {
+                    optimizer: mean(get_volume_spread(routine, planned)
+                                    for routine, planned in self.plan_every_kind(optimizer, lower, upper))
+                    for optimizer in [plan_balanced, plan_random]
+                }
+                self.assertLess(spreads[plan_balanced], spreads[plan_random])
+
+    def test_goal_picks_reps_and_exercises(self):
+        routines = self.plan_every_kind(plan_balanced, 45, 75)
+        for is_muscle_focused, reps in [(True, {6, 8, 10, 12}), (False, {8, 10, 12})]:
+            planned_sets = [ps for routine, planned in routines for _, day_sets in planned for ps in day_sets
+                            if routine.is_muscle_focused == is_muscle_focused]
+            self.assertEqual({ps.reps for ps in planned_sets}, reps)
+
+        # Fitness routines pick a compound exercise whenever one fits
+        routine = self.make_routine(45, 75, is_muscle_focused=False)
+        plan = BalancedPlan(routine, create_days_for_routine(routine))
+        for muscle, candidates in plan.candidates.items():
+            if any(exercise.is_compound for exercise in candidates):
+                self.assertTrue(plan.pick_exercise(muscle, 75).is_compound)
+        self.assertIsNone(plan.pick_exercise(muscle, 1))
+
+    def test_stops_when_lower_limit_is_above_upper_limit(self):
+        for lower, upper in [(60, 30), (30, 5)]:
+            with self.subTest(lower=lower, upper=upper):
+                routine = self.make_routine(lower, upper)
+                plan = BalancedPlan(routine, create_days_for_routine(routine))
+                plan.fill_days()
+                plan.improve()
+                for day, planned_sets, _ in plan.plans:
+                    self.assertLessEqual(day.time_est_min, upper)
+                    if upper < estimate_time(Exercise(is_compound=False), 3):
+                        self.assertEqual(planned_sets, [])
+
+
+class SaveRoutinesTests(TestCase):
+    """Saved routines, days, and planned sets are linked up and keep their order."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("planner")
+
+    def assertSavedAsPlanned(self, planned):
+        routine_ids = [routine.id for routine, _ in planned]
+        self.assertEqual(sorted(routine_ids), list(Routine.objects.order_by("id").values_list("id", flat=True)))
+        for routine, days in planned:
+            saved_days = list(Day.objects.filter(routine=routine).order_by("id"))
+            self.assertEqual([(day.name, day.day_type_id) for day in saved_days],
+                             [(day.name, day.day_type_id) for day, _ in days])
+            for saved_day, (_, planned_sets) in zip(saved_days, days):
+                saved_sets = PlannedSets.objects.filter(day=saved_day).order_by("id")
+                self.assertEqual([(ps.exercise_id, ps.reps) for ps in saved_sets],
+                                 [(ps.exercise_id, ps.reps) for ps in planned_sets])
+
+    def plan(self):
+        routines = [new_routine(self.user, "sync", 75, 45, split, "muscle")
+                    for split, _ in Routine.SPLIT_CHOICES]
+        return plan_routines(routines)
+
+    def test_bulk_insert(self):
+        planned = self.plan()
+        save_routines(planned)
+        self.assertSavedAsPlanned(planned)
+
+    def test_backend_without_returning_ids(self):
+        planned = self.plan()
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            save_routines(planned)
+        self.assertSavedAsPlanned(planned)
+
+
+class BatchCreateWorkoutTests(TestCase):
+    """Batches of routines are only created for users the requester may plan for."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("planner")
+        cls.coach = User.objects.create_user("coach", is_staff=True)
+        cls.client_user = User.objects.create_user("client")
+
+    def post(self, user, **data):
+        self.client.force_login(user)
+        response = self.client.post(reverse("workout_designer:batch_create_workout"),
+                                    dict(ROUTINE_FORM, split="PPL", **data))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_creates_routines_for_yourself(self):
+        response = self.post(self.user, count="3")
+        summaries = response.context["summaries"]
+        routines = list(Routine.objects.filter(user=self.user).order_by("id"))
+        self.assertEqual([summary.id for summary in summaries], [routine.id for routine in routines])
+        for summary, routine in zip(summaries, routines):
+            days = list(routine.day_set.order_by("id"))
+            training_days = [day for day in days if day.day_type.name != DayType.REST]
+            self.assertEqual(summary.username, "planner")
+            self.assertEqual(summary.name, "Push-Pull-Legs, Synchronous")
+            self.assertEqual(summary.days, len(days))
+            self.assertEqual(summary.planned_sets, PlannedSets.objects.filter(day__routine=routine).count())
+            self.assertAlmostEqual(summary.avg_time_est_min,
+                                   mean(day.time_est_min for day in training_days))
+            self.assertContains(response, reverse("workout_designer:routine", args=[routine.id]))
+
+    def test_only_staff_create_routines_for_others(self):
+        response = self.post(self.user, usernames="client", count="1")
+        self.assertEqual(response.context["error"], "Only staff can create routines for other users.")
+        self.assertFalse(Routine.objects.exists())
+
+        response = self.post(self.coach, usernames="client, planner", count="2")
+        self.assertEqual([summary.username for summary in response.context["summaries"]],
+                         ["client", "client", "planner", "planner"])
+        self.assertEqual(Routine.objects.filter(user=self.client_user).count(), 2)
+        self.assertFalse(Routine.objects.filter(user=self.coach).exists())
+
+    def test_unknown_users(self):
+        response = self.post(self.coach, usernames="client nobody ghost", count="1")
+        self.assertEqual(response.context["error"], "No such users: ghost, nobody")
+        self.assertFalse(Routine.objects.exists())
+
+    def test_count_bounds(self):
+        too_many = MAX_BATCH_ROUTINES // 2 + 1
+        for user, usernames, count in [(self.user, "", "0"), (self.user, "", "-1"), (self.user, "", "many"),
+                                       (self.user, "", str(MAX_BATCH_ROUTINES + 1)),
+                                       (self.coach, "client planner", str(too_many))]:
+            with self.subTest(usernames=usernames, count=count):
+                response = self.post(user, usernames=usernames, count=count)
+                self.assertEqual(response.context["error"],
+                                 f"Create between 1 and {MAX_BATCH_ROUTINES} routines at once.")
+        self.assertFalse(Routine.objects.exists())
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command("generate_routines", "planner", "client", "--count", "2", "--split", "UL",
+                     "--goal", "fit", "--lower", "30", "--upper", "40", "--workers", "4", stdout=out)
+        routines = Routine.objects.order_by("id")
+        self.assertEqual([routine.user.username for routine in routines], ["client"] * 2 + ["planner"] * 2)
+        self.assertTrue(all(routine.split == Routine.UL and not routine.is_muscle_focused
+                            and (routine.lower_limit_min, routine.upper_limit_min) == (30, 40)
+                            for routine in routines))
+        self.assertTrue(all(day.time_est_min <= 40 for day in Day.objects.all()))
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[0].startswith(f"{routines[0].id}\tclient\tUpper-Lower, Synchronous\t7 days"))
+        self.assertIn("Created 4 routines for 2 users", lines[-1])
 
-# Create your tests here.
+        with self.assertRaisesMessage(CommandError, "No such users: nobody"):
+            call_command("generate_routines", "planner", "nobody")
+        with self.assertRaisesMessage(CommandError, "--count must be at least 1"):
+            call_command("generate_routines", "planner", "--count", "0")
@@ -12,4 +12,5 @@ urlpatterns = [
     path('routine/<int:routine_id>/', views.routine, name='routine'),
     path('delete_routine<int:routine_id>/', views.delete_routine, name='delete_routine'),
     path('create_workout/', views.create_workout, name='create_workout'),
+    path('batch_create_workout/', views.batch_create_workout, name='batch_create_workout'),
 ]
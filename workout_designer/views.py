@@ -1,64 +1,91 @@
+from collections import namedtuple
 import datetime
-from random import randrange, shuffle
+from random import randrange
 
 from dateutil import tz
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import redirect, render
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, Prefetch
+from django.shortcuts import get_object_or_404, redirect, render
 from commons.views import verify_user_is_owner
 
-from workout_designer.models import Focus, Routine, DayType, Day, PlannedSets
-from workout_log.models import MuscleWorked
+from workout_designer.models import Routine, DayType, Day, PlannedSets
+from workout_designer.optimizer import plan_routine
+from workout_designer.reference import DAY_TYPES
+
+
+# Most routines that can be created in one batch from the web. Bigger
+# batches can be created with `python manage.py generate_routines`.
+MAX_BATCH_ROUTINES = 1000
+
+# Summary of a routine created in a batch:
+# - id, username, name: the routine, its owner, and its name (ex: Bro, Synchronous)
+# - days: number of days in the routine (including rest days)
+# - planned_sets: number of planned exercises across all its days
+# - avg_time_est_min: average time estimate of its training days
+RoutineSummary = namedtuple(
+    "RoutineSummary", ["id", "username", "name", "days", "planned_sets", "avg_time_est_min"]
+)
 
 
 @login_required
 def index(request):
     """Load the My Workouts page"""
-    routines = Routine.objects.filter(user=request.user).order_by("datetime_created")
-
-    # Create routine dictionary with this structure:
-    # {
-    #    'routine 1': {
-    #                     'day 1': [planned sets for exercise 1, planned sets for exercise 2, ...],
-    #                     'day 2': [planned sets for exercise 1, planned sets for exercise 2, ...],
-    #                     ...
-    #                 },
-    #    ...
-    # }
-    
+    # Each routine is previewed with its days, so prefetch them (and how many
+    # exercises each day has): two queries no matter how many routines there are.
+    days = Day.objects.order_by("id").annotate(num_exercises=Count("plannedsets"))
+    routines = (Routine.objects.filter(user=request.user)
+                .order_by("datetime_created")
+                .prefetch_related(Prefetch("day_set", queryset=days)))
+
     context = {'routines': routines}
     return render(request, "workout_designer/index.html", context)
 
 
 @login_required
 def routine(request, routine_id):
-    """Load a page to view this routine"""
-    routine = Routine.objects.get(id=routine_id)
-    owner = routine.user
-    verify_user_is_owner(owner, request.user)
+    """
+    Load a page to view this routine.
+    Costs three queries no matter how big the routine is: the routine, its
+    days, and their planned sets (with their exercises).
+    """
+    planned_sets = PlannedSets.objects.select_related("exercise").order_by("id")
+    days = Day.objects.order_by("id").prefetch_related(
+        Prefetch("plannedsets_set", queryset=planned_sets)
+    )
+    routine = get_object_or_404(
+        Routine.objects.prefetch_related(Prefetch("day_set", queryset=days)),
+        id=routine_id,
+    )
+    verify_user_is_owner(routine.user_id, request.user.id)
+
+    context = {'routine': routine, 'routine_dict': get_routine_dict(routine)}
+    return render(request, 'workout_designer/routine.html', context)
+
 
-    # create routine dict with this structure (so it can be rendered easily by the template):
-    # {
-    #     'day 1': [planned sets for exercise 1, planned sets for exercise 2, ...],
-    #     'day 2': [planned sets for exercise 1, planned sets for exercise 2, ...],
-    #     ...
-    # }
+def get_routine_dict(routine):
+    """
+    Get a dict of a routine's days and their planned sets (with this structure,
+    so it can be rendered easily by the template):
+    {
+        'day 1': [planned sets for exercise 1, planned sets for exercise 2, ...],
+        'day 2': [planned sets for exercise 1, planned sets for exercise 2, ...],
+        ...
+    }
+    The routine's days and their planned sets should already be prefetched.
+    """
     routine_dict = dict()
-    days = Day.objects.filter(routine=routine)
-    for day in days:
+    for day in routine.day_set.all():
         # need to account for multiple days with the same name (ex: multiple rest days)
-        if day.__str__() in routine_dict.keys():
-            if f"{day} B" in routine_dict.keys():
-                curr_day_ls = routine_dict[f"{day} C"] = []
+        day_str = str(day)
+        if day_str in routine_dict:
+            if f"{day_str} B" in routine_dict:
+                day_str = f"{day_str} C"
             else:
-                curr_day_ls = routine_dict[f"{day} B"] = []
-        else:
-            curr_day_ls = routine_dict[f"{day}"] = []
-        planned_sets = PlannedSets.objects.filter(day=day)
-        for ps in planned_sets:
-            curr_day_ls.append(ps)
-    
-    context = {'routine': routine,'routine_dict': routine_dict}
-    return render(request, 'workout_designer/routine.html', context)
+                day_str = f"{day_str} B"
+        routine_dict[day_str] = list(day.plannedsets_set.all())
+    return routine_dict
 
 
 @login_required
@@ -78,21 +105,66 @@ def create_workout(request):
     POST: Process the form for creating a workout
     """
     if request.method == "POST":
-        schedule = request.POST.get("schedule")
-        lower_hr_str = request.POST.get("lowerLimitHrs")
-        lower_min_str = request.POST.get("lowerLimitMin")
-        upper_hr_str = request.POST.get("upperLimitHrs")
-        upper_min_str = request.POST.get("upperLimitMin")
-        lower_limit, upper_limit = get_limits(lower_hr_str, lower_min_str, upper_hr_str, upper_min_str)
-        goal = request.POST.get("goal")
-        split = request.POST.get("split")
-
-        create_routine(request, schedule, upper_limit, lower_limit, split, goal)
+        create_routine(request, *get_routine_parameters(request))
         return redirect('workout_designer:index')
     else:
         return render(request, 'workout_designer/create_workout.html')
 
 
+@login_required
+def batch_create_workout(request):
+    """
+    GET: Load the form for creating a batch of routines
+    POST: Create the routines, and show a summary of them
+    Routines can be created for several users at once (ex: a coach's
+    clients), but only staff can create routines for other users.
+    They're planned in this process, since a few ms per routine is quick
+    enough for a request (generate_routines can plan them in a pool of
+    processes).
+    """
+    context = {'max_routines': MAX_BATCH_ROUTINES}
+    if request.method == "POST":
+        usernames = request.POST.get("usernames", "").replace(",", " ").split()
+        try:
+            count = int(request.POST.get("count", ""))
+        except ValueError:
+            count = 0
+        context['usernames'] = " ".join(usernames)
+        context['count'] = count
+
+        if not usernames:
+            usernames = [request.user.username]
+        users = list(User.objects.filter(username__in=usernames).order_by("username"))
+        missing = set(usernames) - {user.username for user in users}
+
+        if missing:
+            context['error'] = f"No such users: {', '.join(sorted(missing))}"
+        elif not request.user.is_staff and users != [request.user]:
+            context['error'] = "Only staff can create routines for other users."
+        elif not 0 < count * len(users) <= MAX_BATCH_ROUTINES:
+            context['error'] = f"Create between 1 and {MAX_BATCH_ROUTINES} routines at once."
+        else:
+            context['summaries'] = create_routines(users, count, *get_routine_parameters(request))
+    return render(request, 'workout_designer/batch_create_workout.html', context)
+
+
+def get_routine_parameters(request):
+    """
+    Get the parameters for a routine from a submitted routine form.
+    Return (schedule, upper limit, lower limit, split, goal), in the order
+    that create_routine takes them.
+    """
+    schedule = request.POST.get("schedule")
+    lower_hr_str = request.POST.get("lowerLimitHrs")
+    lower_min_str = request.POST.get("lowerLimitMin")
+    upper_hr_str = request.POST.get("upperLimitHrs")
+    upper_min_str = request.POST.get("upperLimitMin")
+    lower_limit, upper_limit = get_limits(lower_hr_str, lower_min_str, upper_hr_str, upper_min_str)
+    goal = request.POST.get("goal")
+    split = request.POST.get("split")
+    return schedule, upper_limit, lower_limit, split, goal
+
+
 @login_required
 def create_routine(request, schedule, upper_limit, lower_limit, split, goal):
     """
@@ -103,10 +175,24 @@ def create_routine(request, schedule, upper_limit, lower_limit, split, goal):
     - lower_limit: lower workout limit in min
     - split: Anything, Arnold, Bro, Push-Pull-Legs, Upper-Lower
     - goal: musc or fit
+    The whole routine is planned in memory first (see optimizer.py), then
+    saved in one transaction: one insert for the routine, one for its days,
+    and one for their planned sets.
+    """
+    r = new_routine(request.user, schedule, upper_limit, lower_limit, split, goal)
+    days = create_days_for_routine(r)
+    save_routines([(r, plan_routine(r, days))])
+    return r
+
+
+def new_routine(user, schedule, upper_limit, lower_limit, split, goal):
+    """
+    Make an (unsaved) Routine for this user. The parameters are the same as
+    create_routine's. An 'Anything' split picks a random split.
     """
     r = Routine()
     r.datetime_created = datetime.datetime.now().replace(tzinfo=tz.gettz())
-    r.user = request.user
+    r.user = user
     r.is_synchronous = schedule == "sync"
     if split == 'Anything':
         choices = [abreviation for abreviation,_ in Routine.SPLIT_CHOICES]
@@ -117,21 +203,99 @@ def create_routine(request, schedule, upper_limit, lower_limit, split, goal):
     r.lower_limit_min = lower_limit
     r.upper_limit_min = upper_limit
     r.is_muscle_focused = goal == "muscle"
-    r.save()
-    create_days_for_routine(r)
+    return r
+
+
+def create_routines(users, count, schedule, upper_limit, lower_limit, split, goal, plan=None):
+    """
+    Create count routines for each of these users, all with the same
+    parameters (see create_routine). Each routine is planned on its own, so
+    an 'Anything' split gives a mix of splits.
+    The routines are planned by plan, a function that works like
+    plan_routines (the default, which plans them in this process), then
+    everything is saved in one transaction.
+    Return a list of RoutineSummary, in the order the routines were created.
+    """
+    routines = [new_routine(user, schedule, upper_limit, lower_limit, split, goal)
+                for user in users for _ in range(count)]
+    planned = (plan or plan_routines)(routines)
+    save_routines(planned)
+    return [summarize_routine(routine, days) for routine, days in planned]
+
+
+def plan_routines(routines):
+    """
+    Create the days for these (unsaved) routines and plan their sets.
+    Return a list of (routine, days) pairs, where days is a list of
+    (day, planned sets) pairs. Nothing is saved.
+    """
+    planned = []
+    for routine in routines:
+        days = create_days_for_routine(routine)
+        planned.append((routine, plan_routine(routine, days)))
+    return planned
+
+
+def save_routines(planned):
+    """
+    Save planned routines in one transaction: one insert for the routines,
+    one for their days, and one for their planned sets (bigger batches are
+    split up by the database backend). On backends that can't return the
+    ids of bulk inserted rows, routines and days are inserted one by one.
+    - planned: list of (routine, days) pairs, where days is a list of
+      (day, planned sets) pairs, in order
+    """
+    routines = [routine for routine, _ in planned]
+    # Days are inserted in order, so their ids keep each routine's order
+    days = [day for _, days in planned for day, _ in days]
+    with transaction.atomic():
+        # The days need the routines' ids, and the planned sets need the
+        # days' ids. Backends that can't return ids from a bulk insert save
+        # them one at a time.
+        if connection.features.can_return_rows_from_bulk_insert:
+            Routine.objects.bulk_create(routines)
+            Day.objects.bulk_create(days)
+        else:
+            for obj in routines + days:
+                obj.save()
+        PlannedSets.objects.bulk_create(
+            [ps for _, days in planned for _, planned_sets in days for ps in planned_sets]
+        )
+
+
+def summarize_routine(routine, days):
+    """
+    Get a RoutineSummary of a saved routine.
+    - days: list of (day, planned sets) pairs
+    """
+    training_days = [day for day, _ in days if day.day_type.name != DayType.REST]
+    avg_time_est_min = 0
+    if training_days:
+        avg_time_est_min = sum(day.time_est_min for day in training_days) / len(training_days)
+    return RoutineSummary(
+        routine.id,
+        routine.user.username,
+        str(routine),
+        len(days),
+        sum(len(planned_sets) for _, planned_sets in days),
+        avg_time_est_min,
+    )
 
 
-@login_required
 def create_days_for_routine(routine):
-    """Create Days for a Routine"""
+    """
+    Create the Days for a Routine (nothing is saved).
+    Return a list of the days, in order.
+    """
     if routine.split == Routine.ARN:
-        create_days_arnold(routine)
+        return create_days_arnold(routine)
     elif routine.split == Routine.BRO:
-        create_days_bro(routine)
+        return create_days_bro(routine)
     elif routine.split == Routine.PPL:
-        create_days_ppl(routine)
+        return create_days_ppl(routine)
     elif routine.split == Routine.UL:
-        create_days_ul(routine)
+        return create_days_ul(routine)
+    return []
 
 
 def create_days_arnold(routine):
@@ -140,125 +304,90 @@ def create_days_arnold(routine):
     # is it worth storing rest days? probably not!
     # i'm just banking on these days being created and stored in order.
     if routine.is_synchronous:
-        create_day(routine, "Legs M", DayType.LEGS)
-        create_day(routine, "Back-Chest Tu", DayType.BC)
-        create_day(routine, "Shoulders-Arms W", DayType.SA)
-        create_day(routine, "Legs Th", DayType.LEGS)
-        create_day(routine, "Back-Chest F", DayType.BC)
-        create_day(routine, "Shoulders-Arms Sa", DayType.SA)
-        create_day(routine, "Rest Su", DayType.REST)
+        return [
+            create_day(routine, "Legs M", DayType.LEGS),
+            create_day(routine, "Back-Chest Tu", DayType.BC),
+            create_day(routine, "Shoulders-Arms W", DayType.SA),
+            create_day(routine, "Legs Th", DayType.LEGS),
+            create_day(routine, "Back-Chest F", DayType.BC),
+            create_day(routine, "Shoulders-Arms Sa", DayType.SA),
+            create_day(routine, "Rest Su", DayType.REST),
+        ]
     else:
-        create_day(routine, "Legs A", DayType.LEGS)
-        create_day(routine, "Back-Chest A", DayType.BC)
-        create_day(routine, "Shoulders-Arms A", DayType.SA)
-        create_day(routine, "Rest", DayType.REST)
-        create_day(routine, "Legs B", DayType.LEGS)
-        create_day(routine, "Back-Chest B", DayType.BC)
-        create_day(routine, "Shoulders-Arms B", DayType.SA)
-        create_day(routine, "Rest", DayType.REST)
+        return [
+            create_day(routine, "Legs A", DayType.LEGS),
+            create_day(routine, "Back-Chest A", DayType.BC),
+            create_day(routine, "Shoulders-Arms A", DayType.SA),
+            create_day(routine, "Rest", DayType.REST),
+            create_day(routine, "Legs B", DayType.LEGS),
+            create_day(routine, "Back-Chest B", DayType.BC),
+            create_day(routine, "Shoulders-Arms B", DayType.SA),
+            create_day(routine, "Rest", DayType.REST),
+        ]
 
 
 def create_days_bro(routine):
     """Create days for a Bro split"""
-    create_day(routine, "Chest", DayType.CHEST)
-    create_day(routine, "Back", DayType.BACK)
-    create_day(routine, "Legs", DayType.LEGS)
-    create_day(routine, "Shoulders", DayType.SHOULDERS)
-    create_day(routine, "Arms", DayType.ARMS)
-    create_day(routine, "Rest", DayType.REST)
-    create_day(routine, "Rest", DayType.REST)
+    return [
+        create_day(routine, "Chest", DayType.CHEST),
+        create_day(routine, "Back", DayType.BACK),
+        create_day(routine, "Legs", DayType.LEGS),
+        create_day(routine, "Shoulders", DayType.SHOULDERS),
+        create_day(routine, "Arms", DayType.ARMS),
+        create_day(routine, "Rest", DayType.REST),
+        create_day(routine, "Rest", DayType.REST),
+    ]
 
 
 def create_days_ppl(routine):
     """Create days for a PPL split"""
     if routine.is_synchronous:
-        create_day(routine, "Legs M", DayType.LEGS)
-        create_day(routine, "Push Tu", DayType.PUSH)
-        create_day(routine, "Pull W", DayType.PULL)
-        create_day(routine, "Legs Th", DayType.LEGS)
-        create_day(routine, "Push F", DayType.PUSH)
-        create_day(routine, "Pull Sa", DayType.PULL)
-        create_day(routine, "Rest Su", DayType.REST)
+        return [
+            create_day(routine, "Legs M", DayType.LEGS),
+            create_day(routine, "Push Tu", DayType.PUSH),
+            create_day(routine, "Pull W", DayType.PULL),
+            create_day(routine, "Legs Th", DayType.LEGS),
+            create_day(routine, "Push F", DayType.PUSH),
+            create_day(routine, "Pull Sa", DayType.PULL),
+            create_day(routine, "Rest Su", DayType.REST),
+        ]
     else:
-        create_day(routine, "Legs A", DayType.LEGS)
-        create_day(routine, "Push A", DayType.PUSH)
-        create_day(routine, "Pull A", DayType.PULL)
-        create_day(routine, "Rest", DayType.REST)
-        create_day(routine, "Legs B", DayType.LEGS)
-        create_day(routine, "Push B", DayType.PUSH)
-        create_day(routine, "Pull B", DayType.PULL)
-        create_day(routine, "Rest", DayType.REST)
+        return [
+            create_day(routine, "Legs A", DayType.LEGS),
+            create_day(routine, "Push A", DayType.PUSH),
+            create_day(routine, "Pull A", DayType.PULL),
+            create_day(routine, "Rest", DayType.REST),
+            create_day(routine, "Legs B", DayType.LEGS),
+            create_day(routine, "Push B", DayType.PUSH),
+            create_day(routine, "Pull B", DayType.PULL),
+            create_day(routine, "Rest", DayType.REST),
+        ]
 
 
 def create_days_ul(routine):
     """Create days for a UL split"""
-    create_day(routine, "Upper", DayType.UPPER)
-    create_day(routine, "Lower", DayType.LOWER)
-    create_day(routine, "Rest", DayType.REST)
-    create_day(routine, "Upper", DayType.UPPER)
-    create_day(routine, "Lower", DayType.LOWER)
-    create_day(routine, "Rest", DayType.REST)
-    create_day(routine, "Rest", DayType.REST)
+    return [
+        create_day(routine, "Upper", DayType.UPPER),
+        create_day(routine, "Lower", DayType.LOWER),
+        create_day(routine, "Rest", DayType.REST),
+        create_day(routine, "Upper", DayType.UPPER),
+        create_day(routine, "Lower", DayType.LOWER),
+        create_day(routine, "Rest", DayType.REST),
+        create_day(routine, "Rest", DayType.REST),
+    ]
 
 
 def create_day(routine, name, day_type):
-    """Create a Day for this Routine, given a name and type"""
+    """
+    Create a Day for this Routine, given a name and type (nothing is saved).
+    Its sets are planned later, by the optimizer (see optimizer.py).
+    """
     d = Day()
     d.routine = routine
     d.name = name
-    d.day_type = DayType.objects.get(name=day_type)
+    d.day_type = DAY_TYPES.get()[day_type]
     d.time_est_min = 0
-    d.save()
-    create_sets_for_day(routine, d)
-
-
-def create_sets_for_day(routine, day):
-    """Create sets for this day"""
-    if day.day_type == DayType.objects.get(name=DayType.REST):
-        return
-    
-    # Get muscles that this day works. 
-    # Shuffle so it's not hitting the same muscles in the same order every time.
-    focii = Focus.objects.filter(day_type=day.day_type)
-    muscles = [focus.muscle for focus in focii]
-    shuffle(muscles)
-
-    # Keep addings sets as long as we're in the time limits
-    #  TODO currently not doing anything with upper_limit_min or is_muscle_focused
-    curr_time_est = day.time_est_min
-    while curr_time_est < routine.lower_limit_min:
-        for muscle in muscles:
-            ps = PlannedSets()
-            
-            ps.day = day
-
-            # get random exercise that targets this muscle
-            muscles_worked = MuscleWorked.objects.filter(muscle=muscle).filter(directly_targets=True)
-            exercises = [mw.exercise for mw in muscles_worked]
-            ps.exercise = exercises[randrange(len(exercises))]
-    
-            # Assume 3 sets for now.
-            ps.num_sets = 3
-
-            # Get random reps between 6 and 12, even-numbers
-            ps.reps = randrange(6, 13, 2)
-
-            # Get very rough time estimate using these rules:
-            #  Compound lifts require a 2 minute warmup, and take 3.5 minutes per set.
-            #  Isolation lifts require no warmup and take 2.5 minutes per set.
-            #  Might want to change this calculation later to reflect reps
-            if ps.exercise.is_compound:
-                ps.time_est_min = 2 + ps.num_sets * 3.5
-            else:
-                ps.time_est_min = ps.num_sets * 2.5
-            curr_time_est += ps.time_est_min
-            ps.save()
-
-            # need to break out of for loop so the while loop can break
-            if curr_time_est > routine.lower_limit_min:
-                break
-    day.time_est_min = curr_time_est
-    day.save()
+    return d
 
 
 def get_limits(lower_hr_str, lower_min_str, upper_hr_str, upper_min_str):
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WorkoutLogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'workout_log'
+
+    def ready(self):
+        # Connect the signal handlers that reset the cached reference data
+        from . import signals  # noqa: F401
@@ -6,23 +6,33 @@ The backend processing is done in views.py
 
 from django import forms
 
-from .models import Set
+from commons.forms import ReferenceChoiceField, ReferenceModelForm
+from .models import Exercise, Set
+from .reference import EXERCISES
 
 
-class SetForm(forms.ModelForm):
+class SetForm(ReferenceModelForm):
     """Form where users can log a set"""
+    # Exercise options come from the cached exercises, sorted alphabetically
+    exercise = ReferenceChoiceField(EXERCISES, Exercise)
+
     class Meta:
         model = Set
         fields = ['exercise', 'reps', 'weight']
-    
-    def __init__(self, *args, **kwargs):
-        super(SetForm, self).__init__(*args, **kwargs)
-        
-        # Sort exercise options alphabetically
-        exercise_field = self.fields['exercise']
-        exercise_field.queryset = exercise_field.queryset.order_by('name')
 
 
+# Most sets that can be logged at once on the Log a Workout page
+MAX_WORKOUT_SETS = 100
+# Blank rows on the Log a Workout page
+WORKOUT_FORM_ROWS = 10
+
+# Form where users can log a whole workout (one SetForm per set). Blank rows
+# are ignored.
+WorkoutFormSet = forms.formset_factory(
+    SetForm, extra=WORKOUT_FORM_ROWS, max_num=MAX_WORKOUT_SETS, validate_max=True,
+    absolute_max=MAX_WORKOUT_SETS,
+)
+
 
 class VolumeManagerForm(forms.Form):
     """
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_log', '0006_alter_exercise_created_by'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['logged_by', 'date', 'index'], name='set_user_date_index_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['logged_by', 'exercise', 'date'], name='set_user_exercise_date_idx'),
+        ),
+    ]
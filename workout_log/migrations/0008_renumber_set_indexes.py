@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-18 22:10
+#  Numbers each day's sets 0, 1, 2, ... in their current order, so set
+#  indexes have no gaps or duplicates (see workout_log/ordering.py). Indexes
+#  used to be counted when a set was logged, so deleting a set left a gap and
+#  logging two sets at once could duplicate an index.
+from django.db import migrations
+
+
+def renumber_sets(apps, schema_editor):
+    sets = apps.get_model('workout_log', 'Set').objects
+    rows = (sets.only('id', 'logged_by', 'date', 'index')
+            .order_by('logged_by', 'date', 'index', 'id'))
+    changed = []
+    day = None
+    for s in rows.iterator(chunk_size=2000):
+        if (s.logged_by_id, s.date) != day:
+            day = (s.logged_by_id, s.date)
+            next_index = 0
+        if s.index != next_index:
+            s.index = next_index
+            changed.append(s)
+        next_index += 1
+    sets.bulk_update(changed, ['index'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_log', '0007_user_date_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_sets, migrations.RunPython.noop),
+    ]
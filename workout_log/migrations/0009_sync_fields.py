@@ -0,0 +1,31 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_log', '0008_renumber_set_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='set',
+            name='client_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='set',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['logged_by', 'updated_at'], name='set_user_updated_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='set',
+            constraint=models.UniqueConstraint(fields=('logged_by', 'client_id'), name='set_user_client_id_unique'),
+        ),
+    ]
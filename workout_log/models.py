@@ -101,6 +101,23 @@ class Set(models.Model):
     weight = models.FloatField()
     logged_by = models.ForeignKey(User, on_delete=models.CASCADE)
     index = models.IntegerField()
+    # For offline sync (see commons/sync.py): the id the user's device gave
+    # the set, if it was logged through sync, and when the set last changed
+    client_id = models.UUIDField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Sets are almost always looked up by user, then date. The first index
+        # also returns a day's sets in order, the second serves the charts,
+        # the third serves sync.
+        indexes = [
+            models.Index(fields=["logged_by", "date", "index"], name="set_user_date_index_idx"),
+            models.Index(fields=["logged_by", "exercise", "date"], name="set_user_exercise_date_idx"),
+            models.Index(fields=["logged_by", "updated_at"], name="set_user_updated_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["logged_by", "client_id"], name="set_user_client_id_unique"),
+        ]
 
     def __str__(self):
         return f"{self.id}, {self.logged_by}, {self.date}, {self.exercise}, {self.reps} reps at {self.weight} lbs."
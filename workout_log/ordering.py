@@ -0,0 +1,106 @@
+"""
+Order of a user's sets on a day.
+Each set's index is its position on its day: a day with n sets uses the
+indexes 0 to n - 1, with no gaps or duplicates. New sets are added at the
+end, moving a set shifts its neighbours, and deleting a set closes the gap.
+
+Every change locks the user's row first (see lock_user), so two requests
+that change the same user's sets at the same time (ex: two tabs) take
+turns instead of giving two sets the same index.
+All of these must be called in a transaction (see transaction.atomic).
+update() doesn't set auto_now fields, so the updates here set updated_at
+themselves, for sync (see commons/sync.py).
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+from .models import Set
+
+
+def lock_user(user_id):
+    """
+    Lock the user's row until the end of the transaction. SQLite ignores
+    select_for_update: it only has one lock, for writing to the database.
+    A transaction that reads, then writes after another transaction wrote,
+    fails ("database is locked") instead of waiting. So on SQLite the row
+    is written instead (without changing it), which takes the write lock
+    right away, or waits for it (see busy_timeout in settings.SQLITE_PRAGMAS).
+    This should be the transaction's first query, so it hasn't read yet.
+    """
+    users = User.objects.filter(id=user_id)
+    if connection.vendor == "sqlite":
+        users.update(last_login=F("last_login"))
+    else:
+        list(users.select_for_update().values_list("id"))
+
+
+def lock_user_sets(user_id, date):
+    """
+    Lock the user's sets until the end of the transaction, and return the
+    highest index of their sets on this date (None if they don't have any).
+    One query, which reads one row of the user + date index (two on SQLite,
+    which locks first, see lock_user).
+    """
+    last_index = (Set.objects.filter(logged_by=OuterRef("id"), date=date)
+                  .order_by("-index").values("index")[:1])
+    users = User.objects.filter(id=user_id)
+    if connection.vendor == "sqlite":
+        lock_user(user_id)
+    else:
+        users = users.select_for_update()
+    return (users.annotate(last_index=Subquery(last_index))
+            .values_list("last_index", flat=True)
+            .get())
+
+
+def allocate_set_indexes(user, date, count=1):
+    """
+    Reserve count indexes at the end of the user's sets on this date. Return
+    the first one. The sets must be saved with them before the transaction
+    ends.
+    """
+    last_index = lock_user_sets(user.id, date)
+    return 0 if last_index is None else last_index + 1
+
+
+def move_set(set, index):
+    """
+    Move a set to this index on its day (clamped to the day's indexes). It
+    and the sets in between are updated in a single UPDATE: the sets in
+    between shift over by one. Return the set's new index.
+    """
+    last_index = lock_user_sets(set.logged_by_id, set.date)
+    # Another request could have moved the set since it was loaded
+    old_index = Set.objects.values_list("index", flat=True).get(id=set.id)
+    index = max(0, min(index, last_index))
+    if index < old_index:
+        # Moving up: the sets from index to old_index - 1 move down one
+        in_between = Q(index__gte=index, index__lt=old_index)
+        shift = F("index") + 1
+    elif index > old_index:
+        # Moving down: the sets from old_index + 1 to index move up one
+        in_between = Q(index__gt=old_index, index__lte=index)
+        shift = F("index") - 1
+    else:
+        set.index = index
+        return index
+
+    day_sets = Set.objects.filter(logged_by=set.logged_by_id, date=set.date)
+    day_sets.filter(Q(id=set.id) | in_between).update(
+        index=Case(When(id=set.id, then=Value(index)), default=shift),
+        updated_at=timezone.now(),
+    )
+    set.index = index
+    return index
+
+
+def delete_set(set):
+    """Delete a set, and move the day's later sets up one to close the gap."""
+    lock_user_sets(set.logged_by_id, set.date)
+    index = Set.objects.values_list("index", flat=True).get(id=set.id)
+    set.delete()
+    (Set.objects.filter(logged_by=set.logged_by_id, date=set.date, index__gt=index)
+     .update(index=F("index") - 1, updated_at=timezone.now()))
+
@@ -0,0 +1,53 @@
+"""
+Reference data for the Workout Log app (see commons/registry.py).
+Exercises, muscles, and the muscles each exercise works are seeded by
+migrations and almost never change, so they're loaded once per process:
+- EXERCISES: Table of exercises, ordered by name
+- MUSCLES: Table of muscles, ordered by name
+- MUSCLE_MAP: MuscleMap between exercises and the muscles they work
+Signal handlers invalidate them when the underlying rows change (see
+signals.py).
+"""
+from collections import namedtuple
+
+from commons.registry import ReferenceData, load_table
+from .models import Exercise, Muscle, MuscleWorked
+
+
+# - muscles_by_exercise: exercise id -> [(muscle id, directly_targets), ...]
+# - direct_exercises_by_muscle: muscle id -> [ids of exercises that directly
+#   target the muscle]
+MuscleMap = namedtuple("MuscleMap", ["muscles_by_exercise", "direct_exercises_by_muscle"])
+
+
+def build_muscle_map():
+    """Build a MuscleMap from the database (one query)."""
+    muscles_by_exercise = dict()
+    direct_exercises_by_muscle = dict()
+    rows = MuscleWorked.objects.order_by("id").values_list("exercise", "muscle", "directly_targets")
+    for exercise_id, muscle_id, directly_targets in rows:
+        muscles_by_exercise.setdefault(exercise_id, []).append((muscle_id, directly_targets))
+        if directly_targets:
+            direct_exercises_by_muscle.setdefault(muscle_id, []).append(exercise_id)
+    return MuscleMap(muscles_by_exercise, direct_exercises_by_muscle)
+
+
+EXERCISES = ReferenceData(
+    "workout_log.exercises",
+    lambda: load_table(Exercise.objects.order_by("name", "id")),
+)
+MUSCLES = ReferenceData(
+    "workout_log.muscles",
+    lambda: load_table(Muscle.objects.order_by("name", "id")),
+)
+MUSCLE_MAP = ReferenceData("workout_log.muscle_map", build_muscle_map)
+
+
+def get_muscles_worked(exercise_id):
+    """Get a list of (muscle id, directly_targets) for this exercise."""
+    return MUSCLE_MAP.get().muscles_by_exercise.get(exercise_id, [])
+
+
+def get_direct_exercise_ids(muscle_id):
+    """Get a list of ids of the exercises that directly target this muscle."""
+    return MUSCLE_MAP.get().direct_exercises_by_muscle.get(muscle_id, [])
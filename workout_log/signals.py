@@ -0,0 +1,43 @@
+"""
+Signal handlers for the Workout Log app.
+- Invalidate the cached reference data whenever the rows it is built from
+  change (see reference.py).
+- Bump the user's sets version when their sets change, so their charts are
+  rebuilt.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from commons.charts import SETS, bump_data_version
+from .models import Exercise, Muscle, MuscleWorked, Set
+from .reference import EXERCISES, MUSCLE_MAP, MUSCLES
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def reset_exercises(sender, **kwargs):
+    """Reset the exercises and muscle map when an exercise changes."""
+    EXERCISES.invalidate()
+    MUSCLE_MAP.invalidate()
+
+
+@receiver(post_save, sender=Muscle)
+@receiver(post_delete, sender=Muscle)
+def reset_muscles(sender, **kwargs):
+    """Reset the muscles and muscle map when a muscle changes."""
+    MUSCLES.invalidate()
+    MUSCLE_MAP.invalidate()
+
+
+@receiver(post_save, sender=MuscleWorked)
+@receiver(post_delete, sender=MuscleWorked)
+def reset_muscle_map(sender, **kwargs):
+    """Reset the muscle map when a muscle worked changes."""
+    MUSCLE_MAP.invalidate()
+
+
+@receiver(post_save, sender=Set)
+@receiver(post_delete, sender=Set)
+def update_sets_version(sender, instance, **kwargs):
+    """Bump the user's sets version when a set changes."""
+    bump_data_version(instance.logged_by_id, SETS)
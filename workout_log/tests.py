@@ -1,3 +1,507 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import threading
+import unittest
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+
+from commons.testing import QueryBudgetMixin, QueryPlanMixin, file_database, seed_user
+from .forms import MAX_WORKOUT_SETS
+from .models import Exercise, Muscle, MuscleWorked, Set
+from .ordering import allocate_set_indexes, delete_set, move_set
+from .views import calculate_volume, get_journal_page, get_progressive_overload
+
+
+# Queries that lock a user's sets (see ordering.lock_user): SQLite writes the
+# user's row before reading the day's last index
+LOCK_QUERIES = 2 if connection.vendor == "sqlite" else 1
+
+
+class SetIndexTests(QueryPlanMixin, TestCase):
+    """The hot queries on sets use the user + date indexes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("lifter")
+        self.exercise = Exercise.objects.create(name="Test press", is_compound=True, equipment="BB")
+        self.date = datetime.date(2023, 11, 1)
+        Set.objects.create(date=self.date, exercise=self.exercise, reps=5, weight=100,
+                           logged_by=self.user, index=0)
+
+    def test_days_sets_use_user_date_index(self):
+        sets = Set.objects.filter(logged_by=self.user, date=self.date).order_by("index", "id")
+        self.assertUsesIndex(sets, "set_user_date_index_idx")
+
+    def test_journal_dates_use_user_date_index(self):
+        dates = (Set.objects.filter(logged_by=self.user, date__lt=self.date)
+                 .values_list("date", flat=True).distinct().order_by("-date"))
+        self.assertUsesIndex(dates, "set_user_date_index_idx")
+
+    def test_chart_data_uses_user_exercise_date_index(self):
+        rows = (Set.objects.filter(logged_by=self.user, exercise=self.exercise)
+                .values("date").annotate(num_sets=Count("id")).order_by("date"))
+        self.assertUsesIndex(rows, "set_user_exercise_date_idx")
+
+
+class SetOrderingTests(TestCase):
+    """A day's set indexes stay 0, 1, 2, ... as sets are added, moved, and deleted."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("lifter")
+        self.exercise = Exercise.objects.order_by("id").first()
+        self.date = datetime.date(2023, 11, 1)
+        self.sets = [
+            Set.objects.create(date=self.date, exercise=self.exercise, reps=reps, weight=100,
+                               logged_by=self.user, index=i)
+            for i, reps in enumerate([1, 2, 3, 4, 5])
+        ]
+
+    def get_order(self):
+        """Get the reps of the day's sets, in order, and check their indexes have no gaps."""
+        rows = list(Set.objects.filter(logged_by=self.user, date=self.date)
+                    .order_by("index").values_list("index", "reps"))
+        self.assertEqual([index for index, _ in rows], list(range(len(rows))))
+        return [reps for _, reps in rows]
+
+    def test_allocate_after_last_set(self):
+        self.assertEqual(allocate_set_indexes(self.user, self.date, 3), 5)
+        self.assertEqual(allocate_set_indexes(self.user, datetime.date(2023, 11, 2)), 0)
+
+    def test_move_up(self):
+        self.assertEqual(move_set(self.sets[3], 1), 1)
+        self.assertEqual(self.get_order(), [1, 4, 2, 3, 5])
+
+    def test_move_down(self):
+        self.assertEqual(move_set(self.sets[0], 3), 3)
+        self.assertEqual(self.get_order(), [2, 3, 4, 1, 5])
+
+    def test_move_past_the_end(self):
+        self.assertEqual(move_set(self.sets[1], 99), 4)
+        self.assertEqual(self.get_order(), [1, 3, 4, 5, 2])
+
+    def test_move_is_one_update(self):
+        with self.assertNumQueries(2 + LOCK_QUERIES):
+            move_set(self.sets[4], 0)
+        self.assertEqual(self.get_order(), [5, 1, 2, 3, 4])
+
+    def test_delete_closes_gap(self):
+        delete_set(self.sets[1])
+        self.assertEqual(self.get_order(), [1, 3, 4, 5])
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "Tests SQLite's write lock")
+class ConcurrentSetLoggingTests(TestCase):
+    """Workers logging sets for the same day at the same time take turns (SQLite in WAL mode)."""
+
+    THREADS = 4
+    SETS_PER_THREAD = 10
+
+    def test_indexes_are_distinct_and_contiguous(self):
+        date = datetime.date(2023, 11, 1)
+        exercise_id = Exercise.objects.order_by("id").values_list("id", flat=True).first()
+        barrier = threading.Barrier(self.THREADS)
+
+        def log_sets(user_id):
+            user = User.objects.get(id=user_id)
+            barrier.wait()
+            for _ in range(self.SETS_PER_THREAD):
+                with transaction.atomic():
+                    index = allocate_set_indexes(user, date)
+                    Set.objects.create(date=date, exercise_id=exercise_id, reps=5, weight=100,
+                                       logged_by=user, index=index)
+
+        def get_indexes(user_id):
+            return list(Set.objects.filter(logged_by=user_id, date=date)
+                        .order_by("index").values_list("index", flat=True))
+
+        with file_database() as run:
+            user_id = run(lambda: User.objects.create_user("lifter").id)
+            with ThreadPoolExecutor(self.THREADS) as executor:
+                futures = [executor.submit(run, log_sets, user_id) for _ in range(self.THREADS)]
+                for future in futures:
+                    future.result()
+            indexes = run(get_indexes, user_id)
+        self.assertEqual(indexes, list(range(self.THREADS * self.SETS_PER_THREAD)))
+
+
+class LogWorkoutTests(QueryBudgetMixin, TestCase):
+    """A whole workout is validated, then saved at once after the day's sets."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("lifter")
+        self.client.force_login(self.user)
+        self.exercises = list(Exercise.objects.order_by("id")[:3])
+        self.date = datetime.date(2023, 11, 1)
+        Set.objects.create(date=self.date, exercise=self.exercises[0], reps=5, weight=100,
+                           logged_by=self.user, index=4)
+        self.url = reverse("workout_log:log_workout", args=[2023, 11, 1])
+
+    def get_days_sets(self):
+        return list(Set.objects.filter(logged_by=self.user, date=self.date)
+                    .order_by("index").values_list("index", "exercise", "reps", "weight"))
+
+    def get_json_body(self, num_sets):
+        return json.dumps({"sets": [
+            {"exercise": self.exercises[i % 3].id, "reps": i + 1, "weight": 100 + i}
+            for i in range(num_sets)
+        ]})
+
+    def test_form_saves_filled_rows_after_days_sets(self):
+        data = {
+            "form-TOTAL_FORMS": 3, "form-INITIAL_FORMS": 0,
+            "form-0-exercise": self.exercises[1].id, "form-0-reps": 8, "form-0-weight": 135,
+            "form-2-exercise": self.exercises[2].id, "form-2-reps": 6, "form-2-weight": 60,
+        }
+        response = self.client.post(self.url, data)
+        self.assertRedirects(response, reverse("workout_log:index") + f"?selectedDate={self.date}")
+        self.assertEqual(self.get_days_sets(), [
+            (4, self.exercises[0].id, 5, 100),
+            (5, self.exercises[1].id, 8, 135),
+            (6, self.exercises[2].id, 6, 60),
+        ])
+
+    def test_form_with_invalid_row_saves_nothing(self):
+        data = {
+            "form-TOTAL_FORMS": 2, "form-INITIAL_FORMS": 0,
+            "form-0-exercise": self.exercises[1].id, "form-0-reps": 8, "form-0-weight": 135,
+            "form-1-exercise": self.exercises[2].id, "form-1-reps": 6,
+        }
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.get_days_sets()), 1)
+
+    def test_json(self):
+        response = self.client.post(self.url, self.get_json_body(2), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([(s["index"], s["reps"]) for s in response.json()["sets"]], [(5, 1), (6, 2)])
+        self.assertEqual(len(self.get_days_sets()), 3)
+
+    def test_json_with_unknown_exercise_saves_nothing(self):
+        body = json.dumps({"sets": [
+            {"exercise": self.exercises[0].id, "reps": 5, "weight": 100},
+            {"exercise": 0, "reps": 5, "weight": 100},
+        ]})
+        response = self.client.post(self.url, body, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()["errors"]), ["1"])
+        self.assertEqual(len(self.get_days_sets()), 1)
+
+    def test_json_with_too_many_sets(self):
+        response = self.client.post(self.url, self.get_json_body(MAX_WORKOUT_SETS + 1),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_queries_dont_grow_with_sets(self):
+        for num_sets in (1, MAX_WORKOUT_SETS):
+            self.assertQueryBudget(6 + LOCK_QUERIES, self.url, method="post",
+                                   data=self.get_json_body(num_sets),
+                                   status=201, content_type="application/json")
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Each Workout Log view makes a fixed number of queries for a user with
+    years of sets. A view that starts querying per set or per date goes over
+    its budget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_user()
+        cls.set = Set.objects.filter(logged_by=cls.user).latest("date", "index")
+        cls.date = cls.set.date
+        cls.date_args = [cls.date.year, cls.date.month, cls.date.day]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_index(self):
+        self.assertQueryBudget(3, reverse("workout_log:index") + f"?selectedDate={self.date}")
+
+    def test_new_set(self):
+        self.assertQueryBudget(3, reverse("workout_log:new_set", args=[0] + self.date_args))
+
+    def test_new_set_from_existing_set(self):
+        self.assertQueryBudget(5, reverse("workout_log:new_set", args=[self.set.id] + self.date_args))
+
+    def test_log_new_set(self):
+        data = {"exercise": self.set.exercise_id, "reps": 8, "weight": 135, "submit": ""}
+        self.assertQueryBudget(6 + LOCK_QUERIES, reverse("workout_log:new_set", args=[0] + self.date_args),
+                               method="post", data=data, status=302)
+
+    def test_log_workout_form(self):
+        self.assertQueryBudget(3, reverse("workout_log:log_workout", args=self.date_args))
+
+    def test_log_workout(self):
+        data = {"form-TOTAL_FORMS": 10, "form-INITIAL_FORMS": 0}
+        for i in range(10):
+            data.update({f"form-{i}-exercise": self.set.exercise_id, f"form-{i}-reps": 8,
+                         f"form-{i}-weight": 135})
+        self.assertQueryBudget(6 + LOCK_QUERIES, reverse("workout_log:log_workout", args=self.date_args),
+                               method="post", data=data, status=302)
+
+    def test_edit_set(self):
+        self.assertQueryBudget(6, reverse("workout_log:edit_set", args=[self.set.id]))
+
+    def test_save_edited_set(self):
+        data = {"exercise": self.set.exercise_id, "reps": 10, "weight": 140}
+        self.assertQueryBudget(6, reverse("workout_log:edit_set", args=[self.set.id]),
+                               method="post", data=data, status=302)
+
+    def test_delete_set(self):
+        self.assertQueryBudget(9 + LOCK_QUERIES, reverse("workout_log:delete_set", args=[self.set.id]),
+                               status=302)
+
+    def test_move_set(self):
+        self.assertQueryBudget(7 + LOCK_QUERIES, reverse("workout_log:move_set", args=[self.set.id]),
+                               method="post", data={"index": 0}, status=302)
+
+    def test_volume_form(self):
+        self.assertQueryBudget(2, reverse("workout_log:volume"))
+
+    def test_volume_over_years(self):
+        data = {"start_date": self.date - datetime.timedelta(days=365 * 2), "end_date": self.date}
+        self.assertQueryBudget(5, reverse("workout_log:volume"), method="post", data=data)
+
+    def test_journal(self):
+        self.assertQueryBudget(4, reverse("workout_log:journal"))
+
+    def test_journal_next_page(self):
+        url = reverse("workout_log:journal") + f"?before={self.date - datetime.timedelta(days=60)}&partial=1"
+        self.assertQueryBudget(4, url)
+
+    def test_charts(self):
+        self.assertQueryBudget(3, reverse("workout_log:charts"))
+
+    def test_charts_instance(self):
+        args = [self.user.id, self.set.exercise_id]
+        self.assertQueryBudget(3, reverse("workout_log:charts_instance", args=args))
+
+    def test_charts_data(self):
+        args = [self.user.id, self.set.exercise_id]
+        self.assertQueryBudget(4, reverse("workout_log:charts_data", args=args))
+
+
+class ChartDataCacheTests(TestCase):
+    """Progressive overload data is revalidated by ETag, and logging a set changes the ETag."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("lifter")
+        self.client.force_login(self.user)
+        self.exercise = Exercise.objects.order_by("id").first()
+        self.date = datetime.date(2023, 11, 1)
+        Set.objects.create(date=self.date, exercise=self.exercise, reps=5, weight=100,
+                           logged_by=self.user, index=0)
+        self.url = reverse("workout_log:charts_data", args=[self.user.id, self.exercise.id])
+
+    def test_logging_set_changes_etag(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Set.objects.create(date=self.date + datetime.timedelta(days=1), exercise=self.exercise, reps=5,
+                           weight=120, logged_by=self.user, index=0)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.json()["dates"]), 2)
+
+    def test_bulk_logging_and_deleting_sets_change_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.client.post(reverse("workout_log:log_workout", args=[2023, 11, 1]),
+                         json.dumps({"sets": [{"exercise": self.exercise.id, "reps": 3, "weight": 90}]}),
+                         content_type="application/json")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        delete_set_url = reverse("workout_log:delete_set", args=[Set.objects.latest("id").id])
+        self.client.get(delete_set_url)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AsyncViewTests(TestCase):
+    """The async views work under the async client, logged in or not."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("lifter")
+        cls.exercise = Exercise.objects.order_by("id").first()
+        cls.date = datetime.date(2023, 11, 1)
+        for index in range(2):
+            Set.objects.create(date=cls.date, exercise=cls.exercise, reps=5, weight=100,
+                               logged_by=cls.user, index=index)
+
+    def setUp(self):
+        self.async_client.force_login(self.user)
+
+    async def test_index(self):
+        response = await self.async_client.get(reverse("workout_log:index"), {"selectedDate": self.date})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s.index for s in response.context["sets"]], [0, 1])
+        self.assertContains(response, self.exercise.name)
+
+    async def test_journal(self):
+        response = await self.async_client.get(reverse("workout_log:journal"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["date_dict"]), [self.date])
+        response = await self.async_client.get(reverse("workout_log:journal"),
+                                               {"before": self.date, "partial": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["date_dict"]), [])
+        response = await self.async_client.get(reverse("workout_log:journal"), {"before": "soon"})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_volume(self):
+        response = await self.async_client.get(reverse("workout_log:volume"))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post(reverse("workout_log:volume"),
+                                                {"start_date": self.date, "end_date": self.date})
+        self.assertEqual(response.status_code, 200)
+        volume_dict = response.context["volume_dict"]
+        self.assertTrue(any(direct == 2 for _, direct, _ in volume_dict.values()))
+
+    async def test_logged_out(self):
+        client = AsyncClient()
+        for name in ["index", "journal", "volume"]:
+            with self.subTest(name):
+                url = reverse(f"workout_log:{name}")
+                response = await client.get(url)
+                self.assertRedirects(response, f"{reverse('users:login')}?next={url}", fetch_redirect_response=False)
+
+
+class VolumeTests(TestCase):
+    """Volume adds up direct and indirect sets per muscle."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("lifter")
+        other_user = User.objects.create_user("other")
+        cls.chest, cls.triceps, cls.delts = [Muscle.objects.create(name=f"Test {name}")
+                                             for name in ["chest", "triceps", "delts"]]
+        press = Exercise.objects.create(name="Test press", is_compound=True, equipment=Exercise.BARBELL)
+        pushdown = Exercise.objects.create(name="Test pushdown", is_compound=False, equipment=Exercise.CABLES)
+        for exercise, muscle, directly_targets in [
+            (press, cls.chest, True), (press, cls.triceps, False), (press, cls.delts, False),
+            (pushdown, cls.triceps, True),
+        ]:
+            MuscleWorked.objects.create(exercise=exercise, muscle=muscle, directly_targets=directly_targets)
+
+        cls.start = datetime.date(2023, 11, 1)
+        cls.end = datetime.date(2023, 11, 7)
+        # 3 presses and 2 pushdowns in range
+        sets = [(press, cls.start), (press, cls.start), (press, cls.end),
+                (pushdown, cls.start), (pushdown, cls.start + datetime.timedelta(days=3))]
+        for index, (exercise, date) in enumerate(sets):
+            Set.objects.create(date=date, exercise=exercise, reps=8, weight=100, logged_by=cls.user, index=index)
+        # Out of range, or someone else's
+        Set.objects.create(date=cls.end + datetime.timedelta(days=1), exercise=press, reps=8, weight=100,
+                           logged_by=cls.user, index=0)
+        Set.objects.create(date=cls.start, exercise=press, reps=8, weight=100, logged_by=other_user, index=0)
+
+    def test_volume(self):
+        volume_dict = calculate_volume(self.user, self.start, self.end)
+        self.assertEqual(volume_dict[self.chest.name], [3, 3, 0])
+        # 2 direct + 0.5 * 3 indirect
+        self.assertEqual(volume_dict[self.triceps.name], [3.5, 2, 3])
+        self.assertEqual(volume_dict[self.delts.name], [1.5, 0, 3])
+        self.assertIsInstance(volume_dict[self.chest.name][0], int)
+
+        # Every muscle is listed, in order, even without volume
+        self.assertEqual(list(volume_dict), list(Muscle.objects.order_by("name", "id")
+                                                  .values_list("name", flat=True)))
+        untouched = set(volume_dict) - {self.chest.name, self.triceps.name, self.delts.name}
+        self.assertTrue(untouched)
+        self.assertTrue(all(volume_dict[name] == [0, 0, 0] for name in untouched))
+
+    def test_volume_without_sets(self):
+        volume_dict = calculate_volume(self.user, self.end + datetime.timedelta(days=2),
+                                       self.end + datetime.timedelta(days=9))
+        self.assertTrue(all(volume == [0, 0, 0] for volume in volume_dict.values()))
+
+
+class JournalPaginationTests(TestCase):
+    """Paging through the journal shows every date once, with all of its sets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("lifter")
+        other_user = User.objects.create_user("other")
+        exercises = list(Exercise.objects.order_by("id")[:2])
+        start = datetime.date(2023, 11, 1)
+        # 7 dates with gaps between them, 1 to 4 sets each, across exercises
+        cls.set_counts = dict()
+        for day, num_sets in [(0, 3), (1, 1), (2, 4), (5, 2), (6, 3), (10, 1), (11, 2)]:
+            date = start + datetime.timedelta(days=day)
+            cls.set_counts[date] = num_sets
+            for index in range(num_sets):
+                Set.objects.create(date=date, exercise=exercises[index % 2], reps=5, weight=100,
+                                   logged_by=cls.user, index=index)
+        Set.objects.create(date=start + datetime.timedelta(days=3), exercise=exercises[0], reps=5,
+                           weight=100, logged_by=other_user, index=0)
+
+    def page_through(self, num_dates):
+        """Get every page's dates and sets, following next_before until the last page."""
+        pages = []
+        before = None
+        while True:
+            date_dict, before = get_journal_page(self.user, before, num_dates)
+            pages.append(date_dict)
+            if before is None:
+                return pages
+            self.assertLessEqual(len(pages), len(self.set_counts))
+
+    def test_every_date_once(self):
+        expected_dates = sorted(self.set_counts, reverse=True)
+        for num_dates in range(1, len(expected_dates) + 2):
+            with self.subTest(num_dates=num_dates):
+                pages = self.page_through(num_dates)
+                dates = [date for date_dict in pages for date in date_dict]
+                self.assertEqual(dates, expected_dates)
+                self.assertTrue(all(len(date_dict) <= num_dates for date_dict in pages))
+                for date_dict in pages:
+                    for date, exercise_dict in date_dict.items():
+                        sets = [s for exercise_sets in exercise_dict.values() for s in exercise_sets]
+                        self.assertEqual(len(sets), self.set_counts[date])
+                        self.assertTrue(all(s.date == date for s in sets))
+
+    def test_pages_split_on_a_date(self):
+        pages = self.page_through(3)
+        self.assertEqual([len(date_dict) for date_dict in pages], [3, 3, 1])
+        # Each page starts on the date right before the last date of the previous page
+        last_dates = [list(date_dict)[-1] for date_dict in pages]
+        for last_date, next_page in zip(last_dates, pages[1:]):
+            self.assertEqual(max(next_page), max(date for date in self.set_counts if date < last_date))
+
+    def test_no_sets(self):
+        self.assertEqual(get_journal_page(self.user, min(self.set_counts)), (dict(), None))
+
+
+class ProgressiveOverloadTests(TestCase):
+    """The chart data's per-date series match the sets they're calculated from."""
+
+    def test_series(self):
+        user = User.objects.create_user("lifter")
+        exercise, other_exercise = Exercise.objects.order_by("id")[:2]
+        day1 = datetime.date(2023, 11, 1)
+        day2 = datetime.date(2023, 11, 4)
+        for index, (date, reps, weight) in enumerate([(day2, 5, 100), (day1, 10, 50), (day1, 8, 60),
+                                                      (day2, 3, 120), (day2, 12, 40.5)]):
+            Set.objects.create(date=date, exercise=exercise, reps=reps, weight=weight,
+                               logged_by=user, index=index)
+        Set.objects.create(date=day1, exercise=other_exercise, reps=1, weight=500, logged_by=user, index=9)
+
+        data = get_progressive_overload(user.id, exercise.id)
+        self.assertEqual(data, {
+            "dates": ["2023-11-01", "2023-11-04"],
+            "num_sets": [2, 3],
+            "avg_weight_moved": [490.0, 448.7],  # (500 + 480) / 2, (500 + 360 + 486) / 3
+            "total_volume": [980.0, 1346.0],
+            "best_set": [500.0, 500.0],
+            "estimated_1rm": [76.0, 132.0],  # 60 x (1 + 8/30), 120 x (1 + 3/30)
+        })
+        self.assertEqual(get_progressive_overload(user.id, exercise.id + 10000)["dates"], [])
@@ -1,125 +1,258 @@
 """
 Views for the Workout Log app.
 """
+import asyncio
 import datetime
+from itertools import groupby
+import json
+from operator import attrgetter
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, redirect
-import plotly.graph_objects as go
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Sum
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+import numpy as np
 
-from commons.views import get_date_url, get_selected_date, verify_user_is_owner
-from .forms import SetForm, VolumeManagerForm
-from .models import Exercise, Muscle, MuscleWorked, Set
+from commons.charts import SETS, bump_data_version, chart_etag, get_cached_chart, get_data_version
+from commons.views import async_login_required, get_date_url, get_selected_date, verify_user_is_owner
+from .forms import MAX_WORKOUT_SETS, SetForm, VolumeManagerForm, WorkoutFormSet
+from . import ordering
+from .models import Set
+from .reference import EXERCISES, MUSCLE_MAP, MUSCLES
 
-EXERCISES = Exercise.objects.order_by("name")
-MUSCLES = Muscle.objects.order_by("name")
-MUSCLES_WORKED = MuscleWorked.objects.all()
+# Number of dates to show per page of the journal
+JOURNAL_DATES_PER_PAGE = 14
 
 
 def calculate_volume(user, start_date, end_date):
     """
     Get this user's volume (sets per muscle) from the given start date to the
     end date. Return as a dictionary.
+    Sets are counted per exercise by the database, then multiplied against
+    an exercise x muscle matrix of direct and indirect targets (built from
+    the cached muscle map, see reference.py):
+    - direct volume = sets of exercises that directly target the muscle
+    - indirect volume = sets of exercises that indirectly target the muscle
+    - composite volume = direct + 0.5 * indirect
     :param user:
     :param start_date:
     :param end_date:
     :return: volume_dict, maps muscles to [composite, direct, indirect volume]
     """
-    sets = (Set.objects.filter(logged_by=user)
-            .filter(date__gte=start_date)
-            .filter(date__lte=end_date))
+    set_counts = dict(get_set_counts(user, start_date, end_date))
+    return build_volume_dict(MUSCLES.get().all, MUSCLE_MAP.get(), set_counts)
+
+
+async def acalculate_volume(user, start_date, end_date):
+    """
+    Async version of calculate_volume. The reference data (usually already
+    loaded) and the set counts don't depend on each other, so they're awaited
+    together.
+    """
+    muscles, muscle_map, set_counts = await asyncio.gather(
+        sync_to_async(MUSCLES.get)(),
+        sync_to_async(MUSCLE_MAP.get)(),
+        aget_set_counts(user, start_date, end_date),
+    )
+    return build_volume_dict(muscles.all, muscle_map, set_counts)
+
+
+def get_set_counts(user, start_date, end_date):
+    """Get a queryset of (exercise id, number of sets) for this user's sets in this range."""
+    return (
+        Set.objects.filter(logged_by=user)
+        .filter(date__gte=start_date)
+        .filter(date__lte=end_date)
+        .values_list("exercise")
+        .annotate(num_sets=Count("id"))
+        .order_by()
+    )
+
+
+async def aget_set_counts(user, start_date, end_date):
+    """Get a dictionary that maps exercise ids to this user's number of sets in this range."""
+    return {exercise_id: num_sets
+            async for exercise_id, num_sets in get_set_counts(user, start_date, end_date)}
+
+
+def build_volume_dict(muscles, muscle_map, set_counts):
+    """
+    Build the volume dictionary of calculate_volume.
+    - muscles: list of muscles, in the order to show them
+    - muscle_map: MuscleMap (see reference.py)
+    - set_counts: dictionary that maps exercise ids to numbers of sets
+    """
+    # Rows: exercises the user did in this range. Columns: muscles.
+    muscle_cols = {muscle.id: col for col, muscle in enumerate(muscles)}
+    direct = np.zeros((len(set_counts), len(muscle_cols)))
+    indirect = np.zeros((len(set_counts), len(muscle_cols)))
+    for row, exercise_id in enumerate(set_counts):
+        for muscle_id, directly_targets in muscle_map.muscles_by_exercise.get(exercise_id, []):
+            matrix = direct if directly_targets else indirect
+            matrix[row, muscle_cols[muscle_id]] += 1
+
+    num_sets = np.array(list(set_counts.values()), dtype=float)
+    direct_volume = num_sets @ direct
+    indirect_volume = num_sets @ indirect
+    composite_volume = direct_volume + 0.5 * indirect_volume
+
     # Key: muscle
     # Value: 3-list [composite, direct, indirect volume]
-    volume_dict = {muscle.name: [0, 0, 0] for muscle in MUSCLES}
-    for set in sets:
-        muscles_worked = MUSCLES_WORKED.filter(exercise=set.exercise)
-        for muscle_worked in muscles_worked:
-            m = muscle_worked.muscle.name
-            if muscle_worked.directly_targets:
-                # update composite and direct volume
-                volume_dict[m][0] += 1
-                volume_dict[m][1] += 1
-            else:
-                # update composite and indirect volume
-                volume_dict[m][0] += 0.5
-                volume_dict[m][2] += 1
+    volume_dict = dict()
+    for col, muscle in enumerate(muscles):
+        composite = float(composite_volume[col])
+        # Composite volume is only fractional if there was indirect volume
+        if indirect_volume[col] == 0:
+            composite = int(composite)
+        volume_dict[muscle.name] = [composite, int(direct_volume[col]), int(indirect_volume[col])]
     return volume_dict
 
 
 @login_required()
 def charts(request):
     """Load a page where a user can select an exercise to view charts for"""
-    context = {'exercises': EXERCISES, 'user': request.user}
+    context = {'exercises': EXERCISES.get().all, 'user': request.user}
     return render(request, 'workout_log/charts.html', context)
 
 
 @login_required()
 def charts_instance(request, user_id, exercise_id):
-    """Load a chart page for the given exercise"""
-    exercise = EXERCISES.get(id=exercise_id)
-    sets = Set.objects.filter(logged_by=user_id).filter(exercise=exercise)
-    # dates: x-axis
-    dates = []
-    for s in sets:
-        date = s.date
-        if date not in dates:
-            dates.append(date)
-    dates.sort()
-
-    # return w/o creating a chart if the user hasn't logged any sets for this exercise
-    if len(dates) == 0:
-        context = {'exercise': exercise}
-        return render(request, 'workout_log/charts_instance.html', context)
-
-    # weights: y-axis
-    # hover_data: formatted strings that display the sets for that date
-    weights = []
-    hover_data = []
-    for date in dates:
-        sum_wt = 0
-        this_dates_sets = sets.filter(date=date)
-        sets_str = ""
-        for s in this_dates_sets:
-            reps = s.reps
-            wt = s.weight
-            wt_moved = reps * wt
-            sum_wt += wt_moved
-            sets_str += f"{wt_moved:.1f} ({reps}x{wt}), "
-        avg_wt = sum_wt / len(this_dates_sets)
-        weights.append(avg_wt)
-        hover_data.append(sets_str)
-
-    fig = go.Figure(go.Scatter(
-        x=dates,
-        y=weights,
-        hovertemplate='Date: %{x} <br>Weight: %{y:.1f} <br>Sets: %{text}',
-        text=[hover_data[i] for i in range(len(hover_data))]
-    ))
-    fig.update_layout(
-        title=dict(
-            text=f"{exercise} - Progressive Overload", 
-            font=dict(size=28)
-        ),
-        xaxis_title='Date',
-        yaxis_title='Average weight moved per set')
-    # file arg is relative to 'balance/'
-    fig.write_html(file=f"workout_log/templates/charts/{user_id}-{exercise_id}",
-                   include_plotlyjs='cdn')
-    # template_name arg is relative to 'balance/workout_log/templates/'
-    return render(request, f'charts/{user_id}-{exercise_id}')
+    """
+    Load a chart page for the given exercise. The page fetches its data from
+    charts_data and draws the chart in the browser.
+    """
+    verify_user_is_owner(user_id, request.user.id)
+    exercise = EXERCISES.get().by_id.get(exercise_id)
+    if exercise is None:
+        raise Http404
+    context = {'exercise': exercise, 'user_id': user_id}
+    return render(request, 'workout_log/charts_instance.html', context)
+
+
+def charts_data_etag(request, user_id, exercise_id):
+    """
+    ETag of the progressive overload data for this exercise. Changes when the
+    user's sets change, or the exercises change (ex: one gets renamed).
+    """
+    return chart_etag(
+        user_id, "progressive_overload", exercise_id,
+        get_data_version(user_id, SETS), EXERCISES.get_version(),
+    )
+
+
+@login_required()
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=charts_data_etag)
+def charts_data(request, user_id, exercise_id):
+    """Return the progressive overload series for the given exercise as JSON"""
+    verify_user_is_owner(user_id, request.user.id)
+    exercise = EXERCISES.get().by_id.get(exercise_id)
+    if exercise is None:
+        raise Http404
+
+    def build():
+        data = get_progressive_overload(user_id, exercise_id)
+        data['exercise'] = f"{exercise}"
+        return data
+
+    data = get_cached_chart(charts_data_etag(request, user_id, exercise_id), build)
+    return JsonResponse(data)
+
+
+def get_progressive_overload(user_id, exercise_id):
+    """
+    Get this user's progressive overload series for this exercise, one point
+    per date they did the exercise, calculated by one grouped query.
+    Return as a dictionary of parallel lists:
+    - dates: 'YYYY-MM-DD' strings, oldest first
+    - num_sets: sets done on each date
+    - avg_weight_moved: average weight moved (reps x weight) per set
+    - total_volume: total weight moved
+    - best_set: weight moved in the best set
+    - estimated_1rm: best estimated one rep max, using the Epley formula
+      weight x (1 + reps / 30)
+    """
+    weight_moved = F("reps") * F("weight")
+    rows = (Set.objects.filter(logged_by=user_id, exercise=exercise_id)
+            .values("date")
+            .annotate(
+                num_sets=Count("id"),
+                avg_weight_moved=Avg(weight_moved),
+                total_volume=Sum(weight_moved),
+                best_set=Max(weight_moved),
+                estimated_1rm=Max(F("weight") * (1 + F("reps") / 30.0)),
+            )
+            .order_by("date"))
+
+    data = {
+        'dates': [],
+        'num_sets': [],
+        'avg_weight_moved': [],
+        'total_volume': [],
+        'best_set': [],
+        'estimated_1rm': [],
+    }
+    for row in rows:
+        data['dates'].append(row['date'].isoformat())
+        data['num_sets'].append(row['num_sets'])
+        data['avg_weight_moved'].append(round(row['avg_weight_moved'], 1))
+        data['total_volume'].append(round(row['total_volume'], 1))
+        data['best_set'].append(round(row['best_set'], 1))
+        data['estimated_1rm'].append(round(row['estimated_1rm'], 1))
+    return data
 
 
 @login_required()
 def delete_set(request, set_id):
     """Delete this set"""
     set = Set.objects.get(id=set_id)
-    owner = set.logged_by
-    verify_user_is_owner(owner, request.user)
-    set.delete()
+    verify_user_is_owner(set.logged_by_id, request.user.id)
+    with transaction.atomic():
+        ordering.delete_set(set)
 
     url = get_date_url('workout_log:index', set.date)
     return redirect(url)
 
 
+@login_required()
+@require_POST
+def move_set(request, set_id):
+    """
+    Move a set to another position on its day. The new index is POSTed as
+    "index" (form data), or as JSON: {"index": 2}. Forms are redirected to
+    the set's day. JSON gets the day's set ids, in their new order.
+    """
+    set = get_object_or_404(Set, id=set_id)
+    verify_user_is_owner(set.logged_by_id, request.user.id)
+
+    if request.content_type == "application/json":
+        try:
+            index = json.loads(request.body)["index"]
+        except (ValueError, TypeError, KeyError):
+            index = None
+    else:
+        index = request.POST.get("index")
+    try:
+        index = int(index)
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("index must be a whole number")
+
+    with transaction.atomic():
+        ordering.move_set(set, index)
+    # update() doesn't send post_save, so bump the sets version here (see signals.py)
+    bump_data_version(request.user.id, SETS)
+
+    if request.content_type == "application/json":
+        day_sets = Set.objects.filter(logged_by=request.user, date=set.date).order_by("index", "id")
+        return JsonResponse({"date": set.date, "sets": list(day_sets.values_list("id", flat=True))})
+    url = get_date_url('workout_log:index', set.date)
+    return redirect(url)
+
+
 @login_required()
 def edit_set(request, set_id):
     """Load a page where a user can edit a set"""
@@ -140,11 +273,13 @@ def edit_set(request, set_id):
     return render(request, 'workout_log/edit_set.html', context)
 
 
-@login_required
-def index(request):
+@async_login_required
+async def index(request):
     """Load the Workout Log home page (Daily view)."""
     date = get_selected_date(request)
-    sets = Set.objects.filter(logged_by=request.user).filter(date=date)
+    sets = (Set.objects.filter(logged_by=request.user).filter(date=date)
+            .select_related("exercise").order_by("index", "id"))
+    sets = [s async for s in sets]
 
     context = {
         "date": date,
@@ -153,35 +288,191 @@ def index(request):
     return render(request, 'workout_log/index.html', context)
 
 
-@login_required()
-def journal(request):
-    """Load the Workout Log Journal page."""
-    sets = Set.objects.filter(logged_by=request.user).order_by("-date")
-    # keys = dates. values = dictionary that maps exercises to sets.
-    # ex:
-    # "Oct 16": {
-    #               "Squats": [set,set,set,set]
-    #               "Calf raises": [set,set,set]
-    #           }
-    # "Oct 15": {
-    #               "Bench press": [set,set,set]
-    #           }
+@async_login_required
+async def journal(request):
+    """
+    Load the Workout Log Journal page.
+    The journal is paginated by date, newest first. ?before=YYYY-MM-DD loads
+    the page of dates before that date. If ?partial=1 is also given, only the
+    entries are rendered, so the page can append them as the user scrolls.
+    """
+    before_str = request.GET.get("before")
+    before = None
+    if before_str:
+        try:
+            before = datetime.datetime.strptime(before_str, "%Y-%m-%d").date()
+        except ValueError:
+            raise Http404
+    date_dict, next_before = await aget_journal_page(request.user, before)
+
+    context = {'date_dict': date_dict, 'next_before': next_before}
+    if request.GET.get("partial"):
+        return render(request, 'workout_log/journal_entries.html', context)
+    return render(request, 'workout_log/journal.html', context)
+
+
+def get_journal_page(user, before=None, num_dates=JOURNAL_DATES_PER_PAGE):
+    """
+    Get one page of this user's journal: the sets from their most recent
+    num_dates dates that they logged sets on, before the given date (or
+    from the most recent date, if no date is given).
+    Costs two queries: one for the page's dates, one for the page's sets.
+    Return two things:
+        - date_dict: keys = dates. values = dictionary that maps exercises
+          to sets.
+          ex:
+          Oct 16: {
+                      Squats: [set,set,set,set]
+                      Calf raises: [set,set,set]
+                  }
+          Oct 15: {
+                      Bench press: [set,set,set]
+                  }
+        - the date to load the next page before, or None if this is the
+          last page
+    """
+    sets = get_journal_sets(user, before)
+
+    # Fetch one extra date to know if there's another page after this one
+    dates = list(get_journal_dates(sets, num_dates))
+    if len(dates) == 0:
+        return dict(), None
+    dates, next_before = paginate_journal_dates(dates, num_dates)
+    page_sets = get_journal_page_sets(sets, dates)
+    return group_sets_by_date(page_sets), next_before
+
+
+async def aget_journal_page(user, before=None, num_dates=JOURNAL_DATES_PER_PAGE):
+    """
+    Async version of get_journal_page. Its second query needs the results of
+    the first, so they still run one after the other.
+    """
+    sets = get_journal_sets(user, before)
+    dates = [date async for date in get_journal_dates(sets, num_dates)]
+    if len(dates) == 0:
+        return dict(), None
+    dates, next_before = paginate_journal_dates(dates, num_dates)
+    page_sets = [s async for s in get_journal_page_sets(sets, dates)]
+    return group_sets_by_date(page_sets), next_before
+
+
+def get_journal_sets(user, before):
+    """Get a queryset of the user's sets before this date (or all of them, if it's None)."""
+    sets = Set.objects.filter(logged_by=user)
+    if before is not None:
+        sets = sets.filter(date__lt=before)
+    return sets
+
+
+def get_journal_dates(sets, num_dates):
+    """Get a queryset of the num_dates + 1 most recent dates of these sets."""
+    return sets.values_list("date", flat=True).distinct().order_by("-date")[:num_dates + 1]
+
+
+def paginate_journal_dates(dates, num_dates):
+    """
+    Split the dates from get_journal_dates into the page's dates and the date
+    to load the next page before (None if this is the last page).
+    """
+    if len(dates) > num_dates:
+        return dates[:num_dates], dates[num_dates - 1]
+    return dates, None
+
+
+def get_journal_page_sets(sets, dates):
+    """Get a queryset of the sets on the page's dates, in the order the journal shows them."""
+    return (sets.filter(date__gte=dates[-1])
+            .select_related("exercise")
+            .order_by("-date", "index", "id"))
+
+
+def group_sets_by_date(page_sets):
+    """Group a page's sets into get_journal_page's date_dict."""
     date_dict = dict()
-    for s in sets:
-        date = s.date
-        if date not in date_dict.keys():
-            date_dict[f"{date}"] = dict()
-    for s in sets:
-        date = s.date
-        exercise = s.exercise
-        exercise_dict = date_dict[f"{date}"]
-        if exercise.__str__() not in exercise_dict.keys():
-            exercise_dict[f"{exercise}"] = [s]
-        else:
-            exercise_dict[f"{exercise}"].append(s)
+    for date, days_sets in groupby(page_sets, key=attrgetter("date")):
+        exercise_dict = date_dict[date] = dict()
+        for s in days_sets:
+            exercise_dict.setdefault(s.exercise, []).append(s)
+    return date_dict
 
-    context = {'sets': sets, 'date_dict': date_dict}
-    return render(request, 'workout_log/journal.html', context)
+
+@login_required()
+def log_workout(request, year, month, day):
+    """
+    Load a page where a user can log a whole workout (up to MAX_WORKOUT_SETS
+    sets) and save it at once. The sets go after the sets already logged on
+    this date, in the order they were entered.
+    The sets can also be POSTed as JSON (Content-Type: application/json, with
+    the CSRF token in an X-CSRFToken header):
+        {"sets": [{"exercise": 12, "reps": 8, "weight": 135}, ...]}
+    The response is the saved sets, or the errors of each invalid set (and
+    nothing is saved).
+    """
+    dt = datetime.date(year, month, day)
+    if request.method == "POST" and request.content_type == "application/json":
+        return log_workout_json(request, dt)
+
+    if request.method == "POST":
+        formset = WorkoutFormSet(data=request.POST)
+        if formset.is_valid():
+            sets = [form.save(commit=False) for form in formset if form.has_changed()]
+            save_workout(request.user, dt, sets)
+            url = get_date_url('workout_log:index', dt)
+            return redirect(url)
+    else:
+        formset = WorkoutFormSet()
+    context = {'formset': formset, 'date': dt}
+    return render(request, 'workout_log/log_workout.html', context)
+
+
+def log_workout_json(request, date):
+    """Save the sets of a workout POSTed as JSON (see log_workout)."""
+    try:
+        entries = json.loads(request.body)["sets"]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"error": 'Expected a JSON object with a list of "sets"'}, status=400)
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        return JsonResponse({"error": '"sets" must be a list of objects'}, status=400)
+    if len(entries) > MAX_WORKOUT_SETS:
+        return JsonResponse({"error": f"A workout can't have more than {MAX_WORKOUT_SETS} sets"},
+                            status=400)
+
+    # Sets are validated with the same form as the Log a Workout page
+    forms = [SetForm(data=entry) for entry in entries]
+    errors = {i: form.errors.get_json_data() for i, form in enumerate(forms) if not form.is_valid()}
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+
+    sets = save_workout(request.user, date, [form.save(commit=False) for form in forms])
+    data = {
+        "date": date,
+        "sets": [
+            {"id": s.id, "index": s.index, "exercise": s.exercise_id, "reps": s.reps, "weight": s.weight}
+            for s in sets
+        ],
+    }
+    return JsonResponse(data, status=201)
+
+
+def save_workout(user, date, sets):
+    """
+    Save a workout's sets (unsaved Sets, in order) for this user on this
+    date, after the sets they already logged that day. Costs two queries in
+    one transaction: one to allocate the sets' indexes, one insert for all
+    the sets. Return the saved sets.
+    """
+    if len(sets) == 0:
+        return sets
+    with transaction.atomic():
+        next_index = ordering.allocate_set_indexes(user, date, len(sets))
+        for index, s in enumerate(sets, start=next_index):
+            s.logged_by = user
+            s.date = date
+            s.index = index
+        Set.objects.bulk_create(sets)
+    # bulk_create doesn't send post_save, so bump the sets version here (see signals.py)
+    bump_data_version(user.id, SETS)
+    return sets
 
 
 @login_required()
@@ -217,10 +508,10 @@ def new_set(request, set_id, year, month, day):
             this_set = form.save(commit=False)
             this_set.logged_by = request.user
             this_set.date = dt
-            sets = Set.objects.filter(logged_by=request.user).filter(date=dt)
             # insert set behind all existing sets on this date by default
-            this_set.index = len(sets)
-            this_set.save()
+            with transaction.atomic():
+                this_set.index = ordering.allocate_set_indexes(request.user, dt)
+                this_set.save()
 
             # if the user hits submit, redirect to workout log.
             # if user hits submit + log again, this block is skipped
@@ -232,8 +523,8 @@ def new_set(request, set_id, year, month, day):
     return render(request, 'workout_log/new_set.html', context)
 
 
-@login_required()
-def volume(request):
+@async_login_required
+async def volume(request):
     """Load the Volume Manager page"""
     # TODO maybe this can be changed to GET, since it isn't updating the
     #  state the of the database.
@@ -242,7 +533,7 @@ def volume(request):
         if form.is_valid():
             start_date = form.cleaned_data["start_date"]
             end_date = form.cleaned_data["end_date"]
-            volume_dict = calculate_volume(request.user, start_date, end_date)
+            volume_dict = await acalculate_volume(request.user, start_date, end_date)
             context = {
                 'form': form,
                 'start_date': start_date,